@@ -0,0 +1,165 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from faiss_utils import get_resident_generation
+
+
+class AnswerCache:
+    """
+    Semantic cache of generated answers, keyed by query embedding.
+
+    Decoding is greedy, so a query that embeds almost identically to a cached
+    one and retrieves the same chunks produces the same answer. Entries are
+    evicted LRU-first once max_size is reached, or when older than ttl seconds.
+    Every entry is stamped with the index generation it was computed against;
+    when ingestion publishes a new generation the whole cache is dropped, and
+    answers computed against an older one are neither served nor stored.
+
+    Args:
+        current_generation (Callable, optional): Returns the generation now being
+            served. Without it, the generation of the latest lookup is taken as current.
+    """
+
+    def __init__(self, threshold=0.95, max_size=1024, ttl=3600, current_generation=None):
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl = ttl
+        self._current_generation = current_generation
+
+        self._entries = OrderedDict()
+        self._next_key = 0
+        self._generation = None
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.stale_stores = 0
+
+    @staticmethod
+    def _normalize(embedding):
+        embedding = np.asarray(embedding, dtype="float32").reshape(-1)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm > 0 else embedding
+
+    def _check_generation(self, generation, adopt):
+        """Drop entries from older generations; return whether generation is the current one. Caller holds the lock."""
+        if self._current_generation is not None:
+            current = self._current_generation()
+        else:
+            current = generation if adopt else self._generation
+        if current != self._generation:
+            if self._entries:
+                self.invalidations += len(self._entries)
+                self._entries.clear()
+            self._generation = current
+        return generation == current
+
+    def _expire(self, now):
+        # Caller holds the lock
+        expired = [key for key, entry in self._entries.items() if now - entry["created_at"] > self.ttl]
+        for key in expired:
+            del self._entries[key]
+        self.evictions += len(expired)
+
+    def lookup(self, query_embedding, chunk_ids, generation):
+        """
+        Return a cached answer for a similar query with the same retrieved chunks.
+
+        Args:
+            query_embedding (np.ndarray): Embedding of the incoming query.
+            chunk_ids (Iterable[int]): FAISS ids retrieved for the query.
+            generation: Generation of the index the chunks were retrieved from.
+
+        Returns:
+            str or None: The cached answer, or None on a miss.
+        """
+        query = self._normalize(query_embedding)
+        chunk_ids = frozenset(chunk_ids)
+
+        with self._lock:
+            if not self._check_generation(generation, adopt=True):
+                self.misses += 1
+                return None
+            self._expire(time.monotonic())
+
+            best_key, best_score = None, self.threshold
+            for key, entry in self._entries.items():
+                if entry["chunk_ids"] != chunk_ids:
+                    continue
+                score = float(np.dot(query, entry["embedding"]))
+                if score >= best_score:
+                    best_key, best_score = key, score
+
+            if best_key is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            return self._entries[best_key]["answer"]
+
+    def store(self, query_embedding, chunk_ids, generation, answer):
+        """
+        Cache a generated answer, unless the index has moved to a new generation since retrieval.
+
+        Args:
+            query_embedding (np.ndarray): Embedding of the query.
+            chunk_ids (Iterable[int]): FAISS ids the answer was generated from.
+            generation: Generation of the index the chunks were retrieved from.
+            answer (str): The generated answer.
+        """
+        with self._lock:
+            if not self._check_generation(generation, adopt=False):
+                # Retrieved from an index that has since been replaced
+                self.stale_stores += 1
+                return
+
+            self._entries[self._next_key] = {
+                "embedding": self._normalize(query_embedding),
+                "chunk_ids": frozenset(chunk_ids),
+                "answer": answer,
+                "created_at": time.monotonic(),
+            }
+            self._next_key += 1
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every cached answer."""
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self):
+        """Return hit/miss/eviction counters for threshold tuning."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "threshold": self.threshold,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "stale_stores": self.stale_stores,
+            }
+
+
+# Process-wide cache used by get_response
+answer_cache = AnswerCache(
+    threshold=float(os.environ.get("ANSWER_CACHE_THRESHOLD", 0.95)),
+    max_size=int(os.environ.get("ANSWER_CACHE_SIZE", 1024)),
+    ttl=float(os.environ.get("ANSWER_CACHE_TTL", 3600)),
+    current_generation=get_resident_generation,
+)
@@ -0,0 +1,120 @@
+"""
+Chunk counts, encoder truncation and throughput: token chunker vs character splitter.
+
+Splits the same documents with the LangChain RecursiveCharacterTextSplitter
+(1000 characters, 100 overlap, as ingestion used to) and with
+token_chunker.token_chunk_spans, then counts every chunk with the embedding
+tokenizer to report how many chunks exceed the encoder's sequence limit and
+what share of chunk tokens the encoder never sees. Documents are *.html /
+*.txt files from --pages-dir, otherwise synthetic prose.
+
+Usage:
+    python bench_chunking.py --pages-dir pages/
+    python bench_chunking.py --num-docs 200 --overlap-tokens 16 32
+"""
+import argparse
+import glob
+import os
+import random
+import statistics
+import time
+
+from text_utils import chunk_text
+from token_chunker import (
+    CHUNK_OVERLAP_TOKENS, CHUNK_TOKENS, chunk_token_limit, get_chunk_tokenizer, token_chunk_spans,
+)
+
+
+def load_documents(pages_dir, num_docs, seed=0):
+    """Extracted text of saved pages, or random sentences of page-like lengths."""
+    documents = []
+    if pages_dir:
+        from get_data import extract_text_from_html
+
+        for path in sorted(glob.glob(os.path.join(pages_dir, "*.html")) + glob.glob(os.path.join(pages_dir, "*.txt"))):
+            with open(path, encoding="utf-8", errors="replace") as f:
+                raw = f.read()
+            text = extract_text_from_html(raw) if path.endswith(".html") else raw
+            if text.strip():
+                documents.append(text)
+    if documents:
+        return documents
+
+    rng = random.Random(seed)
+    words = ("retrieval index vector model query chunk token latency memory attention encoder batch "
+             "quantization throughput transformer embedding similarity neighbour segment").split()
+
+    def sentence():
+        return " ".join(rng.choice(words) for _ in range(rng.randint(6, 30))).capitalize() + "."
+
+    return [
+        "\n\n".join(" ".join(sentence() for _ in range(rng.randint(2, 8))) for _ in range(rng.randint(5, 60)))
+        for _ in range(num_docs)
+    ]
+
+
+def run_splitter(name, split, documents, tokenizer, limit):
+    """Time split() over all documents, then measure its chunks against the encoder limit."""
+    start = time.perf_counter()
+    chunked = [split(doc) for doc in documents]
+    seconds = time.perf_counter() - start
+
+    chunks = [chunk for doc_chunks in chunked for chunk in doc_chunks]
+    counts = [len(ids) for ids in tokenizer(chunks, add_special_tokens=False, verbose=False)["input_ids"]] if chunks else []
+    truncated = [count for count in counts if count > limit]
+    total_tokens = sum(counts)
+    dropped = sum(count - limit for count in truncated)
+    megabytes = sum(len(doc.encode("utf-8")) for doc in documents) / 1e6
+
+    return {
+        "splitter": name,
+        "chunks": len(chunks),
+        "chunks_per_doc": len(chunks) / max(len(documents), 1),
+        "mean_tokens": statistics.mean(counts) if counts else 0.0,
+        "max_tokens": max(counts, default=0),
+        "truncated_pct": 100.0 * len(truncated) / max(len(counts), 1),
+        "dropped_tokens_pct": 100.0 * dropped / max(total_tokens, 1),
+        "mb_per_sec": megabytes / max(seconds, 1e-9),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages-dir", default=None, help="Directory of saved *.html / *.txt documents")
+    parser.add_argument("--num-docs", type=int, default=100, help="Synthetic documents when no pages are given")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Character splitter chunk size")
+    parser.add_argument("--chunk-overlap", type=int, default=100, help="Character splitter overlap")
+    parser.add_argument("--max-tokens", type=int, default=CHUNK_TOKENS, help="Token chunk size (0: encoder limit)")
+    parser.add_argument("--overlap-tokens", nargs="+", type=int, default=[CHUNK_OVERLAP_TOKENS])
+    args = parser.parse_args()
+
+    documents = load_documents(args.pages_dir, args.num_docs)
+    tokenizer = get_chunk_tokenizer()
+    limit = chunk_token_limit(tokenizer)
+    print(f"📄 {len(documents)} documents, {sum(map(len, documents)) / 1e6:.2f}M chars; encoder reads {limit} content tokens")
+
+    # Load the splitter (and LangChain) outside the timed region
+    chunk_text("warm up", chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap)
+    token_chunk_spans("warm up", tokenizer=tokenizer)
+
+    results = [run_splitter(
+        f"chars {args.chunk_size}/{args.chunk_overlap}",
+        lambda doc: chunk_text(doc, chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap),
+        documents, tokenizer, limit,
+    )]
+    for overlap in args.overlap_tokens:
+        results.append(run_splitter(
+            f"tokens {args.max_tokens or limit}/{overlap}",
+            lambda doc: [doc[s.start:s.end] for s in token_chunk_spans(doc, args.max_tokens, overlap, tokenizer)],
+            documents, tokenizer, limit,
+        ))
+
+    print(f"\n{'splitter':<18} {'chunks':>7} {'per doc':>8} {'tokens':>7} {'max':>5} "
+          f"{'truncated':>10} {'tokens lost':>12} {'MB/s':>7}")
+    for r in results:
+        print(f"{r['splitter']:<18} {r['chunks']:>7} {r['chunks_per_doc']:>8.1f} {r['mean_tokens']:>7.1f} "
+              f"{r['max_tokens']:>5} {r['truncated_pct']:>9.1f}% {r['dropped_tokens_pct']:>11.1f}% {r['mb_per_sec']:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Parity check and CPU throughput benchmark for the embedding backends.
+
+Embeds the same texts with the PyTorch SentenceTransformer and the ONNX
+Runtime backend (int8 and, optionally, fp32), reports cosine similarity of
+each ONNX vector to its PyTorch counterpart, and texts/second per backend.
+Texts come from the chunks table when it has any, otherwise synthetic ones.
+
+Usage:
+    python bench_embeddings.py --num-texts 2000 --batch-size 32
+    python bench_embeddings.py --threads 1 2 4 8 --min-cosine 0.99
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+from onnx_embedder import CONFIG_FILE, ONNX_MODEL_DIR, OnnxEmbedder, export_onnx_model
+from text_utils import EMBEDDING_MODEL_NAME
+
+
+def load_texts(num_texts, seed=0):
+    """Chunks from SQLite if there are any, otherwise random word soup of chunk-like lengths."""
+    try:
+        from data.data_utils import read_connection
+
+        with read_connection() as connection:
+            rows = connection.execute("SELECT text FROM chunks LIMIT ?", (num_texts,)).fetchall()
+        texts = [row[0] for row in rows]
+    except Exception:
+        texts = []
+
+    if texts:
+        return (texts * (num_texts // len(texts) + 1))[:num_texts]
+
+    rng = random.Random(seed)
+    words = "retrieval index vector model query chunk token latency memory attention encoder batch".split()
+    return [" ".join(rng.choice(words) for _ in range(rng.randint(5, 200))) for _ in range(num_texts)]
+
+
+def throughput(encode, texts, batch_size, repeats=2):
+    """Best-of-repeats texts/second."""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        encode(texts, batch_size)
+        best = min(best, time.perf_counter() - start)
+    return len(texts) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--num-texts", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threads", nargs="+", type=int, default=[os.cpu_count() or 1])
+    parser.add_argument("--model-dir", default=ONNX_MODEL_DIR)
+    parser.add_argument("--fp32", action="store_true", help="Also benchmark the unquantized ONNX model")
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    args = parser.parse_args()
+
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    if not os.path.exists(os.path.join(args.model_dir, CONFIG_FILE)):
+        export_onnx_model(EMBEDDING_MODEL_NAME, args.model_dir)
+
+    texts = load_texts(args.num_texts)
+    print(f"📄 {len(texts)} texts, batch size {args.batch_size}")
+
+    st_model = SentenceTransformer(EMBEDDING_MODEL_NAME, device="cpu")
+    reference = st_model.encode(texts, batch_size=args.batch_size, convert_to_numpy=True)
+    reference /= np.linalg.norm(reference, axis=1, keepdims=True)
+
+    variants = [("onnx-int8", True)] + ([("onnx-fp32", False)] if args.fp32 else [])
+
+    # 1. Parity against PyTorch
+    passed = True
+    for name, quantized in variants:
+        embedder = OnnxEmbedder(args.model_dir, quantized=quantized)
+        vectors = embedder.encode(texts, batch_size=args.batch_size)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        cosine = (vectors * reference).sum(axis=1)
+        ok = cosine.min() >= args.min_cosine
+        passed &= ok
+        print(f"{'✅' if ok else '❌'} {name:<10} cosine vs torch: min {cosine.min():.4f}  "
+              f"mean {cosine.mean():.4f}  p1 {np.percentile(cosine, 1):.4f}")
+
+    # 2. Throughput per backend and thread count
+    print(f"\n{'backend':<10} {'threads':>7} {'texts/s':>9}")
+    for threads in args.threads:
+        torch.set_num_threads(threads)
+        rate = throughput(lambda t, b: st_model.encode(t, batch_size=b), texts, args.batch_size)
+        print(f"{'torch':<10} {threads:>7} {rate:>9.1f}")
+        for name, quantized in variants:
+            embedder = OnnxEmbedder(args.model_dir, intra_op_threads=threads, quantized=quantized)
+            rate = throughput(lambda t, b: embedder.encode(t, batch_size=b), texts, args.batch_size)
+            print(f"{name:<10} {threads:>7} {rate:>9.1f}")
+
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
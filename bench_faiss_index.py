@@ -0,0 +1,133 @@
+"""
+Measure recall@k and latency of approximate FAISS indexes against the exact flat index.
+
+Rebuilds every requested index type from the vectors stored in an existing
+index file or segment store, sweeps nprobe / efSearch, and prints a table so
+settings can be chosen with evidence. Optionally rebuilds the live index with
+a chosen type (for a segment store: compacts all segments into one).
+
+Usage:
+    python bench_faiss_index.py --index faiss_segments --top-k 5
+    python bench_faiss_index.py --types hnsw --ef-search 16 32 64 128
+    python bench_faiss_index.py --rebuild auto --memory-budget-mb 512
+"""
+import argparse
+import time
+
+import numpy as np
+
+from faiss_utils import (
+    INDEX_TYPES, build_faiss_index, get_index_contents, load_faiss_index,
+    save_faiss_index, search_faiss_index_batch, set_search_params, choose_index_type,
+)
+from faiss_segments import compact_segments, is_segment_store, load_segmented_index
+
+
+def load_vectors(path, dimension):
+    """Return (vectors, ids) stored in an index file or across all segments of a store."""
+    if not is_segment_store(path):
+        return get_index_contents(load_faiss_index(path, dimension=dimension))
+
+    index, _ = load_segmented_index(path, dimension=dimension)
+    parts = [get_index_contents(segment) for segment in index.segments.values()]
+    if not parts:
+        return np.zeros((0, dimension), dtype='float32'), np.zeros(0, dtype='int64')
+    return np.concatenate([v for v, _ in parts]), np.concatenate([i for _, i in parts])
+
+
+def recall_at_k(exact_results, approx_results, top_k):
+    """Fraction of the exact top-k ids that the approximate search also returned."""
+    found = 0
+    total = 0
+    for exact, approx in zip(exact_results, approx_results):
+        exact_ids = {i for i, _ in exact[:top_k]}
+        approx_ids = {i for i, _ in approx[:top_k]}
+        found += len(exact_ids & approx_ids)
+        total += len(exact_ids)
+    return found / total if total else 1.0
+
+
+def time_searches(index, queries, top_k):
+    """Run one query at a time (like /query) and return results and per-query latencies in ms."""
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.extend(search_faiss_index_batch(index, query[None, :], top_k=top_k))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return results, np.array(latencies)
+
+
+def evaluate_index(index, exact_index, queries, top_k=5):
+    """
+    Compare an index against the exact flat index on the same queries.
+
+    Returns:
+        Dict: recall@k and p50/p95 latency in milliseconds.
+    """
+    exact_results = search_faiss_index_batch(exact_index, queries, top_k=top_k)
+    approx_results, latencies = time_searches(index, queries, top_k)
+    return {
+        "recall": recall_at_k(exact_results, approx_results, top_k),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index", default="faiss_segments")
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--types", nargs="+", default=list(INDEX_TYPES), choices=INDEX_TYPES)
+    parser.add_argument("--nprobe", nargs="+", type=int, default=[1, 4, 16, 64])
+    parser.add_argument("--ef-search", nargs="+", type=int, default=[16, 32, 64, 128])
+    parser.add_argument("--memory-budget-mb", type=float, default=None)
+    parser.add_argument("--rebuild", default=None, choices=list(INDEX_TYPES) + ["auto"],
+                        help="Rebuild the index file with this type after reporting")
+    args = parser.parse_args()
+
+    vectors, ids = load_vectors(args.index, args.dimension)
+    if len(vectors) == 0:
+        print("⚠️ Index is empty, nothing to evaluate.")
+        return
+    print(f"📦 {len(vectors)} vectors; auto would choose "
+          f"'{choose_index_type(len(vectors), args.dimension, args.memory_budget_mb)}'")
+
+    # Queries: stored vectors with a little noise, so they are not exact self-matches
+    rng = np.random.default_rng(0)
+    picks = rng.choice(len(vectors), min(args.num_queries, len(vectors)), replace=False)
+    queries = vectors[picks] + rng.normal(0, 0.01, (len(picks), vectors.shape[1])).astype('float32')
+
+    exact_index = build_faiss_index(vectors, ids, dimension=args.dimension, index_type="flat")
+
+    print(f"\n{'type':<10}{'param':<16}{'recall@' + str(args.top_k):<12}{'p50 ms':<10}{'p95 ms':<10}")
+    for index_type in args.types:
+        index = build_faiss_index(vectors, ids, dimension=args.dimension, index_type=index_type)
+        if index_type.startswith("ivf"):
+            sweep = [("nprobe", n) for n in args.nprobe]
+        elif index_type == "hnsw":
+            sweep = [("efSearch", ef) for ef in args.ef_search]
+        else:
+            sweep = [("-", None)]
+
+        for name, value in sweep:
+            if name == "nprobe":
+                set_search_params(index, nprobe=value)
+            elif name == "efSearch":
+                set_search_params(index, ef_search=value)
+            stats = evaluate_index(index, exact_index, queries, top_k=args.top_k)
+            param = f"{name}={value}" if value is not None else "exact"
+            print(f"{index_type:<10}{param:<16}{stats['recall']:<12.3f}{stats['p50_ms']:<10.3f}{stats['p95_ms']:<10.3f}")
+
+    if args.rebuild and is_segment_store(args.index):
+        compact_segments(args.index, dimension=args.dimension, small_segment_size=float("inf"),
+                         min_segments=1, index_type=args.rebuild)
+    elif args.rebuild:
+        index = build_faiss_index(vectors, ids, dimension=args.dimension, index_type=args.rebuild,
+                                  memory_budget_mb=args.memory_budget_mb)
+        save_faiss_index(index, args.index)
+
+
+if __name__ == "__main__":
+    main()
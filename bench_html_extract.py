@@ -0,0 +1,113 @@
+"""
+Equivalence check and per-page speed of the streaming HTML extractor vs BeautifulSoup.
+
+Runs extract_text_from_html (html_text.py) and the BeautifulSoup reference on
+every saved page in --pages-dir plus a set of built-in edge cases, reports any
+page where the outputs differ, and prints per-page timings.
+
+Usage:
+    python bench_html_extract.py --pages-dir pages/
+    python bench_html_extract.py --pages-dir pages/ --fetch https://example.com/a https://example.com/b
+"""
+import argparse
+import glob
+import hashlib
+import os
+import statistics
+import sys
+import time
+
+from get_data import extract_text_from_html, extract_text_from_html_soup
+
+EDGE_CASES = {
+    "nested-skip": "<div>keep<nav>drop<script>x</script>drop</nav>keep2</div>",
+    "unclosed-skip": "<p>before<header>dropped<p>still dropped</p>",
+    "stray-end-tags": "<div>a</span>b</p></div>c</nav>d",
+    "implicit-close": "<div><nav><b>drop</div>after",
+    "void-and-selfclose": "a<br>b</br>c<br/>d<img src=x>e<script/>f<iframe/>g</img>h",
+    "entities": "<p>AT&amp;T &copy; 2024&nbsp;&#8212;&#x41;&#150; 5 &lt; 6 &unknown; &amp &#0; &#x110000;</p>",
+    "comments-doctype": "<!DOCTYPE html><!-- hidden --><p>x<!-- c -->y</p><?pi data?>",
+    "cdata": "<div><![CDATA[ raw text ]]></div><![if !IE]>decl<![endif]>",
+    "script-markup": "<script>if (a < b) { document.write('<p>no</p>') }</script>shown",
+    "style-noscript": "<style>p { color: red }</style><noscript><p>enable js</p></noscript>text",
+    "whitespace": "  <p>\n  many\t\tspaces   here </p>\n<pre>  kept\n  lines </pre>  ",
+    "upper-case": "<DIV>A<SCRIPT>b</SCRIPT><Footer>c</FOOTER>D</DIV>",
+    "empty": "",
+}
+
+
+def fetch_pages(urls, pages_dir):
+    """Save each URL's HTML under pages_dir for a reproducible corpus."""
+    from get_data import fetch_html
+
+    os.makedirs(pages_dir, exist_ok=True)
+    for url in urls:
+        html = fetch_html(url)
+        if not html:
+            print(f"⚠️ Could not fetch {url}")
+            continue
+        name = hashlib.sha1(url.encode("utf-8")).hexdigest()[:12] + ".html"
+        with open(os.path.join(pages_dir, name), "w", encoding="utf-8") as f:
+            f.write(html)
+        print(f"💾 Saved {url} -> {name}")
+
+
+def load_pages(pages_dir):
+    pages = dict(EDGE_CASES)
+    if pages_dir:
+        for path in sorted(glob.glob(os.path.join(pages_dir, "*.html"))):
+            with open(path, encoding="utf-8", errors="replace") as f:
+                pages[os.path.basename(path)] = f.read()
+    return pages
+
+
+def timed(fn, html, repeats):
+    """Median seconds of fn(html), and its output."""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        text = fn(html)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), text
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages-dir", default=None, help="Directory of saved *.html pages")
+    parser.add_argument("--fetch", nargs="*", default=[], help="URLs to save into --pages-dir first")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.fetch:
+        fetch_pages(args.fetch, args.pages_dir or "pages")
+        args.pages_dir = args.pages_dir or "pages"
+
+    pages = load_pages(args.pages_dir)
+    mismatches = 0
+    total_soup = total_stream = 0.0
+
+    print(f"{'page':<28} {'KB':>8} {'soup ms':>9} {'stream ms':>10} {'speedup':>8}  equal")
+    for name, html in pages.items():
+        soup_s, expected = timed(extract_text_from_html_soup, html, args.repeats)
+        stream_s, actual = timed(extract_text_from_html, html, args.repeats)
+        total_soup += soup_s
+        total_stream += stream_s
+
+        equal = expected == actual
+        mismatches += not equal
+        speedup = soup_s / stream_s if stream_s else float("inf")
+        print(f"{name[:28]:<28} {len(html) / 1024:>8.1f} {soup_s * 1000:>9.2f} {stream_s * 1000:>10.2f} "
+              f"{speedup:>7.1f}x  {'✅' if equal else '❌'}")
+        if not equal:
+            at = next((i for i, (a, b) in enumerate(zip(expected, actual)) if a != b), min(len(expected), len(actual)))
+            print(f"    soup:   ...{expected[max(0, at - 40):at + 40]!r}")
+            print(f"    stream: ...{actual[max(0, at - 40):at + 40]!r}")
+
+    print(f"\n{len(pages) - mismatches}/{len(pages)} pages identical; "
+          f"total {total_soup * 1000:.1f} ms soup vs {total_stream * 1000:.1f} ms stream "
+          f"({total_soup / max(total_stream, 1e-9):.1f}x)")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
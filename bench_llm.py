@@ -0,0 +1,64 @@
+"""
+Time-to-first-token and tokens/second of an LLM backend.
+
+Sends RAG-style prompts through the backend chosen with --backend (or
+LLM_BACKEND), with the given concurrency, and prints the backend's metrics.
+
+Usage:
+    python bench_llm.py --backend cpu --requests 8 --concurrency 4 --max-new-tokens 64
+    LLM_CPU_PRECISION=bf16 LLM_CPU_AFFINITY=0-15 python bench_llm.py --backend cpu
+    python bench_llm.py --backend stub --requests 200 --concurrency 32
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from llm_backends import BACKENDS, LLM_BACKEND, load_backend
+from prompts import system_prompt
+
+QUESTIONS = [
+    "What is a DaViT architecture?",
+    "How does retrieval-augmented generation reduce hallucinations?",
+    "Summarise the difference between IVF and HNSW indexes.",
+    "Why would a chunk overlap be used when splitting documents?",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", default=LLM_BACKEND, choices=BACKENDS)
+    parser.add_argument("--requests", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    backend = load_backend(args.backend, max_new_tokens=args.max_new_tokens)
+    print(f"⏱️ Loaded {backend.name} backend in {time.perf_counter() - start:.1f}s")
+
+    conversations = [
+        [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"User Query:\n{QUESTIONS[i % len(QUESTIONS)]}\n"},
+        ]
+        for i in range(args.requests)
+    ]
+
+    # Consume as streams so time to first token is what a client would see
+    def run(messages):
+        return sum(1 for _ in backend.stream(messages))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        pieces = sum(pool.map(run, conversations))
+    elapsed = time.perf_counter() - start
+
+    metrics = backend.metrics()
+    print(json.dumps(metrics, indent=2))
+    print(f"\n{args.requests} requests, concurrency {args.concurrency}: {elapsed:.1f}s wall, "
+          f"{metrics['tokens'] / elapsed:.1f} tokens/s aggregate ({pieces} streamed pieces)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Validate and time the system-prompt KV-cache prefix of Phi3Engine.
+
+Runs the same RAG-style prompts through an engine with the prefix cache and
+one without it, checks that greedy outputs are identical token for token
+(one at a time and as a concurrent batch), and compares the prefill latency
+of a full prompt against prefilling only what follows the cached prefix.
+
+Usage:
+    python bench_prefix_cache.py --max-new-tokens 64 --repeats 5
+"""
+import argparse
+import statistics
+import time
+
+import torch
+
+from phi3 import GenerationRequest, Phi3Engine
+from prompts import get_engine, system_prompt, generate_user_prompt
+
+QUESTIONS = [
+    "What is a DaViT architecture?",
+    "How does retrieval-augmented generation reduce hallucinations?",
+    "Summarise the difference between IVF and HNSW indexes.",
+    "Why would a chunk overlap be used when splitting documents?",
+]
+
+CONTEXT = [
+    {"text": "DaViT is a vision transformer that alternates spatial window attention and channel group attention.",
+     "chunk_index": 0, "url_id": 1, "distance": 0.3},
+    {"text": "Retrieval-augmented generation conditions a language model on passages fetched from an index.",
+     "chunk_index": 0, "url_id": 2, "distance": 0.4},
+    {"text": "IVF partitions vectors into inverted lists; HNSW walks a layered proximity graph.",
+     "chunk_index": 0, "url_id": 3, "distance": 0.5},
+]
+
+
+def build_messages(question):
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": generate_user_prompt(CONTEXT, question)},
+    ]
+
+
+def run_tokens(engine, conversations, max_new_tokens, concurrent):
+    """Generate for every conversation and return the generated token ids."""
+    if concurrent:
+        requests = [engine._enqueue(messages, max_new_tokens) for messages in conversations]
+        for request in requests:
+            request.future.result()
+        return [request.generated for request in requests]
+
+    generated = []
+    for messages in conversations:
+        request = engine._enqueue(messages, max_new_tokens)
+        request.future.result()
+        generated.append(request.generated)
+    return generated
+
+
+def time_prefill(fn, repeats):
+    """Median wall time of fn() in milliseconds."""
+    timings = []
+    for _ in range(repeats):
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+        with torch.inference_mode():
+            fn()
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    engine = get_engine()
+    model, tokenizer = engine.model, engine.tokenizer
+    conversations = [build_messages(question) for question in QUESTIONS]
+    full_engine = Phi3Engine(model, tokenizer, prefix_cache=False)
+    cached_engine = Phi3Engine(model, tokenizer, prefix_cache=True)
+
+    # 1. Token-for-token parity
+    all_match = True
+    for concurrent in (False, True):
+        reference = run_tokens(full_engine, conversations, args.max_new_tokens, concurrent)
+        cached = run_tokens(cached_engine, conversations, args.max_new_tokens, concurrent)
+        for question, ref_ids, ids in zip(QUESTIONS, reference, cached):
+            match = ref_ids == ids
+            all_match &= match
+            mode = "batch " if concurrent else "single"
+            print(f"{'✅' if match else '❌'} [{mode}] {len(ids):>3} tokens  {question}")
+    print(f"\nGreedy parity: {'identical' if all_match else 'MISMATCH'}")
+
+    # 2. Prefill latency: whole prompt vs only the part after the cached prefix
+    print(f"\n{'prompt tokens':>14} {'prefix':>7} {'full ms':>9} {'cached ms':>10} {'speedup':>8}")
+    for messages in conversations:
+        input_ids = list(tokenizer.apply_chat_template(messages, add_generation_prompt=True, tokenize=True))
+        request = GenerationRequest(input_ids, args.max_new_tokens, system_prompt=system_prompt)
+        with torch.inference_mode():
+            prefix = cached_engine._prefix_for(request)
+        if prefix is None:
+            print("⚠️ Prompt does not start with the cached prefix; nothing to compare")
+            continue
+
+        full_ms = time_prefill(lambda: full_engine._prefill_full([request]), args.repeats)
+        cached_ms = time_prefill(lambda: cached_engine._prefill_with_prefix([request], prefix), args.repeats)
+        print(f"{len(input_ids):>14} {len(prefix['ids']):>7} {full_ms:>9.1f} {cached_ms:>10.1f} {full_ms / cached_ms:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
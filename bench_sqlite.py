@@ -0,0 +1,120 @@
+"""
+Benchmark the metadata layer: bulk chunk inserts and chunk lookups while ingestion runs.
+
+Runs against a throwaway database, comparing the current data_utils functions
+with the previous row-at-a-time insert and connect-per-lookup patterns.
+
+Usage:
+    python bench_sqlite.py --urls 200 --chunks-per-url 40 --lookups 2000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+# Point data_utils at a scratch database before it opens its connection
+_tmp_dir = tempfile.mkdtemp(prefix="bench_sqlite_")
+os.environ["SQLITE_PATH"] = os.path.join(_tmp_dir, "bench.db")
+
+from data.data_utils import DB_PATH, create_tables, get_chunks_from_db, insert_chunks, insert_urls  # noqa: E402
+
+
+def legacy_insert_chunks(connection, url_id, chunks):
+    """Row-at-a-time insert with a timestamp per row, as ingestion used to do."""
+    cursor = connection.cursor()
+    ids = []
+    for idx, text in enumerate(chunks):
+        cursor.execute("""
+            INSERT INTO chunks (url_id, chunk_index, text, snippet, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        """, (url_id, idx, text, text[:100], datetime.utcnow().isoformat()))
+        ids.append(cursor.lastrowid)
+    connection.commit()
+    return ids
+
+
+def legacy_get_chunks(faiss_ids):
+    """Lookup that opens a fresh connection per call, as the query path used to do."""
+    connection = sqlite3.connect(DB_PATH, check_same_thread=False)
+    placeholders = ",".join("?" for _ in faiss_ids)
+    rows = connection.execute(
+        f"SELECT id, chunk_index, text, snippet FROM chunks WHERE id IN ({placeholders})", tuple(faiss_ids)
+    ).fetchall()
+    connection.close()
+    return rows
+
+
+def fake_chunks(n, size=1000):
+    return ["".join(random.choices("abcdefghij klmnop", k=size)) for _ in range(n)]
+
+
+def percentiles(samples_ms):
+    return f"p50={np.percentile(samples_ms, 50):.3f}ms p95={np.percentile(samples_ms, 95):.3f}ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--urls", type=int, default=200)
+    parser.add_argument("--chunks-per-url", type=int, default=40)
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    create_tables()
+    chunks = fake_chunks(args.chunks_per_url)
+
+    # ---- Ingest commits ----
+    legacy_conn = sqlite3.connect(DB_PATH)
+    legacy_ms, bulk_ms = [], []
+    for i in range(args.urls):
+        url_id = insert_urls(f"https://legacy.example/{i}")
+        start = time.perf_counter()
+        legacy_insert_chunks(legacy_conn, url_id, chunks)
+        legacy_ms.append((time.perf_counter() - start) * 1000)
+
+        url = f"https://bulk.example/{i}"
+        insert_urls(url)
+        start = time.perf_counter()
+        insert_chunks(url, chunks)
+        bulk_ms.append((time.perf_counter() - start) * 1000)
+    legacy_conn.close()
+
+    print(f"insert {args.chunks_per_url} chunks  row-at-a-time: {percentiles(legacy_ms)}")
+    print(f"insert {args.chunks_per_url} chunks  executemany:   {percentiles(bulk_ms)}")
+
+    # ---- Lookups while ingestion keeps writing ----
+    max_id = args.urls * args.chunks_per_url * 2
+    stop = threading.Event()
+
+    def ingest_forever():
+        i = 0
+        while not stop.is_set():
+            url = f"https://background.example/{i}"
+            insert_urls(url)
+            insert_chunks(url, chunks)
+            i += 1
+
+    writer = threading.Thread(target=ingest_forever, daemon=True)
+    writer.start()
+
+    for name, lookup in (("connect-per-lookup", legacy_get_chunks), ("pooled read-only", get_chunks_from_db)):
+        samples = []
+        for _ in range(args.lookups):
+            ids = random.sample(range(1, max_id), args.top_k)
+            start = time.perf_counter()
+            lookup(ids)
+            samples.append((time.perf_counter() - start) * 1000)
+        print(f"lookup top-{args.top_k} during ingest  {name:<20} {percentiles(samples)}")
+
+    stop.set()
+    writer.join()
+
+
+if __name__ == "__main__":
+    main()
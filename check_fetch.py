@@ -0,0 +1,141 @@
+"""
+Offline behaviour check for the HTTP fetcher (get_data.py) against a local stub server.
+
+Starts an http.server on 127.0.0.1 and a scratch SQLite database, then runs
+the conditional-GET / body-cap / timeout scenarios and exits non-zero on the
+first failure. No network access or Redis is needed.
+
+Usage:
+    python check_fetch.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Point data_utils at a scratch database before it is imported
+_scratch_dir = tempfile.mkdtemp(prefix="check_fetch_")
+os.environ["SQLITE_PATH"] = os.path.join(_scratch_dir, "check_fetch.db")
+
+from data.data_utils import create_tables, insert_urls, update_url_status, update_url_validators  # noqa: E402
+from get_data import AsyncFetcher, _get_loop_and_fetcher, fetch_html_conditional  # noqa: E402
+from worker import fetch_document  # noqa: E402
+
+ETAG = '"v1"'
+LAST_MODIFIED = "Wed, 01 Jan 2025 00:00:00 GMT"
+PAGE = b"<html><body><p>Hello from the stub server.</p></body></html>"
+BIG_BODY = b"x" * 4096
+SLOW_SECONDS = 1.0
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Serves /page (with validators), /big, /big-stream (no Content-Length) and /slow."""
+
+    requests_seen = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        StubHandler.requests_seen.append((self.path, dict(self.headers)))
+        if self.path == "/page":
+            if self.headers.get("If-None-Match") == ETAG or self.headers.get("If-Modified-Since") == LAST_MODIFIED:
+                self.send_response(304)
+                self.end_headers()
+                return
+            self._send(PAGE, headers={"ETag": ETAG, "Last-Modified": LAST_MODIFIED})
+        elif self.path == "/big":
+            self._send(BIG_BODY)
+        elif self.path == "/big-stream":
+            # HTTP/1.0 without Content-Length: the body runs until the connection closes
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.end_headers()
+            self.wfile.write(BIG_BODY)
+        elif self.path == "/slow":
+            time.sleep(SLOW_SECONDS)
+            try:
+                self._send(PAGE)
+            except BrokenPipeError:
+                pass  # the client already gave up on its timeout
+        else:
+            self.send_response(404)
+            self.end_headers()
+
+    def _send(self, body, headers=None):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def check(condition, message):
+    if not condition:
+        raise AssertionError(message)
+    print(f"✅ {message}")
+
+
+def run_checks(base_url):
+    url = f"{base_url}/page"
+
+    # First crawl: 200 with validators, stored the way commit_document stores them
+    fetched = fetch_document(url)
+    check(fetched is not None and fetched.status == 200 and "stub server" in fetched.html, "first fetch returns the page")
+    check(fetched.etag == ETAG and fetched.last_modified == LAST_MODIFIED, "ETag and Last-Modified are returned")
+    insert_urls(url)
+    update_url_validators(url, fetched.etag, fetched.last_modified)
+    update_url_status(url, status="completed")
+
+    # Re-crawl: conditional GET gets a 304 and fetch_document skips the page
+    check(fetch_document(url) is None, "conditional re-fetch of an unchanged page returns None (304)")
+    _, headers = StubHandler.requests_seen[-1]
+    check(headers.get("If-None-Match") == ETAG and headers.get("If-Modified-Since") == LAST_MODIFIED,
+          "the re-fetch sends the stored validators")
+
+    # Body cap, from the Content-Length header and while streaming
+    async def fetch_capped(path):
+        async with AsyncFetcher(max_body_bytes=1024) as fetcher:
+            return await fetcher.fetch(f"{base_url}{path}")
+
+    for path in ("/big", "/big-stream"):
+        try:
+            asyncio.run(fetch_capped(path))
+            check(False, f"{path} exceeds the body cap")
+        except ValueError as e:
+            check("exceeds" in str(e) or "limit" in str(e), f"{path} is rejected by the body cap")
+
+    # Per-request timeout: the shared fetcher exists already, yet each call's timeout applies
+    start = time.monotonic()
+    try:
+        fetch_html_conditional(f"{base_url}/slow", timeout=0.2)
+        check(False, "a short per-request timeout fires")
+    except asyncio.TimeoutError:
+        check(time.monotonic() - start < SLOW_SECONDS, "a short per-request timeout fires")
+    slow = fetch_html_conditional(f"{base_url}/slow", timeout=SLOW_SECONDS * 5)
+    check(slow.status == 200, "a longer timeout on the next call lets the slow page finish")
+
+
+def main():
+    create_tables()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, name="stub-server", daemon=True).start()
+    try:
+        run_checks(f"http://127.0.0.1:{server.server_address[1]}")
+    except AssertionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    finally:
+        loop, fetcher = _get_loop_and_fetcher()
+        asyncio.run_coroutine_threadsafe(fetcher.close(), loop).result()
+        server.shutdown()
+    print("🎉 Fetcher behaves as expected")
+
+
+if __name__ == "__main__":
+    main()
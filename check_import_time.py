@@ -0,0 +1,101 @@
+"""
+Cold-start regression check: import time and heavy dependencies of each entry point.
+
+Imports every entry module in a fresh interpreter, measures the wall time of
+the import, and fails if it exceeds the budget or if a heavy library (torch,
+transformers, sentence-transformers, langchain, pandas) was pulled in at import
+time. Models load lazily on first use or at warm-up, never on import.
+
+Usage:
+    python check_import_time.py                  # all entry points, default budget
+    python check_import_time.py --budget 1.5 main redis_workers
+    python check_import_time.py --top 10         # also list the slowest imports
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+ENTRY_POINTS = [
+    "main",
+    "redis_workers",
+    "worker_pool",
+    "ingest_pipeline",
+    "get_response",
+    "chunk_store",
+    "faiss_segments",
+    "data.data_utils",
+]
+
+HEAVY_MODULES = ["torch", "transformers", "sentence_transformers", "langchain", "pandas"]
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(json.dumps({{"seconds": elapsed, "heavy": heavy}}))
+"""
+
+
+def measure(module, top=0):
+    """
+    Import module in a fresh interpreter.
+
+    Returns:
+        Dict: seconds, heavy (heavy modules loaded), error, and slowest
+            (top cumulative -X importtime entries) when top > 0.
+    """
+    command = [sys.executable]
+    if top:
+        command += ["-X", "importtime"]
+    command += ["-c", _PROBE.format(module=module, heavy=HEAVY_MODULES)]
+    result = subprocess.run(command, capture_output=True, text=True)
+
+    if result.returncode != 0:
+        lines = result.stderr.strip().splitlines()
+        return {"seconds": None, "heavy": [], "error": lines[-1] if lines else "import failed"}
+
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    report["error"] = None
+    if top:
+        timings = []
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            _, cumulative, name = [part.strip() for part in line[len("import time:"):].split("|")]
+            timings.append((int(cumulative), name))
+        report["slowest"] = sorted(timings, reverse=True)[:top]
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=ENTRY_POINTS)
+    parser.add_argument("--budget", type=float, default=3.0, help="Max import seconds per entry point")
+    parser.add_argument("--top", type=int, default=0, help="Show the N slowest imports of each entry point")
+    args = parser.parse_args()
+
+    failures = 0
+    print(f"{'entry point':<20} {'import s':>9}  heavy modules")
+    for module in args.modules:
+        report = measure(module, top=args.top)
+        if report["error"]:
+            failures += 1
+            print(f"❌ {module:<18} {'-':>9}  {report['error']}")
+            continue
+
+        ok = report["seconds"] <= args.budget and not report["heavy"]
+        failures += not ok
+        heavy = ", ".join(report["heavy"]) or "-"
+        print(f"{'✅' if ok else '❌'} {module:<18} {report['seconds']:>9.2f}  {heavy}")
+        for cumulative_us, name in report.get("slowest", []):
+            print(f"      {cumulative_us / 1e6:>8.3f}s  {name}")
+
+    print(f"\n{len(args.modules) - failures}/{len(args.modules)} entry points within {args.budget:.1f}s and lazy")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
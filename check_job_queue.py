@@ -0,0 +1,127 @@
+"""
+Behaviour check for the Redis job queue (job_queue.py) against a throwaway Redis.
+
+Runs enqueue / dedupe / claim / lease-expiry / retry scenarios and exits
+non-zero on the first failure. By default it uses fakeredis (pip install
+fakeredis), so no server is needed; --redis-url points it at a real Redis
+instead (keys are namespaced under a random queue name and deleted afterwards).
+
+Usage:
+    python check_job_queue.py
+    python check_job_queue.py --redis-url redis://localhost:6379/15
+"""
+import argparse
+import json
+import sys
+import time
+import uuid
+
+from job_queue import RedisJobQueue
+
+
+def make_client(redis_url):
+    if redis_url:
+        import redis
+
+        return redis.StrictRedis.from_url(redis_url, decode_responses=True)
+    try:
+        import fakeredis
+    except ImportError:
+        sys.exit("❌ fakeredis is not installed (pip install fakeredis) and no --redis-url was given")
+    return fakeredis.FakeStrictRedis(decode_responses=True)
+
+
+def check(condition, message):
+    if not condition:
+        raise AssertionError(message)
+    print(f"✅ {message}")
+
+
+def run_checks(client, name):
+    q = RedisJobQueue(client, name=name, lease_seconds=0.2, max_attempts=2, dedupe_window=60)
+
+    # Batch enqueue with duplicates inside the batch and against pending jobs
+    jobs = q.enqueue(["https://a", "https://b", "https://a"])
+    check([j["duplicate"] for j in jobs] == [False, False, True], "repeats within a batch are enqueued once")
+    check(jobs[0]["job_id"] == jobs[2]["job_id"], "a repeated URL gets the same job id")
+    again = q.enqueue(["https://b", "https://c"])
+    check(again[0] == {"url": "https://b", "job_id": jobs[1]["job_id"], "duplicate": True}, "pending URLs are not enqueued again")
+    check(q.stats()["pending"] == 3, "three distinct jobs are pending")
+    check(q.get(jobs[0]["job_id"])["status"] == "queued", "new jobs report status queued")
+
+    # FIFO claim, lease and completion
+    first = q.claim(timeout=1)
+    check(first["url"] == "https://a" and first["status"] == "processing", "jobs are claimed oldest first")
+    check(q.stats()["processing"] == 1, "a claimed job moves to the processing list")
+    q.complete(first["job_id"], chunk_count=12, not_modified=False)
+    done = q.get(first["job_id"])
+    check(done["status"] == "completed" and done["chunk_count"] == "12", "completion is recorded on the job hash")
+    check(q.stats()["processing"] == 0, "completion removes the job from the processing list")
+    recent = q.enqueue(["https://a"])[0]
+    check(recent["duplicate"] and recent["job_id"] == first["job_id"], "recently completed URLs are dropped")
+
+    # A worker that dies without acking: the lease expires and the job comes back
+    crashed = q.claim(timeout=1)
+    check(crashed["url"] == "https://b", "second job claimed")
+    check(q.requeue_expired() == 0, "live leases are not requeued")
+    time.sleep(0.3)
+    check(q.requeue_expired() == 1, "an expired lease is requeued")
+    retried = q.claim(timeout=1)
+    check(retried["job_id"] == crashed["job_id"] and retried["attempts"] == "2", "the requeued job is claimed again first")
+
+    # A job that is still held is kept alive by renewing its lease
+    check(q.renew_held() == 1, "the claimed job's lease is renewed")
+    time.sleep(0.15)
+    q.renew_held()
+    time.sleep(0.15)
+    check(q.requeue_expired() == 0, "a renewed lease does not expire")
+
+    # Out of attempts: failed instead of requeued, and the URL can be resubmitted
+    q.max_hold = 0  # stop renewing it
+    q.renew_held()
+    time.sleep(0.3)
+    q.requeue_expired()
+    check(q.get(crashed["job_id"])["status"] == "failed", "a job past max_attempts is failed")
+    check(not q.enqueue(["https://b"])[0]["duplicate"], "failed URLs can be enqueued again")
+
+    # Failures are recorded with their error
+    third = q.claim(timeout=1)
+    q.fail(third["job_id"], "boom")
+    check(q.get(third["job_id"])["error"] == "boom", "failures keep their error message")
+
+    # Payloads pushed by the old enqueue_url are adopted
+    client.lpush(name, json.dumps({"url": "https://legacy", "status": "pending"}))
+    while True:
+        job = q.claim(timeout=1)
+        check(job is not None, "queue drains")
+        if job["url"] == "https://legacy":
+            break
+        q.complete(job["job_id"])
+    check(len(job["job_id"]) == 32 and job["status"] == "processing", "legacy JSON jobs get a job id and status")
+    q.complete(job["job_id"])
+
+    check(q.claim(timeout=1) is None, "claim returns None on an empty queue")
+    check(q.get("missing") is None, "unknown job ids return None")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--redis-url", default=None, help="Real Redis to test against (default: fakeredis)")
+    args = parser.parse_args()
+
+    client = make_client(args.redis_url)
+    name = f"check_jobs:{uuid.uuid4().hex[:8]}"
+    try:
+        run_checks(client, name)
+    except AssertionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    finally:
+        keys = list(client.scan_iter(f"{name}*"))
+        if keys:
+            client.delete(*keys)
+    print("🎉 Job queue behaves as expected")
+
+
+if __name__ == "__main__":
+    main()
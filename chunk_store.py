@@ -0,0 +1,293 @@
+"""
+Read-optimized, memory-mapped chunk text store addressed directly by FAISS id.
+
+Layout (inside CHUNK_STORE_DIR):
+    CURRENT                 name of the live version directory (replaced atomically)
+    <version>/texts.bin     concatenated UTF-8 chunk texts
+    <version>/records.bin   fixed-size records indexed by FAISS id (chunks.id):
+                            byte offset, byte length, chunk_index, url_id
+
+SQLite stays the source of truth: the ingestion writer appends here in the
+same commit that publishes the FAISS segment, lookups fall back to SQLite for
+any id the store does not have, and the store can be rebuilt from
+rag_metadata.db at any time:
+
+    python chunk_store.py rebuild
+"""
+import mmap
+import os
+import shutil
+import sys
+import threading
+import time
+
+import numpy as np
+
+from data.data_utils import get_chunks_from_db, read_connection
+
+CHUNK_STORE_DIR = os.environ.get("CHUNK_STORE_DIR", "chunk_store")
+TEXTS_FILE = "texts.bin"
+RECORDS_FILE = "records.bin"
+CURRENT_FILE = "CURRENT"
+
+# length == 0 marks an id with no chunk (chunks are never empty)
+RECORD_DTYPE = np.dtype([
+    ("offset", "<u8"),
+    ("length", "<u4"),
+    ("chunk_index", "<i4"),
+    ("url_id", "<i8"),
+])
+
+
+def _current_version_dir(store_dir):
+    """Return the live version directory, creating an empty store if there is none."""
+    current_path = os.path.join(store_dir, CURRENT_FILE)
+    if not os.path.exists(current_path):
+        version = "v-initial"
+        os.makedirs(os.path.join(store_dir, version), exist_ok=True)
+        _write_current(store_dir, version)
+    with open(current_path) as f:
+        return os.path.join(store_dir, f.read().strip())
+
+
+def _write_current(store_dir, version):
+    current_path = os.path.join(store_dir, CURRENT_FILE)
+    tmp_path = f"{current_path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(version)
+    os.replace(tmp_path, current_path)
+
+
+def _write_chunks(version_dir, rows):
+    """
+    Append chunk texts and records to one version of the store.
+
+    Texts are written before records, so a reader that sees a record can
+    always read its text.
+    """
+    if not rows:
+        return
+
+    texts_path = os.path.join(version_dir, TEXTS_FILE)
+    records_path = os.path.join(version_dir, RECORDS_FILE)
+
+    records = np.zeros(len(rows), dtype=RECORD_DTYPE)
+    ids = np.empty(len(rows), dtype=np.int64)
+    with open(texts_path, "ab") as f:
+        offset = f.tell()
+        for i, (faiss_id, url_id, chunk_index, text) in enumerate(rows):
+            encoded = text.encode("utf-8")
+            f.write(encoded)
+            records[i] = (offset, len(encoded), chunk_index, url_id)
+            ids[i] = faiss_id
+            offset += len(encoded)
+
+    # Grow the records file so every new id has a slot, then fill the slots
+    size = os.path.getsize(records_path) if os.path.exists(records_path) else 0
+    needed = (int(ids.max()) + 1) * RECORD_DTYPE.itemsize
+    if needed > size:
+        with open(records_path, "ab") as f:
+            f.truncate(needed)
+
+    table = np.memmap(records_path, dtype=RECORD_DTYPE, mode="r+")
+    table[ids] = records
+    table.flush()
+    del table
+
+
+def append_chunks(faiss_ids, url_id, chunk_indices, texts, store_dir=CHUNK_STORE_DIR):
+    """
+    Add newly ingested chunks to the store. Called by the single ingestion writer.
+
+    Args:
+        faiss_ids (List[int]): chunks.id of each chunk.
+        url_id (int): urls.id the chunks belong to.
+        chunk_indices (List[int]): chunk_index of each chunk.
+        texts (List[str]): Chunk texts.
+        store_dir (str): Store directory.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    rows = list(zip(faiss_ids, [url_id] * len(faiss_ids), chunk_indices, texts))
+    _write_chunks(_current_version_dir(store_dir), rows)
+
+
+def _patch_records(faiss_ids, field, values, store_dir):
+    """Overwrite one field of existing records in place; ids past the end of the table are skipped."""
+    records_path = os.path.join(_current_version_dir(store_dir), RECORDS_FILE)
+    if not faiss_ids or not os.path.exists(records_path) or os.path.getsize(records_path) == 0:
+        return
+    ids = np.asarray(faiss_ids, dtype=np.int64)
+    values = np.broadcast_to(np.asarray(values), ids.shape)
+    table = np.memmap(records_path, dtype=RECORD_DTYPE, mode="r+")
+    inside = ids < len(table)
+    table[field][ids[inside]] = values[inside]
+    table.flush()
+    del table
+
+
+def remove_chunks(faiss_ids, store_dir=CHUNK_STORE_DIR):
+    """
+    Forget chunks deleted from SQLite. Called by the single ingestion writer.
+
+    Their records are zeroed (length 0 means no chunk); the text bytes stay in
+    texts.bin until the next rebuild.
+    """
+    _patch_records(faiss_ids, "length", 0, store_dir)
+
+
+def update_chunk_indices(faiss_ids, chunk_indices, store_dir=CHUNK_STORE_DIR):
+    """Record the new chunk_index of kept chunks that moved within their document."""
+    _patch_records(faiss_ids, "chunk_index", chunk_indices, store_dir)
+
+
+def rebuild_chunk_store(store_dir=CHUNK_STORE_DIR, batch_size=10_000):
+    """
+    Rebuild the store from the SQLite chunks table into a fresh version and switch to it.
+
+    Args:
+        store_dir (str): Store directory.
+        batch_size (int): Rows read per SQLite fetch.
+
+    Returns:
+        int: Number of chunks written.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    version = f"v-{int(time.time() * 1000)}"
+    version_dir = os.path.join(store_dir, version)
+    os.makedirs(version_dir)
+
+    total = 0
+    with read_connection() as connection:
+        cursor = connection.execute("SELECT id, url_id, chunk_index, text FROM chunks ORDER BY id")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            _write_chunks(version_dir, rows)
+            total += len(rows)
+
+    current_path = os.path.join(store_dir, CURRENT_FILE)
+    old_version = open(current_path).read().strip() if os.path.exists(current_path) else None
+    _write_current(store_dir, version)
+    if old_version and old_version != version:
+        # Readers that still map the old files keep them alive until they reopen
+        shutil.rmtree(os.path.join(store_dir, old_version), ignore_errors=True)
+
+    print(f"✅ Chunk store rebuilt at {os.path.abspath(version_dir)} ({total} chunks)")
+    return total
+
+
+class ChunkStore:
+    """
+    Memory-mapped reader: resolves FAISS ids to chunks by slicing, with no SQL.
+
+    Reopens its maps when asked for an id past the end of what it has mapped,
+    so chunks appended by ingestion become visible without a restart, and
+    whenever CURRENT is replaced, so a rebuild is picked up instead of serving
+    the deleted version. Never creates the store.
+    """
+
+    def __init__(self, store_dir=CHUNK_STORE_DIR):
+        self.store_dir = store_dir
+        self._records = None
+        self._texts = None
+        self._stamp = None
+        self._lock = threading.Lock()
+
+    def _current_stamp(self):
+        """Identity of the CURRENT file (replaced atomically on rebuild), or None if there is no store."""
+        try:
+            stat = os.stat(os.path.join(self.store_dir, CURRENT_FILE))
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _open(self):
+        records, texts = None, None
+        stamp = self._current_stamp()
+        try:
+            with open(os.path.join(self.store_dir, CURRENT_FILE)) as f:
+                version_dir = os.path.join(self.store_dir, f.read().strip())
+            records_path = os.path.join(version_dir, RECORDS_FILE)
+            texts_path = os.path.join(version_dir, TEXTS_FILE)
+            if os.path.getsize(records_path) and os.path.getsize(texts_path):
+                records = np.memmap(records_path, dtype=RECORD_DTYPE, mode="r")
+                with open(texts_path, "rb") as f:
+                    texts = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, OSError):
+            pass  # store not built yet, or mid-rebuild; SQLite covers it
+        self._records, self._texts, self._stamp = records, texts, stamp
+
+    def _maps_for(self, max_id):
+        records, texts = self._records, self._texts
+        if records is None or max_id >= len(records) or self._current_stamp() != self._stamp:
+            with self._lock:
+                self._open()
+                records, texts = self._records, self._texts
+        return records, texts
+
+    def get_chunks(self, faiss_ids):
+        """
+        Resolve FAISS ids to chunk dicts.
+
+        Returns:
+            Tuple[List[Dict], List[int]]: Chunks found in the store, and ids it does not have.
+        """
+        ids = [int(i) for i in faiss_ids if int(i) >= 0]
+        if not ids:
+            return [], []
+
+        records, texts = self._maps_for(max(ids))
+        if records is None:
+            return [], ids
+
+        chunks, missing = [], []
+        for faiss_id in ids:
+            if faiss_id >= len(records):
+                missing.append(faiss_id)
+                continue
+            record = records[faiss_id]
+            length = int(record["length"])
+            offset = int(record["offset"])
+            if length == 0 or offset + length > len(texts):
+                missing.append(faiss_id)
+                continue
+            text = texts[offset:offset + length].decode("utf-8")
+            chunks.append({
+                "faiss_id": faiss_id,
+                "chunk_index": int(record["chunk_index"]),
+                "url_id": int(record["url_id"]),
+                "text": text,
+                "snippet": text[:100],
+            })
+        return chunks, missing
+
+
+# Process-wide reader used by the query path
+chunk_store = ChunkStore()
+
+
+def get_chunks_by_id(faiss_ids):
+    """
+    Drop-in replacement for get_chunks_from_db on the query hot path.
+
+    Serves from the memory-mapped store and falls back to SQLite only for
+    ids the store does not have yet.
+
+    Returns:
+        List of dicts: [{"chunk_index": int, "url_id": int, "text": str, "snippet": str, "faiss_id": int}, ...]
+    """
+    chunks, missing = chunk_store.get_chunks(faiss_ids)
+    if missing:
+        chunks.extend(get_chunks_from_db(missing))
+
+    # Same ordering as get_chunks_from_db
+    chunks.sort(key=lambda x: x["chunk_index"])
+    return chunks
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "rebuild":
+        rebuild_chunk_store(sys.argv[2] if len(sys.argv) > 2 else CHUNK_STORE_DIR)
+    else:
+        print("Usage: python chunk_store.py rebuild [store_dir]")
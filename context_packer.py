@@ -0,0 +1,182 @@
+"""
+Token-budgeted packing of retrieved chunks into the LLM prompt.
+
+Chunks are cut with an overlap (CHUNK_OVERLAP_TOKENS tokens at ingestion,
+100 characters for older data), so neighbouring hits from the same URL repeat
+text. The packer merges runs of
+consecutive chunk_index hits from one url_id into a single span with the
+repeated text removed, orders spans by relevance, and adds them until the
+token budget (counted with the Phi-3 tokenizer) is spent.
+"""
+import os
+
+# Phi-3-mini context window shared by system prompt, user prompt and generated tokens
+PHI3_CONTEXT_TOKENS = int(os.environ.get("PHI3_CONTEXT_TOKENS", 4096))
+# Optional hard cap on the tokens spent on retrieved context
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET") or 0) or None
+
+# Overlap shorter than this is treated as coincidence, not chunker overlap
+MIN_OVERLAP_CHARS = 10
+# Never truncate the last span below this many tokens; drop it instead
+MIN_SPAN_TOKENS = 32
+
+
+def count_tokens(tokenizer, texts):
+    """
+    Count tokens for each text in one tokenizer call.
+
+    Args:
+        tokenizer: Hugging Face tokenizer.
+        texts (List[str]): Texts to count.
+
+    Returns:
+        List[int]: Token count per text (without special tokens).
+    """
+    if not texts:
+        return []
+    encoded = tokenizer(list(texts), add_special_tokens=False)["input_ids"]
+    return [len(ids) for ids in encoded]
+
+
+def _strip_overlap(previous, text, max_overlap):
+    """Drop the prefix of text that repeats the tail of previous (longest match first)."""
+    limit = min(len(previous), len(text), max_overlap)
+    for size in range(limit, MIN_OVERLAP_CHARS - 1, -1):
+        if previous.endswith(text[:size]):
+            return text[size:]
+    return text
+
+
+def merge_adjacent_chunks(rag_results, chunk_overlap=100):
+    """
+    Merge consecutive chunk_index hits from the same URL into spans.
+
+    Args:
+        rag_results (List[Dict]): Retrieved chunks with text, chunk_index, url_id
+            and (optionally) distance.
+        chunk_overlap (int): Character overlap used when chunking.
+
+    Returns:
+        List[Dict]: Spans with text, url_id, chunk_indices, faiss_ids, distance
+            (best of its chunks) and rank (best retrieval rank of its chunks).
+    """
+    # Retrieval order is the relevance order when no distance is available
+    ranked = sorted(
+        enumerate(rag_results),
+        key=lambda item: (item[1].get("distance", float("inf")), item[0]),
+    )
+    rank_of = {id(chunk): rank for rank, (_, chunk) in enumerate(ranked)}
+
+    by_url = {}
+    for chunk in rag_results:
+        by_url.setdefault(chunk.get("url_id"), []).append(chunk)
+
+    spans = []
+    for url_id, chunks in by_url.items():
+        chunks.sort(key=lambda c: c["chunk_index"])
+        span = None
+        for chunk in chunks:
+            text = chunk.get("text", "").strip()
+            contiguous = (
+                span is not None
+                and url_id is not None
+                and chunk["chunk_index"] == span["chunk_indices"][-1] + 1
+            )
+            if contiguous:
+                remainder = _strip_overlap(span["text"], text, 2 * chunk_overlap)
+                separator = "" if remainder is not text else " "
+                span["text"] = f"{span['text']}{separator}{remainder}".strip()
+                span["chunk_indices"].append(chunk["chunk_index"])
+                span["faiss_ids"].append(chunk.get("faiss_id"))
+                span["distance"] = min(span["distance"], chunk.get("distance", float("inf")))
+                span["rank"] = min(span["rank"], rank_of[id(chunk)])
+                continue
+
+            if span is not None:
+                spans.append(span)
+            span = {
+                "text": text,
+                "url_id": url_id,
+                "chunk_indices": [chunk["chunk_index"]],
+                "faiss_ids": [chunk.get("faiss_id")],
+                "distance": chunk.get("distance", float("inf")),
+                "rank": rank_of[id(chunk)],
+            }
+        if span is not None:
+            spans.append(span)
+
+    spans.sort(key=lambda s: s["rank"])
+    return spans
+
+
+def pack_context(rag_results, tokenizer, token_budget, chunk_overlap=100):
+    """
+    Select and merge retrieved chunks so their text fits in token_budget.
+
+    Spans are taken in relevance order; a span that does not fit is skipped
+    in favour of smaller, less relevant ones, except that the most relevant
+    remaining span is truncated to fill the budget when nothing else fits.
+
+    Args:
+        rag_results (List[Dict]): Retrieved chunks (see merge_adjacent_chunks).
+        tokenizer: Hugging Face tokenizer of the generating model.
+        token_budget (int): Maximum number of tokens of context text.
+        chunk_overlap (int): Character overlap used when chunking.
+
+    Returns:
+        Tuple[List[Dict], Dict]: Packed spans (relevance order), and stats with
+            context_tokens, raw_context_tokens, merged_chunks, dropped_chunks
+            and truncated_spans.
+    """
+    raw_tokens = sum(count_tokens(tokenizer, [c.get("text", "").strip() for c in rag_results]))
+    spans = merge_adjacent_chunks(rag_results, chunk_overlap=chunk_overlap)
+    span_tokens = count_tokens(tokenizer, [span["text"] for span in spans])
+
+    packed, used, truncated, skipped = [], 0, 0, []
+    for span, tokens in zip(spans, span_tokens):
+        if used + tokens <= token_budget:
+            packed.append({**span, "tokens": tokens})
+            used += tokens
+        else:
+            skipped.append(span)
+
+    # Fill what is left with the head of the most relevant span that did not fit
+    remaining = token_budget - used
+    if skipped and remaining >= MIN_SPAN_TOKENS:
+        span = skipped.pop(0)
+        ids = tokenizer(span["text"], add_special_tokens=False)["input_ids"][:remaining]
+        text = tokenizer.decode(ids, skip_special_tokens=True)
+        packed.append({**span, "text": text, "tokens": len(ids), "truncated": True})
+        packed.sort(key=lambda s: s["rank"])
+        used += len(ids)
+        truncated = 1
+
+    stats = {
+        "context_tokens": used,
+        "raw_context_tokens": raw_tokens,
+        "merged_chunks": len(rag_results) - len(spans),
+        "dropped_chunks": sum(len(span["chunk_indices"]) for span in skipped),
+        "truncated_spans": truncated,
+    }
+    return packed, stats
+
+
+def context_token_budget(tokenizer, system_prompt, user_query, max_new_tokens, template_tokens=64):
+    """
+    Tokens left for retrieved context once the fixed parts of the prompt are counted.
+
+    Args:
+        tokenizer: Hugging Face tokenizer of the generating model.
+        system_prompt (str): System prompt sent with every request.
+        user_query (str): The user's question.
+        max_new_tokens (int): Tokens reserved for the answer.
+        template_tokens (int): Allowance for chat-template and prompt scaffolding.
+
+    Returns:
+        int: Token budget for context text (never negative).
+    """
+    fixed = sum(count_tokens(tokenizer, [system_prompt, user_query])) + template_tokens
+    budget = PHI3_CONTEXT_TOKENS - max_new_tokens - fixed
+    if CONTEXT_TOKEN_BUDGET is not None:
+        budget = min(budget, CONTEXT_TOKEN_BUDGET)
+    return max(budget, 0)
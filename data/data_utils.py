@@ -1,16 +1,116 @@
+import hashlib
+import os
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
 from datetime import datetime
-import pandas as pd
 
-from text_utils import chunk_text
-from get_data import extract_text_from_html, fetch_html
+DB_PATH = os.environ.get("SQLITE_PATH", "rag_metadata.db")
+READ_POOL_SIZE = int(os.environ.get("SQLITE_READ_POOL_SIZE", 8))
 
-# Connect to (or create) database file
-conn = sqlite3.connect("rag_metadata.db")
+# Pragmas shared by every connection: big page cache, memory-mapped reads
+_COMMON_PRAGMAS = (
+    "PRAGMA cache_size=-65536;",     # 64 MB page cache
+    "PRAGMA mmap_size=268435456;",   # map up to 256 MB of the file
+    "PRAGMA temp_store=MEMORY;",
+    "PRAGMA busy_timeout=30000;",
+)
+
+def _connect(read_only=False):
+    """
+    Open a tuned connection to the metadata database.
+
+    The writer switches the database to WAL journaling, so readers never block
+    the writer (or each other) and see the last committed state.
+    """
+    if read_only:
+        connection = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True, check_same_thread=False, timeout=30)
+        connection.execute("PRAGMA query_only=ON;")
+    else:
+        connection = sqlite3.connect(DB_PATH, check_same_thread=False, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL;")
+        # Durable at every checkpoint; a power loss can only drop the last commits
+        connection.execute("PRAGMA synchronous=NORMAL;")
+    for pragma in _COMMON_PRAGMAS:
+        connection.execute(pragma)
+    return connection
+
+# The only writer connection in the process. Opened by create_tables(), so importing
+# this module (e.g. from the query path) never switches the database to WAL.
+conn = None
+_write_lock = threading.RLock()
+
+def _writer():
+    """Return the writer connection opened by create_tables()."""
+    if conn is None:
+        raise RuntimeError("Metadata database is not initialised; call create_tables() first")
+    return conn
+
+# Pool of read-only connections for the query path
+_read_pool = queue.LifoQueue(maxsize=READ_POOL_SIZE)
+
+@contextmanager
+def read_connection():
+    """
+    Borrow a read-only connection from the pool (thread-safe).
+
+    Connections are created on demand up to SQLITE_READ_POOL_SIZE idle ones;
+    extras are closed when returned.
+    """
+    try:
+        connection = _read_pool.get_nowait()
+    except queue.Empty:
+        connection = _connect(read_only=True)
+    try:
+        yield connection
+    finally:
+        try:
+            _read_pool.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+def _migrate_tables():
+    """Add columns introduced after a database was created. Run by create_tables()."""
+    with _write_lock:
+        connection = _writer()
+        cursor = connection.cursor()
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(urls)")}
+        if not columns:
+            return  # tables not created yet
+
+        for column in ("etag", "last_modified"):
+            if column not in columns:
+                try:
+                    cursor.execute(f"ALTER TABLE urls ADD COLUMN {column} TEXT")
+                except sqlite3.OperationalError:
+                    pass  # added concurrently by another process
+        try:
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_chunks_url_id ON chunks (url_id);")
+            chunk_columns = {row[1] for row in cursor.execute("PRAGMA table_info(chunks)")}
+            if "content_hash" not in chunk_columns:
+                # Existing rows keep NULL and are hashed from their text on the next re-ingest
+                cursor.execute("ALTER TABLE chunks ADD COLUMN content_hash TEXT")
+        except sqlite3.OperationalError:
+            pass  # chunks table not created yet, or column added concurrently
+        connection.commit()
 
 def create_tables() : 
+    """
+    Create the tables if needed and migrate older schemas.
+
+    Also opens the writer connection. Importing this module neither opens it
+    nor changes the schema; ingestion entry points call this once at startup.
+    """
+    global conn
+    with _write_lock:
+        if conn is None:
+            conn = _connect()
+    _migrate_tables()
+
     # Create tables
-    cursor = conn.cursor()
+    connection = _writer()
+    cursor = connection.cursor()
 
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS urls (
@@ -21,7 +121,9 @@ def create_tables() :
         started_at TEXT,
         completed_at TEXT,
         chunk_count INTEGER DEFAULT 0,
-        error_message TEXT
+        error_message TEXT,
+        etag TEXT,
+        last_modified TEXT
     );
     """)
 
@@ -32,11 +134,14 @@ def create_tables() :
         chunk_index INTEGER NOT NULL,
         text TEXT NOT NULL,
         snippet TEXT,
-        created_at TEXT NOT NULL
+        created_at TEXT NOT NULL,
+        content_hash TEXT
     );
     """)
 
-    conn.commit()
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_chunks_url_id ON chunks (url_id);")
+
+    connection.commit()
     print("Database and tables created successfully.")
     
 
@@ -44,6 +149,8 @@ def insert_chunks(url, chunks):
     """
     Insert chunks for a given URL into SQLite and return FAISS IDs.
 
+    All rows are written with one executemany inside a single transaction.
+
     Args:
         conn: sqlite3 connection object
         url (str): URL of the document
@@ -52,38 +159,205 @@ def insert_chunks(url, chunks):
     Returns:
         List[int]: List of FAISS IDs (chunks.id) corresponding to inserted chunks
     """
-    cursor = conn.cursor()
-
-    # Get URL ID
-    cursor.execute("SELECT id FROM urls WHERE url=?", (url,))
-    result = cursor.fetchone()
-    if not result:
-        raise ValueError(f"URL {url} not found in urls table.")
-    url_id = result[0]
-
-    faiss_ids = []
+    created_at = datetime.utcnow().isoformat()
 
-    # Insert chunks
+    rows = []
     for idx, chunk_text in enumerate(chunks):
         if not isinstance(chunk_text, str) or chunk_text.strip() == "":
             print(f"⚠️ Skipping invalid chunk: {chunk_text}")
             continue
-
         snippet = chunk_text[:100]  # first 100 characters
-        created_at = datetime.utcnow().isoformat()
-        cursor.execute("""
-            INSERT INTO chunks (url_id, chunk_index, text, snippet, created_at)
-            VALUES (?, ?, ?, ?, ?)
-        """, (url_id, idx, chunk_text, snippet, created_at))
+        rows.append((idx, chunk_text, snippet, created_at, chunk_hash(chunk_text)))
+
+    with _write_lock:
+        connection = _writer()
+        cursor = connection.cursor()
+        cursor.execute("BEGIN IMMEDIATE;")
+        try:
+            # Get URL ID
+            cursor.execute("SELECT id FROM urls WHERE url=?", (url,))
+            result = cursor.fetchone()
+            if not result:
+                raise ValueError(f"URL {url} not found in urls table.")
+            url_id = result[0]
+
+            cursor.execute("SELECT COALESCE(MAX(id), 0) FROM chunks")
+            last_id = cursor.fetchone()[0]
+
+            # Insert chunks
+            cursor.executemany("""
+                INSERT INTO chunks (url_id, chunk_index, text, snippet, created_at, content_hash)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, [(url_id, *row) for row in rows])
+
+            # The write lock is held, so every id above last_id for this URL is ours
+            cursor.execute(
+                "SELECT id FROM chunks WHERE url_id=? AND id>? ORDER BY id", (url_id, last_id)
+            )
+            faiss_ids = [row[0] for row in cursor.fetchall()]
+
+            # Update URL chunk count
+            cursor.execute("UPDATE urls SET chunk_count=? WHERE id=?", (len(chunks), url_id))
+
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
 
-        # Get the auto-assigned ID as FAISS ID
-        faiss_ids.append(cursor.lastrowid)
+    return faiss_ids
 
-    # Update URL chunk count
-    cursor.execute("UPDATE urls SET chunk_count=? WHERE id=?", (len(chunks), url_id))
+# content_hash of rows inserted by sync_chunks whose vectors are not published yet
+UNINDEXED_HASH = ""
 
-    conn.commit()
-    return faiss_ids
+def chunk_hash(text):
+    """Content hash identifying a chunk's text across re-ingestions."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def get_chunk_hashes(url):
+    """
+    Content hashes of the chunks currently stored for a URL.
+
+    Read-only, so ingestion workers can call it in parallel to skip embedding
+    chunks that are already stored.
+
+    Returns:
+        Set[str]: Hashes of the stored chunks (empty for a new URL).
+    """
+    with read_connection() as connection:
+        rows = connection.execute("""
+            SELECT c.content_hash, CASE WHEN c.content_hash IS NULL THEN c.text END
+            FROM chunks c JOIN urls u ON u.id = c.url_id
+            WHERE u.url=? AND (c.content_hash IS NULL OR c.content_hash != ?)
+        """, (url, UNINDEXED_HASH)).fetchall()
+    return {content_hash or chunk_hash(text) for content_hash, text in rows}
+
+def sync_chunks(url, chunks):
+    """
+    Start replacing the stored chunks of a URL with a new version, touching only what changed.
+
+    New chunks are matched to stored ones by content hash. A matched chunk keeps
+    its row and id (its chunk_index is updated if it moved) and unmatched new
+    chunks are inserted; stored chunks with no match are only reported.
+    Repeated texts are matched one to one.
+
+    The new rows are stored with UNINDEXED_HASH until finish_chunk_sync runs
+    after their vectors are published and the removed ones are gone from FAISS.
+    If that never happens, the next sync treats them as removed, so the chunks
+    are embedded again and the removal is retried.
+
+    Args:
+        url (str): URL of the document (must exist in the urls table).
+        chunks (List[str]): New chunk texts, in order.
+
+    Returns:
+        Dict: url_id; added (List[Tuple[int, int]]: chunk_index and new id of
+            each inserted chunk); removed (List[int]: ids of chunks to delete);
+            unchanged (List[int]: ids kept); moved (List[Tuple[int, int]]:
+            id and new chunk_index of kept chunks whose position changed);
+            hashes (List[Tuple[str, int]]: content hash and id of each new row)
+            and chunk_count, both for finish_chunk_sync.
+    """
+    created_at = datetime.utcnow().isoformat()
+
+    new_chunks = []
+    for idx, chunk_text in enumerate(chunks):
+        if not isinstance(chunk_text, str) or chunk_text.strip() == "":
+            print(f"⚠️ Skipping invalid chunk: {chunk_text}")
+            continue
+        new_chunks.append((idx, chunk_text, chunk_hash(chunk_text)))
+
+    with _write_lock:
+        connection = _writer()
+        cursor = connection.cursor()
+        cursor.execute("BEGIN IMMEDIATE;")
+        try:
+            cursor.execute("SELECT id FROM urls WHERE url=?", (url,))
+            result = cursor.fetchone()
+            if not result:
+                raise ValueError(f"URL {url} not found in urls table.")
+            url_id = result[0]
+
+            cursor.execute("""
+                SELECT id, chunk_index, content_hash, CASE WHEN content_hash IS NULL THEN text END
+                FROM chunks WHERE url_id=? ORDER BY chunk_index, id
+            """, (url_id,))
+            stored = {}  # hash -> [(id, chunk_index), ...] in document order
+            backfill, unindexed = [], []
+            for chunk_id, chunk_index, content_hash, text in cursor.fetchall():
+                if content_hash == UNINDEXED_HASH:
+                    unindexed.append(chunk_id)  # left over from a sync that did not finish
+                    continue
+                if content_hash is None:
+                    content_hash = chunk_hash(text)
+                    backfill.append((content_hash, chunk_id))
+                stored.setdefault(content_hash, []).append((chunk_id, chunk_index))
+
+            unchanged, moved, to_insert = [], [], []
+            for idx, chunk_text, content_hash in new_chunks:
+                matches = stored.get(content_hash)
+                if matches:
+                    chunk_id, old_index = matches.pop(0)
+                    unchanged.append(chunk_id)
+                    if old_index != idx:
+                        moved.append((chunk_id, idx))
+                else:
+                    to_insert.append((url_id, idx, chunk_text, chunk_text[:100], created_at, content_hash))
+            removed = sorted(unindexed + [chunk_id for matches in stored.values() for chunk_id, _ in matches])
+
+            if backfill:
+                cursor.executemany("UPDATE chunks SET content_hash=? WHERE id=?", backfill)
+            if moved:
+                cursor.executemany("UPDATE chunks SET chunk_index=? WHERE id=?", [(idx, chunk_id) for chunk_id, idx in moved])
+
+            cursor.execute("SELECT COALESCE(MAX(id), 0) FROM chunks")
+            last_id = cursor.fetchone()[0]
+            cursor.executemany("""
+                INSERT INTO chunks (url_id, chunk_index, text, snippet, created_at, content_hash)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, [(*row[:-1], UNINDEXED_HASH) for row in to_insert])
+            # The write lock is held, so every id above last_id for this URL is ours, in insert order
+            cursor.execute(
+                "SELECT id FROM chunks WHERE url_id=? AND id>? ORDER BY id", (url_id, last_id)
+            )
+            new_ids = [row[0] for row in cursor.fetchall()]
+
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+
+    return {
+        "url_id": url_id,
+        "added": [(row[1], new_id) for new_id, row in zip(new_ids, to_insert)],
+        "removed": removed,
+        "unchanged": unchanged,
+        "moved": moved,
+        "hashes": [(row[-1], new_id) for new_id, row in zip(new_ids, to_insert)],
+        "chunk_count": len(new_chunks),
+    }
+
+def finish_chunk_sync(diff):
+    """
+    Complete a sync_chunks diff once FAISS reflects it.
+
+    Stores the content hashes of the new rows, deletes the removed rows and
+    updates the URL's chunk count, in one transaction.
+
+    Args:
+        diff (Dict): Result of sync_chunks.
+    """
+    with _write_lock:
+        connection = _writer()
+        cursor = connection.cursor()
+        cursor.execute("BEGIN IMMEDIATE;")
+        try:
+            cursor.executemany("UPDATE chunks SET content_hash=? WHERE id=?", diff["hashes"])
+            cursor.executemany("DELETE FROM chunks WHERE id=?", [(chunk_id,) for chunk_id in diff["removed"]])
+            cursor.execute("UPDATE urls SET chunk_count=? WHERE id=?", (diff["chunk_count"], diff["url_id"]))
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
 
 def insert_urls(url):
     """
@@ -96,79 +370,110 @@ def insert_urls(url):
     Returns:
         int: The auto-generated ID of the inserted URL
     """
-    cursor = conn.cursor()
     submitted_at = datetime.utcnow().isoformat()
 
-    try:
-        cursor.execute("""
-            INSERT INTO urls (url, submitted_at)
-            VALUES (?, ?)
-        """, (url, submitted_at))
-        conn.commit()
-        url_id = cursor.lastrowid
-        return url_id
-
-    except sqlite3.IntegrityError:
-        # URL already exists, fetch its ID
-        cursor.execute("SELECT id FROM urls WHERE url=?", (url,))
-        url_id = cursor.fetchone()[0]
-        return url_id
+    with _write_lock:
+        connection = _writer()
+        cursor = connection.cursor()
+        try:
+            cursor.execute("""
+                INSERT INTO urls (url, submitted_at)
+                VALUES (?, ?)
+            """, (url, submitted_at))
+            connection.commit()
+            url_id = cursor.lastrowid
+            return url_id
+
+        except sqlite3.IntegrityError:
+            connection.rollback()
+            # URL already exists, fetch its ID
+            cursor.execute("SELECT id FROM urls WHERE url=?", (url,))
+            url_id = cursor.fetchone()[0]
+            return url_id
     
 def load_db_as_pandas() : 
-    urls_df = pd.read_sql_query("SELECT * FROM urls", conn)
-    chunks_df = pd.read_sql_query("SELECT * FROM chunks", conn)
+    import pandas as pd
+
+    with read_connection() as connection:
+        urls_df = pd.read_sql_query("SELECT * FROM urls", connection)
+        chunks_df = pd.read_sql_query("SELECT * FROM chunks", connection)
   
     return urls_df, chunks_df
 
 def drop_tables():
     """Delete all tables (urls and chunks) from the SQLite database."""
     
-    cursor = conn.cursor()
+    with _write_lock:
+        connection = _writer()
+        cursor = connection.cursor()
 
-    # Drop tables if they exist
-    cursor.execute("DROP TABLE IF EXISTS chunks;")
-    cursor.execute("DROP TABLE IF EXISTS urls;")
+        # Drop tables if they exist
+        cursor.execute("DROP TABLE IF EXISTS chunks;")
+        cursor.execute("DROP TABLE IF EXISTS urls;")
 
-    conn.commit()
+        connection.commit()
     print("✅ Tables 'urls' and 'chunks' dropped successfully.")
 
 def update_url_status(url, status, chunk_count=None, error_message=None):
     """
     Update the status, timestamps, and metadata of a given URL in the 'urls' table.
     """
-    cursor = conn.cursor()
-
     timestamp = datetime.utcnow().isoformat()
 
-    if status == "in_progress":
-        cursor.execute("""
-            UPDATE urls
-            SET status=?, started_at=?
-            WHERE url=?;
-        """, (status, timestamp, url))
-
-    elif status == "completed":
-        cursor.execute("""
-            UPDATE urls
-            SET status=?, completed_at=?, chunk_count=?
-            WHERE url=?;
-        """, (status, timestamp, chunk_count, url))
-
-    elif status == "failed":
-        cursor.execute("""
-            UPDATE urls
-            SET status=?, completed_at=?, error_message=?
-            WHERE url=?;
-        """, (status, timestamp, error_message, url))
-
-    else:
-        cursor.execute("""
-            UPDATE urls
-            SET status=?
-            WHERE url=?;
-        """, (status, url))
+    with _write_lock:
+        connection = _writer()
+        cursor = connection.cursor()
+
+        if status == "in_progress":
+            cursor.execute("""
+                UPDATE urls
+                SET status=?, started_at=?
+                WHERE url=?;
+            """, (status, timestamp, url))
+
+        elif status == "completed":
+            # chunk_count=None keeps the stored count (e.g. page not modified)
+            cursor.execute("""
+                UPDATE urls
+                SET status=?, completed_at=?, chunk_count=COALESCE(?, chunk_count)
+                WHERE url=?;
+            """, (status, timestamp, chunk_count, url))
+
+        elif status == "failed":
+            cursor.execute("""
+                UPDATE urls
+                SET status=?, completed_at=?, error_message=?
+                WHERE url=?;
+            """, (status, timestamp, error_message, url))
+
+        else:
+            cursor.execute("""
+                UPDATE urls
+                SET status=?
+                WHERE url=?;
+            """, (status, url))
+
+        connection.commit()
+
+def get_url_validators(url):
+    """
+    Return the HTTP cache validators stored from the last successful crawl of a URL.
 
-    conn.commit()
+    Returns:
+        Tuple[str, str]: (etag, last_modified); (None, None) if unknown.
+    """
+    with read_connection() as connection:
+        row = connection.execute(
+            "SELECT etag, last_modified FROM urls WHERE url=? AND status='completed'", (url,)
+        ).fetchone()
+    return (row[0], row[1]) if row else (None, None)
+
+def update_url_validators(url, etag, last_modified):
+    """Store the ETag / Last-Modified of the version of a URL that was just ingested."""
+    with _write_lock:
+        connection = _writer()
+        connection.execute("UPDATE urls SET etag=?, last_modified=? WHERE url=?;", (etag, last_modified, url))
+        connection.commit()
 
 def get_chunks_from_db(faiss_ids):
     """
@@ -179,7 +484,7 @@ def get_chunks_from_db(faiss_ids):
         faiss_ids: list of FAISS IDs (integers or strings)
 
     Returns:
-        List of dicts: [{"chunk_index": int, "text": str, "snippet": str, "faiss_id": str}, ...]
+        List of dicts: [{"chunk_index": int, "url_id": int, "text": str, "snippet": str, "faiss_id": str}, ...]
     """
 
     if not faiss_ids:
@@ -188,15 +493,14 @@ def get_chunks_from_db(faiss_ids):
     # Build SQL placeholders dynamically
     placeholders = ",".join("?" for _ in faiss_ids)
     query = f"""
-        SELECT id, chunk_index, text, snippet
+        SELECT id, chunk_index, text, snippet, url_id
         FROM chunks
         WHERE id IN ({placeholders})
     """
 
-    conn = conn = sqlite3.connect("rag_metadata.db", check_same_thread=False)  # 👈 IMPORTANT FIX
-    cursor = conn.cursor()
-    cursor.execute(query, tuple(faiss_ids))
-    rows = cursor.fetchall()
+    # Pooled read-only connection: no connect cost, and WAL keeps it from blocking on ingestion
+    with read_connection() as connection:
+        rows = connection.execute(query, tuple(faiss_ids)).fetchall()
 
     # Convert to list of dictionaries
     chunks = [
@@ -204,7 +508,8 @@ def get_chunks_from_db(faiss_ids):
             "faiss_id": row[0],
             "chunk_index": row[1],
             "text": row[2],
-            "snippet": row[3]
+            "snippet": row[3],
+            "url_id": row[4]
         }
         for row in rows
     ]
@@ -216,6 +521,7 @@ def get_chunks_from_db(faiss_ids):
 
 if __name__ == '__main__' : 
 
+    create_tables()
     drop_tables()
     create_tables()
 
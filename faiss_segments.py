@@ -0,0 +1,458 @@
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import faiss
+import numpy as np
+
+from faiss_utils import (
+    build_faiss_index, combine_fingerprints, fingerprint_ids, get_index_contents, get_index_ids, load_faiss_index,
+    save_faiss_index, selector_search_params,
+)
+
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = "manifest.lock"
+# Single-file index written before segment stores; imported as the first segment
+LEGACY_INDEX_FILE = "faiss_index.idx"
+
+# Serializes manifest updates between threads of this process; flock covers other processes
+_manifest_thread_lock = threading.Lock()
+_compactor_thread = None
+
+
+class SegmentedIndex:
+    """
+    Read-only view over the live segments of a segment store.
+
+    Exposes the subset of the FAISS index API the query path uses (search,
+    ntotal, d), searching every segment and merging the per-segment top-k.
+    Segments are immutable, so a reload can reuse already-loaded segments.
+    """
+
+    def __init__(self, segments, dimension, generation, modes=None, fingerprints=None):
+        self.segments = segments  # {name: faiss.Index}, in manifest order
+        self.d = dimension
+        self.generation = generation
+        self.modes = modes or {}  # {name: load mode actually used}
+        self.fingerprints = fingerprints or {}  # {name: fingerprint_ids of the segment}
+
+    @property
+    def ntotal(self):
+        return sum(index.ntotal for index in self.segments.values())
+
+    @property
+    def id_fingerprint(self):
+        """Fingerprint of all live ids; compaction moves ids between segments without changing it."""
+        return combine_fingerprints(self.fingerprints.values())
+
+    def search(self, x, k, selector=None):
+        """
+        Search all segments and merge results; same return shape as faiss.Index.search.
+
+        A selector (faiss.IDSelector over FAISS ids) restricts every segment's scan.
+        """
+        x = np.ascontiguousarray(x, dtype='float32')
+        n = x.shape[0]
+        if not self.segments:
+            return np.full((n, k), np.inf, dtype='float32'), np.full((n, k), -1, dtype='int64')
+
+        all_distances, all_ids = [], []
+        for index in self.segments.values():
+            if selector is None:
+                distances, ids = index.search(x, k)
+            else:
+                distances, ids = index.search(x, k, params=selector_search_params(index, selector))
+            all_distances.append(distances)
+            all_ids.append(ids)
+
+        distances = np.concatenate(all_distances, axis=1)
+        ids = np.concatenate(all_ids, axis=1)
+        # Empty slots come back as id -1; push them to the end
+        distances = np.where(ids == -1, np.inf, distances)
+
+        order = np.argsort(distances, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(distances, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+
+def is_segment_store(path):
+    """A path without a file extension (or an existing directory) is a segment store."""
+    return os.path.isdir(path) or os.path.splitext(path)[1] == ""
+
+
+def _empty_manifest(dimension):
+    return {
+        "generation": 0,
+        "dimension": dimension,
+        "next_segment_id": 1,
+        "segments": [],
+        "retired": [],
+    }
+
+
+def read_manifest(segment_dir, dimension=384):
+    """
+    Read the manifest of a segment store.
+
+    Args:
+        segment_dir (str): Directory holding segments and manifest.
+        dimension (int): Embedding dimension used when the store is empty.
+
+    Returns:
+        Dict: The manifest (an empty one if the store does not exist yet).
+    """
+    path = os.path.join(segment_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return _empty_manifest(dimension)
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_manifest(segment_dir, manifest):
+    """Atomically publish a new manifest."""
+    path = os.path.join(segment_dir, MANIFEST_FILE)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def _manifest_lock(segment_dir):
+    """Exclusive lock on the manifest across threads and processes."""
+    os.makedirs(segment_dir, exist_ok=True)
+    with _manifest_thread_lock:
+        with open(os.path.join(segment_dir, LOCK_FILE), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _segment_name(segment_id):
+    return f"seg-{segment_id:06d}.idx"
+
+
+def init_segment_store(segment_dir, dimension=384, legacy_file=None):
+    """
+    Create the segment store if needed, importing a legacy single-file index as its first segment.
+
+    Args:
+        segment_dir (str): Directory holding segments and manifest.
+        dimension (int): Embedding dimension.
+        legacy_file (str, optional): Existing faiss_index.idx to migrate.
+    """
+    with _manifest_lock(segment_dir):
+        if os.path.exists(os.path.join(segment_dir, MANIFEST_FILE)):
+            return
+
+        manifest = _empty_manifest(dimension)
+        if legacy_file and os.path.exists(legacy_file):
+            index = load_faiss_index(legacy_file, dimension=dimension)
+            if index.ntotal > 0:
+                name = _segment_name(manifest["next_segment_id"])
+                save_faiss_index(index, os.path.join(segment_dir, name))
+                manifest["segments"].append({
+                    "name": name,
+                    "ntotal": int(index.ntotal),
+                    "created_at": datetime.utcnow().isoformat(),
+                })
+                manifest["next_segment_id"] += 1
+                manifest["generation"] += 1
+                print(f"📦 Imported legacy index {legacy_file} as segment {name}")
+
+        _write_manifest(segment_dir, manifest)
+        print(f"✅ Segment store initialised at {os.path.abspath(segment_dir)}")
+
+
+def append_segment(segment_dir, embeddings, ids, dimension=384):
+    """
+    Write a batch of vectors as a new immutable segment and publish it.
+
+    Cost is proportional to the batch, not to the size of the store.
+
+    Args:
+        segment_dir (str): Directory holding segments and manifest.
+        embeddings (np.ndarray): Array of shape (n, dimension).
+        ids (List[int] or np.ndarray): FAISS ids (chunks.id) for the vectors.
+        dimension (int): Embedding dimension.
+
+    Returns:
+        str: Name of the new segment.
+    """
+    index = build_faiss_index(embeddings, ids, dimension=dimension, index_type="flat")
+    ids = np.asarray(ids, dtype='int64')
+
+    with _manifest_lock(segment_dir):
+        manifest = read_manifest(segment_dir, dimension)
+        name = _segment_name(manifest["next_segment_id"])
+        save_faiss_index(index, os.path.join(segment_dir, name))
+
+        manifest["segments"].append({
+            "name": name,
+            "ntotal": int(index.ntotal),
+            "created_at": datetime.utcnow().isoformat(),
+            "min_id": int(ids.min()),
+            "max_id": int(ids.max()),
+        })
+        manifest["next_segment_id"] += 1
+        manifest["generation"] += 1
+        _write_manifest(segment_dir, manifest)
+
+    print(f"➕ Appended segment {name} with {index.ntotal} vectors")
+    return name
+
+
+def load_segmented_index(segment_dir, dimension=384, mode="memory", previous=None):
+    """
+    Open every live segment listed in the manifest.
+
+    Args:
+        segment_dir (str): Directory holding segments and manifest.
+        dimension (int): Embedding dimension.
+        mode (str): Load mode for each segment ("memory" or "mmap").
+        previous (SegmentedIndex, optional): Earlier view whose loaded segments can be reused.
+
+    Returns:
+        Tuple[SegmentedIndex, str]: The view and the load mode actually used
+            ("mixed" if some segments could not use the requested mode).
+    """
+    manifest = read_manifest(segment_dir, dimension)
+    reusable = previous.segments if previous is not None else {}
+    reusable_modes = previous.modes if previous is not None else {}
+    reusable_fingerprints = previous.fingerprints if previous is not None else {}
+
+    segments, modes, fingerprints = {}, {}, {}
+    for segment in manifest["segments"]:
+        name = segment["name"]
+        if name in reusable:
+            segments[name] = reusable[name]
+            modes[name] = reusable_modes.get(name, mode)
+        else:
+            segments[name], modes[name] = load_faiss_index(
+                os.path.join(segment_dir, name), dimension=dimension, mode=mode, return_mode=True
+            )
+        fingerprints[name] = reusable_fingerprints.get(name) or fingerprint_ids(get_index_ids(segments[name]))
+
+    used = set(modes.values())
+    active_mode = used.pop() if len(used) == 1 else ("mixed" if used else mode)
+    view = SegmentedIndex(segments, manifest["dimension"], manifest["generation"], modes, fingerprints)
+    return view, active_mode
+
+
+def _purge_retired(segment_dir, manifest, grace_seconds):
+    """Delete retired segment files once readers have had time to move on. Caller holds the lock."""
+    now = time.time()
+    keep = []
+    for segment in manifest["retired"]:
+        if now - segment["retired_at"] >= grace_seconds:
+            try:
+                os.remove(os.path.join(segment_dir, segment["name"]))
+            except FileNotFoundError:
+                pass
+        else:
+            keep.append(segment)
+    changed = len(keep) != len(manifest["retired"])
+    manifest["retired"] = keep
+    return changed
+
+
+def compact_segments(segment_dir, dimension=384, small_segment_size=10_000, min_segments=4,
+                     index_type="auto", grace_seconds=60):
+    """
+    Merge small segments into one larger segment without blocking readers or appends.
+
+    The merged segment is built outside the manifest lock; the swap itself is a
+    single manifest update. Replaced segment files are deleted after grace_seconds
+    so readers still loading the previous manifest can finish.
+
+    Args:
+        segment_dir (str): Directory holding segments and manifest.
+        dimension (int): Embedding dimension.
+        small_segment_size (int): Segments below this many vectors are merge candidates.
+        min_segments (int): Only compact when at least this many small segments exist.
+        index_type (str): Index type for the merged segment (see faiss_utils.INDEX_TYPES).
+        grace_seconds (float): Delay before deleting replaced segment files.
+
+    Returns:
+        bool: True if segments were merged.
+    """
+    with _manifest_lock(segment_dir):
+        manifest = read_manifest(segment_dir, dimension)
+        if _purge_retired(segment_dir, manifest, grace_seconds):
+            _write_manifest(segment_dir, manifest)
+
+        candidates = [s["name"] for s in manifest["segments"] if s["ntotal"] < small_segment_size]
+        if len(candidates) < min_segments:
+            return False
+
+        merged_name = _segment_name(manifest["next_segment_id"])
+        manifest["next_segment_id"] += 1
+        _write_manifest(segment_dir, manifest)
+
+    # Build the merged segment without holding the lock
+    all_vectors, all_ids = [], []
+    for name in candidates:
+        vectors, ids = get_index_contents(load_faiss_index(os.path.join(segment_dir, name), dimension=dimension))
+        all_vectors.append(vectors)
+        all_ids.append(ids)
+    vectors = np.concatenate(all_vectors)
+    ids = np.concatenate(all_ids)
+
+    merged = build_faiss_index(vectors, ids, dimension=dimension, index_type=index_type)
+    save_faiss_index(merged, os.path.join(segment_dir, merged_name))
+
+    with _manifest_lock(segment_dir):
+        manifest = read_manifest(segment_dir, dimension)
+        merged_set = set(candidates)
+        if not merged_set <= {segment["name"] for segment in manifest["segments"]}:
+            # A removal rewrote one of the inputs meanwhile; merging would bring its vectors back
+            os.remove(os.path.join(segment_dir, merged_name))
+            print(f"⚠️ Segments changed during compaction, dropped {merged_name}")
+            return False
+        segments = []
+        inserted = False
+        for segment in manifest["segments"]:
+            if segment["name"] in merged_set:
+                if not inserted:
+                    segments.append({
+                        "name": merged_name,
+                        "ntotal": int(merged.ntotal),
+                        "created_at": datetime.utcnow().isoformat(),
+                        "min_id": int(ids.min()),
+                        "max_id": int(ids.max()),
+                    })
+                    inserted = True
+                manifest["retired"].append({"name": segment["name"], "retired_at": time.time()})
+            else:
+                segments.append(segment)
+        manifest["segments"] = segments
+        manifest["generation"] += 1
+        _write_manifest(segment_dir, manifest)
+
+    print(f"🧹 Compacted {len(candidates)} segments into {merged_name} ({merged.ntotal} vectors)")
+    return True
+
+
+def _remove_from_index(index, ids, dimension):
+    """
+    Remove ids from a loaded segment.
+
+    Returns:
+        Tuple[faiss.Index, int]: The index without the ids (None if nothing is
+            left) and how many vectors were removed.
+    """
+    inner = faiss.downcast_index(index.index) if hasattr(index, "id_map") else index
+    if not isinstance(inner, faiss.IndexHNSW):
+        removed = index.remove_ids(faiss.IDSelectorBatch(len(ids), faiss.swig_ptr(ids)))
+        return (index if index.ntotal else None), int(removed)
+
+    # HNSW graphs cannot drop nodes: rebuild from the remaining vectors
+    vectors, stored_ids = get_index_contents(index)
+    keep = ~np.isin(stored_ids, ids)
+    removed = int(len(keep) - keep.sum())
+    if removed == 0:
+        return index, 0
+    if not keep.any():
+        return None, removed
+    rebuilt = build_faiss_index(
+        vectors[keep], stored_ids[keep], dimension=dimension, index_type="hnsw", hnsw_m=inner.hnsw.nb_neighbors(1)
+    )
+    return rebuilt, removed
+
+
+def remove_ids_from_segments(segment_dir, ids, dimension=384):
+    """
+    Remove vectors by FAISS id from the live segments.
+
+    Segments are immutable, so each segment holding any of the ids is rewritten
+    (with remove_ids) under a new name and swapped in by one manifest update;
+    the old files are retired and deleted later by the compactor. Only segments
+    whose recorded id range overlaps the ids are opened. Holds the manifest
+    lock throughout, so appends wait and a concurrent compaction of the same
+    segments is discarded.
+
+    Args:
+        segment_dir (str): Directory holding segments and manifest.
+        ids (List[int] or np.ndarray): FAISS ids (chunks.id) to remove.
+        dimension (int): Embedding dimension.
+
+    Returns:
+        int: Number of vectors removed.
+    """
+    ids = np.unique(np.asarray(ids, dtype='int64'))
+    if len(ids) == 0:
+        return 0
+
+    total_removed = 0
+    with _manifest_lock(segment_dir):
+        manifest = read_manifest(segment_dir, dimension)
+        segments = []
+        for segment in manifest["segments"]:
+            low, high = segment.get("min_id"), segment.get("max_id")
+            if low is not None and not np.any((ids >= low) & (ids <= high)):
+                segments.append(segment)
+                continue
+
+            index = load_faiss_index(os.path.join(segment_dir, segment["name"]), dimension=dimension)
+            index, removed = _remove_from_index(index, ids, dimension)
+            if removed == 0:
+                segments.append(segment)
+                continue
+
+            total_removed += removed
+            manifest["retired"].append({"name": segment["name"], "retired_at": time.time()})
+            if index is None:
+                continue  # every vector was removed: drop the segment
+            name = _segment_name(manifest["next_segment_id"])
+            manifest["next_segment_id"] += 1
+            save_faiss_index(index, os.path.join(segment_dir, name))
+            segments.append({**segment, "name": name, "ntotal": int(index.ntotal)})
+
+        if total_removed:
+            manifest["segments"] = segments
+            manifest["generation"] += 1
+            _write_manifest(segment_dir, manifest)
+
+    if total_removed:
+        print(f"➖ Removed {total_removed} vectors from segments in {segment_dir}")
+    return total_removed
+
+
+def start_compactor(segment_dir, dimension=384, interval=60.0, **compact_kwargs):
+    """
+    Start a daemon thread that periodically compacts small segments.
+
+    Args:
+        segment_dir (str): Directory holding segments and manifest.
+        dimension (int): Embedding dimension.
+        interval (float): Seconds between compaction passes.
+        **compact_kwargs: Passed to compact_segments.
+
+    Returns:
+        threading.Thread: The compactor thread (only one is started per process).
+    """
+    global _compactor_thread
+
+    if _compactor_thread is not None and _compactor_thread.is_alive():
+        return _compactor_thread
+
+    def _compact():
+        while True:
+            time.sleep(interval)
+            try:
+                while compact_segments(segment_dir, dimension=dimension, **compact_kwargs):
+                    pass
+            except Exception as e:
+                print(f"[ERROR] Segment compaction failed: {e}")
+
+    _compactor_thread = threading.Thread(target=_compact, name="faiss-segment-compactor", daemon=True)
+    _compactor_thread.start()
+    return _compactor_thread
+
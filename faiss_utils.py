@@ -1,52 +1,563 @@
 import faiss
 import numpy as np
 import os
+import threading
+import time
 
-from get_data import fetch_html, extract_text_from_html
-from text_utils import chunk_text, get_embeddings
+# Process-wide resident index, shared by every query in this process
+_resident_lock = threading.Lock()
+_resident = {
+    "index": None,
+    "path": None,
+    "stamp": None,
+    # Fingerprint of the live FAISS ids; unchanged by compaction, unlike the stamp
+    "generation": None,
+    # "memory" reads a private copy; "mmap" maps the file read-only (query processes only)
+    "mode": os.environ.get("FAISS_LOAD_MODE", "memory"),
+}
+_watcher_thread = None
+
+# Query-time parameters for approximate indexes, adjustable at runtime
+_search_params = {
+    "nprobe": int(os.environ["FAISS_NPROBE"]) if os.environ.get("FAISS_NPROBE") else None,
+    "ef_search": int(os.environ["FAISS_EF_SEARCH"]) if os.environ.get("FAISS_EF_SEARCH") else None,
+}
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+LOAD_MODES = ("memory", "mmap")
 
 def save_faiss_index(index, file_path="faiss_index.idx"):
-    """Persist the FAISS index to disk."""
-    faiss.write_index(index, file_path)
+    """
+    Persist the FAISS index to disk.
+
+    The index is written to a temporary file first and then moved into place,
+    so readers never observe a half-written index file.
+    """
+    tmp_path = f"{file_path}.tmp"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, file_path)
     print(f"✅ FAISS index saved to {os.path.abspath(file_path)}")
 
 
-def load_faiss_index(file_path="faiss_index.idx", dimension=384):
-    """Load FAISS index from disk if it exists, otherwise create a new one."""
+def _read_index_mmap(file_path):
+    """
+    Memory-map an index file read-only so its pages live in the shared OS page cache.
+
+    Returns:
+        Tuple[faiss.Index, str]: The index and the mode actually used
+            ("memory" if this FAISS build cannot map the index type).
+    """
+    flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    # Newer FAISS can also map the codes of flat indexes, but that flag rejects IVF
+    # indexes, whose inverted lists plain IO_FLAG_MMAP maps; try both before copying
+    ifc_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+    error = None
+    for attempt in ((flags | ifc_flag, flags) if ifc_flag else (flags,)):
+        try:
+            return faiss.read_index(file_path, attempt), "mmap"
+        except RuntimeError as e:
+            error = e
+    print(f"⚠️ Could not memory-map {file_path} ({error}); falling back to an in-memory copy.")
+    return faiss.read_index(file_path), "memory"
+
+
+def load_faiss_index(file_path="faiss_index.idx", dimension=384, mode="memory", return_mode=False):
+    """
+    Load FAISS index from disk if it exists, otherwise create a new one.
+
+    Args:
+        file_path (str): Path to the FAISS index file.
+        dimension (int): Embedding dimension used when no index exists yet.
+        mode (str): "memory" for a private, writable copy; "mmap" for a read-only
+            memory-mapped index shared across processes (never use it in the writer).
+        return_mode (bool): Also return the mode that was actually used.
+
+    Returns:
+        faiss.Index, or Tuple[faiss.Index, str] with return_mode.
+    """
+    if mode not in LOAD_MODES:
+        raise ValueError(f"Unknown load mode: {mode}")
+
     if os.path.exists(file_path):
-        index = faiss.read_index(file_path)
-        print(f"✅ Loaded FAISS index from {os.path.abspath(file_path)}")
+        if mode == "mmap":
+            index, mode = _read_index_mmap(file_path)
+        else:
+            index = faiss.read_index(file_path)
+        print(f"✅ Loaded FAISS index from {os.path.abspath(file_path)} ({mode})")
     else:
         index = faiss.IndexFlatL2(dimension)
+        mode = "memory"
         print("⚠️ No existing index found. Created a new one.")
+    set_search_params(index, **_search_params)
+
+    if return_mode:
+        return index, mode
     return index
 
-def create_faiss_index(embeddings, ids=None, dimension=384):
+def get_index_stamp(file_path="faiss_index.idx"):
     """
-    Create a new FAISS index and add embeddings.
+    Return the identity of the index file currently on disk.
 
     Args:
-        embeddings (np.ndarray): Array of shape (num_chunks, embedding_dim)
-        ids (np.ndarray or List[int], optional): Array of integer IDs corresponding to embeddings.
-        dimension (int): Dimension of embeddings (default=384 for MiniLM).
+        file_path (str): Path to the FAISS index file.
+
+    For a segment store this is the identity of its manifest, which is
+    replaced atomically whenever a segment is added or compacted.
+
+    Returns:
+        Tuple[int, int, int] or None: (inode, mtime_ns, size), or None if the file does not exist.
+    """
+    from faiss_segments import MANIFEST_FILE, is_segment_store  # avoid circular import
+
+    if is_segment_store(file_path):
+        file_path = os.path.join(file_path, MANIFEST_FILE)
+    try:
+        st = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def refresh_resident_index(file_path="faiss_index.idx", dimension=384, force=False):
+    """
+    Reload the resident index if a newer version has been published on disk.
+
+    The new index is read outside the lock and swapped in with a single
+    assignment, so in-flight searches keep using the index object they already hold.
+
+    Args:
+        file_path (str): Path to the FAISS index file or segment store directory.
+        dimension (int): Embedding dimension used when no index exists yet.
+        force (bool): Reload even if the file identity has not changed.
+
+    Returns:
+        bool: True if a new index was swapped in.
+    """
+    stamp = get_index_stamp(file_path)
+    if not force and _resident["index"] is not None and _resident["path"] == file_path \
+            and _resident["stamp"] == stamp:
+        return False
+
+    previous = _resident["index"] if _resident["path"] == file_path else None
+    index, mode = _load_resident(file_path, dimension, previous)
+
+    generation = _index_generation(index)
+
+    with _resident_lock:
+        _resident["index"] = index
+        _resident["path"] = file_path
+        _resident["stamp"] = stamp
+        _resident["generation"] = generation
+        _resident["active_mode"] = mode
+
+    print(f"🔄 Resident FAISS index loaded ({index.ntotal} vectors)")
+    return True
+
+
+def _load_resident(file_path, dimension, previous=None):
+    """Load a single index file or, for a segment store, all of its live segments."""
+    from faiss_segments import (  # avoid circular import
+        LEGACY_INDEX_FILE, MANIFEST_FILE, init_segment_store, is_segment_store, load_segmented_index,
+    )
+
+    if is_segment_store(file_path):
+        if not os.path.exists(os.path.join(file_path, MANIFEST_FILE)) and os.path.exists(LEGACY_INDEX_FILE):
+            # No ingest has created the store yet: serve the legacy index instead of an empty one
+            init_segment_store(file_path, dimension=dimension, legacy_file=LEGACY_INDEX_FILE)
+        if not hasattr(previous, "segments"):
+            previous = None
+        return load_segmented_index(file_path, dimension=dimension, mode=_resident["mode"], previous=previous)
+    return load_faiss_index(file_path, dimension=dimension, mode=_resident["mode"], return_mode=True)
+
+
+def _index_generation(index):
+    """Fingerprint of the ids an index serves; segment views reuse their per-segment fingerprints."""
+    if hasattr(index, "id_fingerprint"):
+        return index.id_fingerprint
+    return fingerprint_ids(get_index_ids(index))
+
+
+def get_resident_index(file_path="faiss_index.idx", dimension=384):
+    """
+    Return the in-memory FAISS index, loading it on first use.
+
+    Args:
+        file_path (str): Path to the FAISS index file or segment store directory.
+        dimension (int): Embedding dimension used when no index exists yet.
+
+    Returns:
+        faiss.Index: The resident index.
+    """
+    index = _resident["index"]
+    if index is None or _resident["path"] != file_path:
+        with _resident_lock:
+            index = _resident["index"]
+            if index is None or _resident["path"] != file_path:
+                stamp = get_index_stamp(file_path)
+                index, mode = _load_resident(file_path, dimension)
+                _resident["index"] = index
+                _resident["path"] = file_path
+                _resident["stamp"] = stamp
+                _resident["generation"] = _index_generation(index)
+                _resident["active_mode"] = mode
+    return index
+
+
+def set_resident_load_mode(mode):
+    """
+    Choose how the resident index is loaded; call once at process startup.
+
+    Args:
+        mode (str): "memory" or "mmap".
+    """
+    if mode not in LOAD_MODES:
+        raise ValueError(f"Unknown load mode: {mode}")
+    _resident["mode"] = mode
+
+
+def get_resident_index_info():
+    """
+    Describe the resident index.
+
+    Returns:
+        Dict: path, requested and active load mode, vector count, file stamp and id generation;
+            for a segment store also the mode each segment was loaded with.
+    """
+    index = _resident["index"]
+    info = {
+        "path": _resident["path"],
+        "requested_mode": _resident["mode"],
+        "active_mode": _resident.get("active_mode"),
+        "ntotal": index.ntotal if index is not None else None,
+        "stamp": _resident["stamp"],
+        "generation": _resident["generation"],
+    }
+    if hasattr(index, "modes"):
+        info["segment_modes"] = dict(index.modes)
+    return info
+
+
+def configure_search_params(nprobe=None, ef_search=None):
+    """
+    Change nprobe / efSearch for every index loaded from now on and for the resident index.
+
+    Args:
+        nprobe (int, optional): Number of IVF lists to visit per query.
+        ef_search (int, optional): HNSW search-time candidate list size.
+
+    Returns:
+        Dict: The active search parameters.
+    """
+    if nprobe is not None:
+        _search_params["nprobe"] = nprobe
+    if ef_search is not None:
+        _search_params["ef_search"] = ef_search
+
+    index = _resident["index"]
+    if index is not None:
+        set_search_params(index, **_search_params)
+    return dict(_search_params)
+
+
+def get_resident_stamp():
+    """Return the file identity of the currently resident index."""
+    return _resident["stamp"]
+
+
+def get_resident_generation():
+    """
+    Return the generation of the resident index: a fingerprint of the ids it serves.
+
+    Appends and removals change it; compaction and rewriting the same vectors do not.
+    """
+    return _resident["generation"]
+
+
+def start_index_watcher(file_path="faiss_index.idx", dimension=384, interval=2.0, mode=None):
+    """
+    Start a daemon thread that hot-swaps the resident index when the worker saves a new one.
+
+    Args:
+        file_path (str): Path to the FAISS index file.
+        dimension (int): Embedding dimension used when no index exists yet.
+        interval (float): Seconds between checks of the index file.
+        mode (str, optional): Load mode for the resident index ("memory" or "mmap").
+
+    Returns:
+        threading.Thread: The watcher thread (only one is started per process).
+    """
+    global _watcher_thread
+
+    if _watcher_thread is not None and _watcher_thread.is_alive():
+        return _watcher_thread
+
+    def _watch():
+        while True:
+            time.sleep(interval)
+            try:
+                refresh_resident_index(file_path, dimension=dimension)
+            except Exception as e:
+                print(f"[ERROR] Failed to refresh FAISS index: {e}")
+
+    if mode is not None:
+        set_resident_load_mode(mode)
+    get_resident_index(file_path, dimension=dimension)
+    _watcher_thread = threading.Thread(target=_watch, name="faiss-index-watcher", daemon=True)
+    _watcher_thread.start()
+    return _watcher_thread
+
+
+def _pq_subquantizers(dimension):
+    """Pick a PQ sub-quantizer count that divides the dimension (~8 dims each)."""
+    for m in (64, 48, 32, 24, 16, 12, 8, 4, 2):
+        if dimension % m == 0 and dimension // m >= 4:
+            return m
+    return 1
+
+
+def estimate_index_memory(index_type, num_vectors, dimension=384, hnsw_m=32, pq_m=None):
+    """
+    Rough memory footprint of an index, in bytes.
+
+    Args:
+        index_type (str): One of INDEX_TYPES.
+        num_vectors (int): Number of stored vectors.
+        dimension (int): Embedding dimension.
+        hnsw_m (int): HNSW neighbours per node.
+        pq_m (int, optional): PQ sub-quantizers (bytes per code).
+
+    Returns:
+        int: Estimated bytes.
+    """
+    id_bytes = 8
+    if index_type == "flat":
+        return num_vectors * (dimension * 4 + id_bytes)
+    if index_type == "hnsw":
+        return num_vectors * (dimension * 4 + hnsw_m * 2 * 4 + id_bytes)
+    if index_type == "ivf_flat":
+        return num_vectors * (dimension * 4 + id_bytes)
+    if index_type == "ivf_pq":
+        return num_vectors * ((pq_m or _pq_subquantizers(dimension)) + id_bytes)
+    raise ValueError(f"Unknown index type: {index_type}")
+
+
+def choose_index_type(num_vectors, dimension=384, memory_budget_mb=None):
+    """
+    Pick an index type from the corpus size and memory budget.
+
+    Small corpora stay exact (flat). Up to ~1M vectors HNSW gives the best
+    latency/recall if its graph fits in memory; beyond that, or when memory is
+    tight, IVF-Flat and then IVF-PQ trade recall for footprint.
+
+    Args:
+        num_vectors (int): Number of vectors to index.
+        dimension (int): Embedding dimension.
+        memory_budget_mb (float, optional): Memory available for the index.
 
     Returns:
-        faiss.IndexIDMap: FAISS index with added embeddings.
+        str: One of INDEX_TYPES.
+    """
+    budget = memory_budget_mb * 2 ** 20 if memory_budget_mb else float("inf")
+
+    if num_vectors < 10_000 and estimate_index_memory("flat", num_vectors, dimension) <= budget:
+        return "flat"
+    if num_vectors <= 1_000_000 and estimate_index_memory("hnsw", num_vectors, dimension) <= budget:
+        return "hnsw"
+    if estimate_index_memory("ivf_flat", num_vectors, dimension) <= budget:
+        return "ivf_flat"
+    return "ivf_pq"
+
+
+def _default_nlist(num_vectors):
+    """~4*sqrt(n) inverted lists, keeping at least 39 training points per list."""
+    return max(1, min(int(4 * np.sqrt(num_vectors)), num_vectors // 39))
+
+
+def build_faiss_index(embeddings, ids=None, dimension=384, index_type="flat", memory_budget_mb=None,
+                      nlist=None, hnsw_m=32, pq_m=None, seed=0):
+    """
+    Build (and train, if needed) an ID-mapped FAISS index over the given vectors.
+
+    IVF indexes are trained on a random sample of the vectors (up to 256 per list).
+    IVF types keep ids natively; flat and HNSW are wrapped in IndexIDMap.
+
+    Args:
+        embeddings (np.ndarray): Array of shape (num_chunks, embedding_dim).
+        ids (np.ndarray or List[int], optional): Integer IDs for the embeddings.
+        dimension (int): Dimension of embeddings.
+        index_type (str): One of INDEX_TYPES, or "auto" to use choose_index_type.
+        memory_budget_mb (float, optional): Budget used by "auto".
+        nlist (int, optional): IVF list count (default ~4*sqrt(n)).
+        hnsw_m (int): HNSW neighbours per node.
+        pq_m (int, optional): PQ sub-quantizers (default ~8 dims each).
+        seed (int): Seed for the training sample.
+
+    Returns:
+        faiss.Index: Populated index.
     """
     if embeddings is None or len(embeddings) == 0:
         raise ValueError("Embeddings array is empty.")
 
-    # Create a flat L2 index
-    index = faiss.IndexIDMap(faiss.IndexFlatL2(dimension))
-
-    # If no IDs provided, use sequential integers
+    embeddings = np.array(embeddings).astype('float32')
     if ids is None:
         ids = np.arange(len(embeddings))
-
-    embeddings = np.array(embeddings).astype('float32')
     ids = np.array(ids).astype('int64')
+    num_vectors = len(embeddings)
+
+    if index_type == "auto":
+        index_type = choose_index_type(num_vectors, dimension, memory_budget_mb)
+
+    if index_type == "flat":
+        index = faiss.IndexIDMap(faiss.IndexFlatL2(dimension))
+    elif index_type == "hnsw":
+        index = faiss.IndexIDMap(faiss.IndexHNSWFlat(dimension, hnsw_m))
+    elif index_type in ("ivf_flat", "ivf_pq"):
+        nlist = nlist or _default_nlist(num_vectors)
+        quantizer = faiss.IndexFlatL2(dimension)
+        if index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dimension, nlist, pq_m or _pq_subquantizers(dimension), 8)
+
+        rng = np.random.default_rng(seed)
+        sample_size = min(num_vectors, 256 * nlist)
+        sample = embeddings[rng.choice(num_vectors, sample_size, replace=False)]
+        print(f"🏋️ Training {index_type} index (nlist={nlist}) on {sample_size} vectors...")
+        index.train(sample)
+    else:
+        raise ValueError(f"Unknown index type: {index_type}")
 
     index.add_with_ids(embeddings, ids)
+    set_search_params(index, **_search_params)
+    print(f"✅ Built {index_type} index with {index.ntotal} vectors")
+    return index
+
+
+def set_search_params(index, nprobe=None, ef_search=None):
+    """
+    Apply query-time parameters to whichever index type this is.
+
+    Args:
+        index (faiss.Index): Index to tune (ID-mapped, or a SegmentedIndex).
+        nprobe (int, optional): IVF lists visited per query.
+        ef_search (int, optional): HNSW candidate list size.
+    """
+    if hasattr(index, "segments"):
+        for segment in index.segments.values():
+            set_search_params(segment, nprobe=nprobe, ef_search=ef_search)
+        return
+
+    if nprobe is not None:
+        try:
+            faiss.extract_index_ivf(index).nprobe = nprobe
+        except RuntimeError:
+            pass  # not an IVF index
+
+    if ef_search is not None:
+        inner = faiss.downcast_index(index.index) if hasattr(index, "id_map") else index
+        if isinstance(inner, faiss.IndexHNSW):
+            inner.hnsw.efSearch = ef_search
+
+
+def get_index_ids(index):
+    """
+    Return the FAISS ids stored in an index, without reconstructing any vectors.
+
+    Args:
+        index (faiss.Index): Flat, ID-mapped or IVF index.
+
+    Returns:
+        np.ndarray: int64 ids (positions for a plain index without ids).
+    """
+    if hasattr(index, "id_map"):
+        return faiss.vector_to_array(index.id_map).astype('int64')
+
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return np.arange(index.ntotal, dtype='int64')
+
+    ids = []
+    for list_no in range(ivf.nlist):
+        size = ivf.invlists.list_size(list_no)
+        if size:
+            ids.append(faiss.rev_swig_ptr(ivf.invlists.get_ids(list_no), size).copy())
+    return np.concatenate(ids).astype('int64') if ids else np.zeros(0, dtype='int64')
+
+
+def fingerprint_ids(ids):
+    """
+    Order-independent fingerprint of a set of FAISS ids.
+
+    Each id is mixed with splitmix64 and the results are summed modulo 2**64, so
+    the fingerprint of disjoint id sets combines by addition (see
+    combine_fingerprints) and merging segments leaves it unchanged.
+
+    Args:
+        ids (np.ndarray or List[int]): FAISS ids.
+
+    Returns:
+        Tuple[int, int]: (number of ids, hash sum).
+    """
+    z = np.asarray(ids, dtype='int64').view('uint64') + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    z = z ^ (z >> np.uint64(31))
+    return int(len(z)), int(z.sum(dtype='uint64'))
+
+
+def combine_fingerprints(fingerprints):
+    """Fingerprint of the union of disjoint id sets, from their fingerprint_ids results."""
+    count, total = 0, 0
+    for n, h in fingerprints:
+        count += n
+        total = (total + h) % (1 << 64)
+    return count, total
+
+
+def get_index_contents(index):
+    """
+    Recover all stored vectors and their ids from an index.
+
+    Args:
+        index (faiss.Index): Flat, ID-mapped or IVF index.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (vectors of shape (ntotal, d), int64 ids).
+    """
+    ids = get_index_ids(index)
+    if hasattr(index, "id_map"):
+        vectors = faiss.downcast_index(index.index).reconstruct_n(0, index.ntotal)
+        return vectors, ids
+
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        # Plain index without ids: positions are the ids
+        return index.reconstruct_n(0, index.ntotal), ids
+
+    ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+    vectors = ivf.reconstruct_batch(ids) if len(ids) else np.zeros((0, ivf.d), dtype='float32')
+    return vectors, ids
+
+
+def create_faiss_index(embeddings, ids=None, dimension=384, index_type="flat", memory_budget_mb=None):
+    """
+    Create a new FAISS index and add embeddings.
+
+    Args:
+        embeddings (np.ndarray): Array of shape (num_chunks, embedding_dim)
+        ids (np.ndarray or List[int], optional): Array of integer IDs corresponding to embeddings.
+        dimension (int): Dimension of embeddings (default=384 for MiniLM).
+        index_type (str): One of INDEX_TYPES or "auto" (default "flat").
+        memory_budget_mb (float, optional): Memory budget used by "auto".
+
+    Returns:
+        faiss.Index: FAISS index with added embeddings.
+    """
+    index = build_faiss_index(
+        embeddings, ids, dimension=dimension, index_type=index_type, memory_budget_mb=memory_budget_mb
+    )
 
     save_faiss_index(index)
     return index
@@ -69,7 +580,47 @@ def add_embeddings_to_index(index, embeddings, ids):
     index.add_with_ids(embeddings, ids)
 
 
-def search_faiss_index(index, query_embedding, top_k=5):
+def selector_search_params(index, selector):
+    """
+    Wrap an IDSelector in search parameters matching the index type.
+
+    Type-specific parameters carry the index's current nprobe / efSearch, since
+    passing parameters to FAISS overrides the values set on the index.
+
+    Args:
+        index (faiss.Index): Single FAISS index (ID-mapped or not).
+        selector (faiss.IDSelector): Ids eligible for this search.
+
+    Returns:
+        faiss.SearchParameters
+    """
+    try:
+        ivf = faiss.extract_index_ivf(index)
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+    except RuntimeError:
+        pass
+
+    inner = faiss.downcast_index(index.index) if hasattr(index, "id_map") else index
+    if isinstance(inner, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=inner.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+
+def search_index(index, queries, top_k, selector=None):
+    """
+    index.search, restricted to the ids accepted by selector when one is given.
+
+    Only eligible vectors are scanned, so a filtered search still returns up
+    to top_k matching hits.
+    """
+    if selector is None:
+        return index.search(queries, top_k)
+    if hasattr(index, "segments"):
+        return index.search(queries, top_k, selector=selector)
+    return index.search(queries, top_k, params=selector_search_params(index, selector))
+
+
+def search_faiss_index(index, query_embedding, top_k=5, selector=None):
     """
     Search the FAISS index for the closest embeddings.
 
@@ -77,19 +628,53 @@ def search_faiss_index(index, query_embedding, top_k=5):
         index (faiss.IndexIDMap): FAISS index.
         query_embedding (np.ndarray or List[float]): Single embedding to search.
         top_k (int): Number of nearest neighbors to return.
+        selector (faiss.IDSelector, optional): Restrict the search to these ids.
 
     Returns:
         List[Tuple[int, float]]: List of (id, distance) of top_k closest embeddings.
+            Empty slots (FAISS id -1) are dropped.
     """
     query_embedding = np.array(query_embedding).astype('float32').reshape(1, -1)
-    distances, indices = index.search(query_embedding, top_k)
+    distances, indices = search_index(index, query_embedding, top_k, selector)
 
     # Return as list of tuples (id, distance)
-    results = [(int(idx), float(dist)) for idx, dist in zip(indices[0], distances[0])]
+    results = [(int(idx), float(dist)) for idx, dist in zip(indices[0], distances[0]) if idx != -1]
+    return results
+
+
+def search_faiss_index_batch(index, query_embeddings, top_k=5, selector=None):
+    """
+    Search the FAISS index for several queries with a single index.search call.
+
+    Args:
+        index (faiss.IndexIDMap): FAISS index.
+        query_embeddings (np.ndarray or List[List[float]]): Array of shape (num_queries, embedding_dim).
+        top_k (int): Number of nearest neighbors to return per query.
+        selector (faiss.IDSelector, optional): Restrict the search to these ids.
+
+    Returns:
+        List[List[Tuple[int, float]]]: Per-query lists of (id, distance), in query order.
+            Empty slots (FAISS id -1) are dropped.
+    """
+    query_embeddings = np.array(query_embeddings).astype('float32')
+    if query_embeddings.ndim == 1:
+        query_embeddings = query_embeddings.reshape(1, -1)
+    if query_embeddings.shape[0] == 0:
+        return []
+
+    distances, indices = search_index(index, query_embeddings, top_k, selector)
+
+    results = [
+        [(int(idx), float(dist)) for idx, dist in zip(row_ids, row_dists) if idx != -1]
+        for row_ids, row_dists in zip(indices, distances)
+    ]
     return results
 
 # Example usage
 if __name__ == "__main__":
+    from get_data import fetch_html, extract_text_from_html
+    from text_utils import chunk_text, get_embeddings
+
     # Dummy embeddings
     url = "https://medium.com/@explorer_shwetabh/deepfake-detection-part-2-understanding-lora-based-moe-adapter-architecture-813acbf9b345"
     html = fetch_html(url)
@@ -1,35 +1,86 @@
 from text_utils import get_embeddings
-from faiss_utils import load_faiss_index, search_faiss_index
-from data.data_utils import get_chunks_from_db
+from faiss_utils import get_resident_index, get_resident_stamp, search_faiss_index, search_faiss_index_batch
+from chunk_store import get_chunks_by_id
+from search_filters import build_search_selector
 
-def query_rag_pipeline(query, FAISS_FILE, top_k=5, EMBED_DIM=384):
+def query_rag_pipeline(query, FAISS_FILE, top_k=5, EMBED_DIM=384, query_embedding=None, filters=None):
     """
     Inputs:
         conn: SQLite connection
         query: user query string
-        FAISS_FILE: path to saved FAISS index
+        FAISS_FILE: path to saved FAISS index file or segment store directory
         top_k: number of closest vectors to retrieve
+        query_embedding: precomputed embedding of the query (optional)
+        filters: dict with url_ids, domains, created_after, created_before (optional)
     Returns:
         List of dicts with chunk_index, text, snippet, distance
     """
 
     # 1. Embed query
-    query_embedding = get_embeddings([query])
+    if query_embedding is None:
+        query_embedding = get_embeddings([query], use_cache=False)
 
-    # 2. Load FAISS index
-    index = load_faiss_index(FAISS_FILE, dimension=EMBED_DIM)
+    # 2. Get the resident FAISS index (loaded once per process)
+    index = get_resident_index(FAISS_FILE, dimension=EMBED_DIM)
 
-    # 3. Search closest embeddings
-    results = search_faiss_index(index, query_embedding, top_k=5)
-    faiss_indices = [i[0] for i in results]
+    # 3. Search closest embeddings, restricted to the filtered ids
+    selector = build_search_selector(filters, get_resident_stamp())
+    results = search_faiss_index(index, query_embedding, top_k=top_k, selector=selector)
+    distances = {faiss_id: distance for faiss_id, distance in results}
 
-    relevant_chunks = get_chunks_from_db(faiss_indices)
+    # Resolve hits from the memory-mapped chunk store (no SQL on the hot path)
+    relevant_chunks = get_chunks_by_id(list(distances))
+    for chunk in relevant_chunks:
+        chunk["distance"] = distances[chunk["faiss_id"]]
     return relevant_chunks
 
+def query_rag_pipeline_batch(queries, FAISS_FILE, top_k=5, EMBED_DIM=384, filters=None):
+    """
+    Batched variant of query_rag_pipeline.
+
+    All queries are embedded in one encoder call, searched with one FAISS
+    call, and every hit is resolved with a single chunk-store lookup.
+
+    Inputs:
+        queries: list of user query strings
+        FAISS_FILE: path to saved FAISS index file or segment store directory
+        top_k: number of closest vectors to retrieve per query
+        filters: dict with url_ids, domains, created_after, created_before,
+            applied to every query (optional)
+    Returns:
+        List (one entry per query, in input order) of lists of dicts with
+        faiss_id, chunk_index, text, snippet, distance
+    """
+    if not queries:
+        return []
+
+    # 1. Embed all queries in one forward pass
+    query_embeddings = get_embeddings(list(queries), use_cache=False)
+
+    # 2. Search all queries against the resident index at once
+    index = get_resident_index(FAISS_FILE, dimension=EMBED_DIM)
+    selector = build_search_selector(filters, get_resident_stamp())
+    results = search_faiss_index_batch(index, query_embeddings, top_k=top_k, selector=selector)
+
+    # 3. Resolve the union of hits in one chunk-store lookup
+    all_ids = sorted({faiss_id for hits in results for faiss_id, _ in hits})
+    chunks_by_id = {chunk["faiss_id"]: chunk for chunk in get_chunks_by_id(all_ids)}
+
+    batch_chunks = []
+    for hits in results:
+        relevant_chunks = [
+            {**chunks_by_id[faiss_id], "distance": distance}
+            for faiss_id, distance in hits
+            if faiss_id in chunks_by_id
+        ]
+        batch_chunks.append(relevant_chunks)
+
+    return batch_chunks
+
 if __name__ == '__main__' : 
 
     query = 'some random query'
-    FAISS_FILE = "faiss_index.idx"
+    FAISS_FILE = "faiss_segments"
     query_rag_pipeline(query, FAISS_FILE)
 
     user_prompt = generate_user_prompt(rag_results, user_query)
@@ -1,5 +1,163 @@
-import requests
-from bs4 import BeautifulSoup
+import asyncio
+import os
+import threading
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from html_text import html_to_text
+
+MAX_BODY_BYTES = int(os.environ.get("FETCH_MAX_BODY_BYTES", 5 * 1024 * 1024))
+MAX_CONNECTIONS = int(os.environ.get("FETCH_MAX_CONNECTIONS", 100))
+MAX_PER_HOST = int(os.environ.get("FETCH_MAX_PER_HOST", 4))
+
+# status: HTTP status; html is None on 304 (not modified) or failure
+FetchResult = namedtuple("FetchResult", ["url", "status", "html", "etag", "last_modified"])
+
+
+class AsyncFetcher:
+    """
+    Asyncio HTTP fetcher with pooled keep-alive connections.
+
+    Concurrency is capped overall and per host. Requests carry
+    If-None-Match / If-Modified-Since when validators from a previous crawl
+    are given, and bodies are streamed with a hard size cap so a huge page
+    cannot stall a worker.
+    """
+
+    def __init__(self, timeout=10, max_connections=MAX_CONNECTIONS, max_per_host=MAX_PER_HOST,
+                 max_body_bytes=MAX_BODY_BYTES):
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.max_connections = max_connections
+        self.max_per_host = max_per_host
+        self.max_body_bytes = max_body_bytes
+        self._session = None
+        self._host_limits = {}
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def open(self):
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, limit_per_host=self.max_per_host)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _host_limit(self, url):
+        host = urlsplit(url).netloc
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.max_per_host)
+        return self._host_limits[host]
+
+    async def fetch(self, url, etag=None, last_modified=None, timeout=None):
+        """
+        Fetch one URL, conditionally if validators are given.
+
+        Args:
+            url (str): The URL to fetch.
+            etag (str, optional): ETag from the previous crawl.
+            last_modified (str, optional): Last-Modified from the previous crawl.
+            timeout (float, optional): Total timeout for this request (default: the fetcher's).
+
+        Returns:
+            FetchResult: html is None if the page is unchanged (304).
+
+        Raises:
+            aiohttp.ClientError: On connection errors or error status codes.
+            ValueError: If the body exceeds max_body_bytes.
+        """
+        await self.open()
+
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+        async with self._host_limit(url):
+            request_timeout = aiohttp.ClientTimeout(total=timeout) if timeout is not None else self.timeout
+            async with self._session.get(url, headers=headers, timeout=request_timeout) as response:
+                if response.status == 304:
+                    return FetchResult(url, 304, None, etag, last_modified)
+                response.raise_for_status()
+
+                if response.content_length and response.content_length > self.max_body_bytes:
+                    raise ValueError(f"Body of {url} is {response.content_length} bytes (limit {self.max_body_bytes})")
+
+                body = bytearray()
+                async for block in response.content.iter_chunked(64 * 1024):
+                    body.extend(block)
+                    if len(body) > self.max_body_bytes:
+                        raise ValueError(f"Body of {url} exceeds {self.max_body_bytes} bytes")
+
+                html = body.decode(response.charset or "utf-8", errors="replace")
+                return FetchResult(
+                    url,
+                    response.status,
+                    html,
+                    response.headers.get("ETag"),
+                    response.headers.get("Last-Modified"),
+                )
+
+    async def fetch_many(self, requests):
+        """
+        Fetch several URLs concurrently.
+
+        Args:
+            requests (List[Tuple[str, str, str]]): (url, etag, last_modified) triples.
+
+        Returns:
+            List[FetchResult or Exception]: In input order.
+        """
+        return await asyncio.gather(
+            *(self.fetch(url, etag, last_modified) for url, etag, last_modified in requests),
+            return_exceptions=True,
+        )
+
+
+# Event loop and fetcher shared by the synchronous helpers in this process,
+# so connections stay pooled across calls
+_loop = None
+_fetcher = None
+_loop_lock = threading.Lock()
+
+
+def _get_loop_and_fetcher():
+    global _loop, _fetcher
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="fetch-loop", daemon=True).start()
+            _fetcher = AsyncFetcher()
+    return _loop, _fetcher
+
+
+def fetch_html_conditional(url, etag=None, last_modified=None, timeout=10):
+    """
+    Synchronous, connection-pooled conditional fetch.
+
+    Args:
+        url (str): The URL to fetch.
+        etag (str, optional): ETag from the previous crawl.
+        last_modified (str, optional): Last-Modified from the previous crawl.
+        timeout (int): Request timeout in seconds.
+
+    Returns:
+        FetchResult: status 304 with html None if the page has not changed.
+    """
+    loop, fetcher = _get_loop_and_fetcher()
+    future = asyncio.run_coroutine_threadsafe(fetcher.fetch(url, etag, last_modified, timeout=timeout), loop)
+    return future.result()
+
 
 def fetch_html(url, timeout=10):
     """
@@ -10,23 +168,36 @@ def fetch_html(url, timeout=10):
         timeout (int): Request timeout in seconds.
 
     Returns:
-        str: Raw HTML content of the page.
-
-    Raises:
-        requests.RequestException: If the request fails.
+        str: Raw HTML content of the page, or None if the request fails.
     """
     try:
-        response = requests.get(url, timeout=timeout)
-        response.raise_for_status()  # Raise error for bad status codes
-        return response.text
-    except requests.RequestException as e:
+        return fetch_html_conditional(url, timeout=timeout).html
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
         print(f"[ERROR] Failed to fetch URL {url}: {e}")
         return None
 
 def extract_text_from_html(html):
+    """
+    Extract clean text content from HTML.
+
+    Single streaming pass (see html_text.py) that drops script, style,
+    noscript, header, footer, nav and iframe content; output matches
+    extract_text_from_html_soup.
+
+    Args:
+        html (str): Raw HTML content.
+
+    Returns:
+        str: Cleaned, readable text.
+    """
+    return html_to_text(html)
+
+def extract_text_from_html_soup(html):
     """
     Extract clean text content from HTML using BeautifulSoup.
 
+    Reference implementation for extract_text_from_html (see bench_html_extract.py).
+
     Args:
         html (str): Raw HTML content.
 
@@ -36,6 +207,8 @@ def extract_text_from_html(html):
     if not html:
         return ""
 
+    from bs4 import BeautifulSoup
+
     soup = BeautifulSoup(html, "html.parser")
 
     # Remove unwanted tags
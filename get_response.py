@@ -1,18 +1,125 @@
 from get_closest_chunks import query_rag_pipeline
-from prompts import generate_user_prompt, generate_llm_response, system_prompt
-FAISS_FILE = "faiss_index.idx"
+from text_utils import get_embeddings
+from faiss_utils import get_resident_generation
+from answer_cache import answer_cache
+from request_executor import DeadlineExceeded
+from prompts import generate_user_prompt, generate_llm_response, generate_llm_response_stream, system_prompt
+FAISS_DIR = "faiss_segments"
 
-def get_response(query) : 
-    rag_results = query_rag_pipeline(query, FAISS_FILE)
+def prepare_response(query, filters=None):
+    """
+    Retrieval half of get_response: embed, search, check the answer cache, pack the prompt.
 
-    user_prompt = generate_user_prompt(rag_results, query)
-    response = generate_llm_response(system_prompt, user_prompt)
+    Args:
+        query (str): The user query.
+        filters (Dict, optional): Retrieval filters (see search_filters).
 
-    return response
+    Returns:
+        Dict: query_embedding, rag_results, chunk_ids, generation (live-id fingerprint),
+            cached_answer (str or None), and, when there is no cached answer,
+            user_prompt and stats.
+    """
+    query_embedding = get_embeddings([query], use_cache=False)
+    rag_results = query_rag_pipeline(query, FAISS_DIR, query_embedding=query_embedding, filters=filters)
+
+    # Greedy decoding: a similar query over the same chunks gives the same answer
+    chunk_ids = [chunk["faiss_id"] for chunk in rag_results]
+    generation = get_resident_generation()
+    context = {
+        "query_embedding": query_embedding,
+        "rag_results": rag_results,
+        "chunk_ids": chunk_ids,
+        "generation": generation,
+        "cached_answer": answer_cache.lookup(query_embedding[0], chunk_ids, generation),
+    }
+    if context["cached_answer"] is not None:
+        print("⚡ Answer cache hit")
+        return context
+
+    user_prompt, stats = generate_user_prompt(rag_results, query, return_stats=True)
+    print(f"🧮 Prompt tokens: {stats['prompt_tokens']} (saved {stats['prompt_tokens_saved']})")
+    context["user_prompt"] = user_prompt
+    context["stats"] = stats
+    return context
+
+def store_response(context, response):
+    """Remember a generated answer for the query and chunks in context (see prepare_response)."""
+    answer_cache.store(context["query_embedding"][0], context["chunk_ids"], context["generation"], response)
+
+def generate_answer(user_prompt, deadline=None, on_stream=None):
+    """
+    Generate the answer for a packed prompt, giving up at the deadline.
+
+    Tokens are pulled from the backend's stream so an expired deadline stops
+    generation in the engine instead of letting it run to max_new_tokens.
+
+    Args:
+        user_prompt (str): Prompt from prepare_response.
+        deadline (Deadline, optional): Request deadline (see request_executor).
+        on_stream (Callable, optional): Called with the stream once it exists,
+            so another thread can cancel it.
+
+    Returns:
+        str: The model's answer.
+    """
+    if deadline is None:
+        return generate_llm_response(system_prompt, user_prompt)
+
+    stream = generate_llm_response_stream(system_prompt, user_prompt)
+    if on_stream is not None:
+        on_stream(stream)
+    pieces = []
+    try:
+        for piece in stream:
+            if deadline.expired():
+                raise DeadlineExceeded("generation")
+            pieces.append(piece)
+    finally:
+        # No-op once the stream has finished on its own
+        stream.cancel()
+    return "".join(pieces)
+
+def get_response(query, filters=None, return_stats=False) : 
+    """
+    Answer a query with the RAG pipeline.
+
+    Args:
+        query (str): The user query.
+        filters (Dict, optional): Retrieval filters (see search_filters).
+        return_stats (bool): Also return prompt token accounting.
+
+    Returns:
+        str: The answer.
+        Dict (only with return_stats): Prompt stats from generate_user_prompt,
+            or {"answer_cache_hit": True} when the answer came from the cache.
+    """
+    context = prepare_response(query, filters=filters)
+    if context["cached_answer"] is not None:
+        cached = context["cached_answer"]
+        return (cached, {"answer_cache_hit": True}) if return_stats else cached
+
+    response = generate_answer(context["user_prompt"])
+    store_response(context, response)
+    return (response, context["stats"]) if return_stats else response
+
+def get_response_stream(query, filters=None) : 
+    """
+    Run retrieval and start streaming generation.
+
+    Returns:
+        Tuple[List[Dict], TokenStream, Dict]: Retrieved chunks, the token stream
+            and prompt token stats.
+    """
+    rag_results = query_rag_pipeline(query, FAISS_DIR, filters=filters)
+
+    user_prompt, stats = generate_user_prompt(rag_results, query, return_stats=True)
+    stream = generate_llm_response_stream(system_prompt, user_prompt)
+
+    return rag_results, stream, stats
 
 if __name__ == '__main__' : 
 
     query = 'what is a DaViT architecture?'
-    FAISS_FILE = "faiss_index.idx"
+    FAISS_DIR = "faiss_segments"
 
     get_response(query)
\ No newline at end of file
@@ -0,0 +1,194 @@
+"""
+Single-pass HTML-to-text extraction.
+
+Produces the same text as the BeautifulSoup path in get_data
+(extract_text_from_html_soup): the content of script, style, noscript, header,
+footer, nav and iframe elements is dropped, every remaining text node is
+stripped, and all whitespace is collapsed to single spaces. Instead of
+building a tree it tokenizes with the same html.parser tokenizer and tracks
+only the stack of open tag names, so memory does not grow with page size
+beyond the text it returns, and input can be fed in chunks.
+"""
+import re
+from html.entities import html5
+from html.parser import HTMLParser
+
+SKIP_TAGS = frozenset(["script", "style", "noscript", "header", "footer", "nav", "iframe"])
+
+# Elements BeautifulSoup closes as soon as they open (never contain text)
+VOID_TAGS = frozenset([
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "keygen", "link", "menuitem",
+    "meta", "param", "source", "track", "wbr", "basefont", "bgsound", "command", "frame",
+    "image", "isindex", "nextid", "spacer",
+])
+
+
+# Named references resolve with or without the trailing semicolon, as in BeautifulSoup
+_NAMED_REFERENCES = {}
+for _name, _character in sorted(html5.items()):
+    _NAMED_REFERENCES.setdefault(_name[:-1] if _name.endswith(";") else _name, _character)
+
+_NUMERIC_PREFIX = {10: re.compile("^([0-9]+)(.*)"), 16: re.compile("^([0-9a-f]+)(.*)")}
+
+
+def _numeric_reference(name):
+    """
+    Resolve the body of a numeric character reference ("8212", "x2014").
+
+    Follows the HTML spec's numeric character reference end state: NUL,
+    surrogates and out-of-range values become U+FFFD and C1 controls are read
+    as Windows-1252. Returns the character plus any trailing text that was not
+    part of the number.
+    """
+    base = 10
+    if name[:1] in ("x", "X"):
+        name, base = name[1:], 16
+    try:
+        number, extra = int(name, base), ""
+    except ValueError:
+        match = _NUMERIC_PREFIX[base].search(name)
+        if match is None:
+            return "", name
+        number, extra = int(match.group(1), base), match.group(2)
+
+    if number == 0 or number > 0x10FFFF or 0xD800 <= number <= 0xDFFF:
+        return "\ufffd", extra
+    if 0x80 <= number <= 0x9F:
+        try:
+            return bytes([number]).decode("cp1252"), extra
+        except UnicodeDecodeError:
+            pass
+    return chr(number), extra
+
+
+class HTMLTextExtractor(HTMLParser):
+    """
+    Streaming tokenizer that collects the words of visible text nodes.
+
+    End tags follow BeautifulSoup's tree-building rules: an end tag closes the
+    most recent open element of that name and everything opened after it, and
+    is ignored if no such element is open. Consecutive data events are one
+    text node until the next tag, comment or declaration.
+    """
+
+    def __init__(self):
+        # References are resolved here (not by HTMLParser) to match BeautifulSoup exactly
+        super().__init__(convert_charrefs=False)
+        self._stack = []
+        self._open_counts = {}
+        self._skip_depth = 0
+        # Void tags opened as <br>, whose one redundant </br> is swallowed silently
+        self._closed_void_tags = []
+        self._pending = []
+        self.words = []
+
+    def _end_text_node(self):
+        if self._pending:
+            self.words.extend("".join(self._pending).split())
+            self._pending = []
+
+    def handle_starttag(self, tag, attrs):
+        self._end_text_node()
+        if tag in VOID_TAGS:
+            self._closed_void_tags.append(tag)
+            return
+        self._stack.append(tag)
+        self._open_counts[tag] = self._open_counts.get(tag, 0) + 1
+        if tag in SKIP_TAGS:
+            self._skip_depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        # <tag/> opens and closes at once
+        self._end_text_node()
+
+    def handle_endtag(self, tag):
+        if tag in self._closed_void_tags:
+            # Not even a text node boundary, so "a<br>b</br>c" keeps "bc" together
+            self._closed_void_tags.remove(tag)
+            return
+        self._end_text_node()
+        if not self._open_counts.get(tag):
+            return
+        while True:
+            name = self._stack.pop()
+            self._open_counts[name] -= 1
+            if name in SKIP_TAGS:
+                self._skip_depth -= 1
+            if name == tag:
+                break
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self._pending.append(data)
+
+    def handle_entityref(self, name):
+        if not self._skip_depth:
+            # An unknown name is kept as literal text (without its semicolon)
+            self._pending.append(_NAMED_REFERENCES.get(name, f"&{name}"))
+
+    def handle_charref(self, name):
+        if not self._skip_depth:
+            self._pending.extend(_numeric_reference(name))
+
+    def handle_comment(self, data):
+        self._end_text_node()
+
+    def handle_decl(self, decl):
+        self._end_text_node()
+
+    def handle_pi(self, data):
+        self._end_text_node()
+
+    def unknown_decl(self, data):
+        self._end_text_node()
+        # CDATA sections count as text, other declarations do not
+        if data.upper().startswith("CDATA[") and not self._skip_depth:
+            self.words.extend(data[len("CDATA["):].split())
+
+    def close(self):
+        super().close()
+        self._end_text_node()
+
+    def take_words(self):
+        """Return and clear the words collected so far."""
+        words, self.words = self.words, []
+        return words
+
+
+def iter_text_from_html(chunks):
+    """
+    Extract text incrementally from HTML delivered in pieces.
+
+    Args:
+        chunks (Iterable[str]): Consecutive pieces of one HTML document.
+
+    Yields:
+        str: Runs of space-separated words; join them with " " for the full text.
+    """
+    parser = HTMLTextExtractor()
+    for chunk in chunks:
+        parser.feed(chunk)
+        words = parser.take_words()
+        if words:
+            yield " ".join(words)
+    parser.close()
+    words = parser.take_words()
+    if words:
+        yield " ".join(words)
+
+
+def html_to_text(html, chunk_size=1 << 16):
+    """
+    Extract clean text from an HTML string in one streaming pass.
+
+    Args:
+        html (str): Raw HTML content.
+        chunk_size (int): Characters handed to the tokenizer at a time.
+
+    Returns:
+        str: Visible text with whitespace collapsed.
+    """
+    if not html:
+        return ""
+    pieces = (html[i:i + chunk_size] for i in range(0, len(html), chunk_size))
+    return " ".join(iter_text_from_html(pieces))
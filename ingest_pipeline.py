@@ -0,0 +1,286 @@
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import redis
+
+from text_utils import get_embeddings
+from worker import fetch_document, split_document, commit_document, chunks_to_embed, job_result_fields
+from data.data_utils import create_tables, insert_urls, update_url_status
+from faiss_segments import start_compactor
+from job_queue import job_queue
+
+# Connect to Redis
+r = redis.StrictRedis(host='localhost', port=6379, db=0, decode_responses=True)
+
+FAISS_DIR = "faiss_segments"
+EMBED_DIM = 384  # for sentence-transformers/all-MiniLM-L12-v2
+STATS_KEY = "ingest:pipeline_stats"
+
+
+class StageStats:
+    """Throughput counters for one pipeline stage."""
+
+    def __init__(self, name, in_queue, workers=1):
+        self.name = name
+        self.in_queue = in_queue
+        self.workers = workers
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.started_at = time.monotonic()
+
+    def snapshot(self):
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        return {
+            "stage": self.name,
+            "queue_depth": self.in_queue.qsize(),
+            "processed": self.processed,
+            "failed": self.failed,
+            "items_per_sec": self.processed / elapsed,
+            "utilization": self.busy_seconds / (elapsed * self.workers),
+        }
+
+
+class IngestPipeline:
+    """
+    Ingestion as stages connected by bounded queues:
+
+        fetch (N threads) -> extract+chunk (M threads) -> embed (1 thread) -> write (1 thread)
+
+    Each stage works on a different URL at the same time, so the network,
+    the parser and the encoder stay busy together. The embed stage gathers
+    chunks from many URLs into full encoder batches (by size or timeout) and
+    routes the vectors back to their documents. The single writer applies
+    every DB and FAISS mutation in order.
+    """
+
+    def __init__(self, fetch_workers=8, extract_workers=2, embed_batch_size=64,
+                 embed_max_wait=0.5, queue_size=32):
+        self.fetch_workers = fetch_workers
+        self.extract_workers = extract_workers
+        self.embed_batch_size = embed_batch_size
+        self.embed_max_wait = embed_max_wait
+
+        self.fetch_queue = queue.Queue(maxsize=queue_size)
+        self.extract_queue = queue.Queue(maxsize=queue_size)
+        self.embed_queue = queue.Queue(maxsize=queue_size)
+        self.write_queue = queue.Queue(maxsize=queue_size)
+
+        self.stats = {
+            "fetch": StageStats("fetch", self.fetch_queue, fetch_workers),
+            "extract": StageStats("extract", self.extract_queue, extract_workers),
+            "embed": StageStats("embed", self.embed_queue),
+            "write": StageStats("write", self.write_queue),
+        }
+        self.embed_batches = 0
+        self._threads = []
+
+    # ------------------ Stages ------------------
+
+    def _fail(self, stage, item, error):
+        print(f"❌ [{stage}] Failed URL: {item['url']}, Error: {error}")
+        self.stats[stage].failed += 1
+        self.write_queue.put({"url": item["url"], "job_id": item.get("job_id"), "error": str(error)})
+
+    @staticmethod
+    def _document(item, embeddings):
+        """Write-queue entry for a fully embedded document (same shape as prepare_document)."""
+        return {
+            "url": item["url"],
+            "job_id": item.get("job_id"),
+            "document": {
+                "chunks": item["chunks"],
+                "embedded": item["embedded"],
+                "embeddings": embeddings,
+                "etag": item["fetched"].etag,
+                "last_modified": item["fetched"].last_modified,
+            },
+        }
+
+    def _fetch_stage(self):
+        while True:
+            item = self.fetch_queue.get()
+            start = time.monotonic()
+            try:
+                fetched = fetch_document(item["url"])
+                if fetched is None:
+                    self.write_queue.put({**item, "document": None})
+                else:
+                    self.extract_queue.put({**item, "fetched": fetched})
+                self.stats["fetch"].processed += 1
+            except Exception as e:
+                self._fail("fetch", item, e)
+            self.stats["fetch"].busy_seconds += time.monotonic() - start
+
+    def _extract_stage(self):
+        while True:
+            item = self.extract_queue.get()
+            start = time.monotonic()
+            try:
+                item["chunks"] = split_document(item["fetched"].html)
+                # Chunks already stored for this URL keep their vectors
+                item["embedded"] = chunks_to_embed(item["url"], item["chunks"])
+                item["embed_texts"] = [item["chunks"][idx] for idx in item["embedded"]]
+                if item["embed_texts"]:
+                    self.embed_queue.put(item)
+                else:
+                    self.write_queue.put(self._document(item, np.zeros((0, 0), dtype='float32')))
+                self.stats["extract"].processed += 1
+            except Exception as e:
+                self._fail("extract", item, e)
+            self.stats["extract"].busy_seconds += time.monotonic() - start
+
+    def _embed_stage(self):
+        """Encode chunks from many documents per batch and route vectors back."""
+        pending = []  # (document, first chunk, last chunk) slices waiting for the encoder
+        pending_chunks = 0
+        deadline = None
+
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self.embed_queue.get(timeout=timeout)
+                item["vectors"] = [None] * len(item["embed_texts"])
+                item["remaining"] = len(item["embed_texts"])
+                pending.append((item, 0, len(item["embed_texts"])))
+                pending_chunks += len(item["embed_texts"])
+                if deadline is None:
+                    deadline = time.monotonic() + self.embed_max_wait
+            except queue.Empty:
+                pass
+
+            if not pending:
+                continue
+            if pending_chunks < self.embed_batch_size and time.monotonic() < deadline:
+                continue
+
+            # Take exactly one batch worth of chunks, splitting a document if needed
+            batch, batch_texts = [], []
+            while pending and len(batch_texts) < self.embed_batch_size:
+                item, lo, hi = pending.pop(0)
+                take = min(hi - lo, self.embed_batch_size - len(batch_texts))
+                batch.append((item, lo, lo + take))
+                batch_texts.extend(item["embed_texts"][lo:lo + take])
+                if lo + take < hi:
+                    pending.insert(0, (item, lo + take, hi))
+            pending_chunks -= len(batch_texts)
+            deadline = time.monotonic() + self.embed_max_wait if pending else None
+
+            start = time.monotonic()
+            try:
+                vectors = np.asarray(get_embeddings(batch_texts), dtype='float32')
+                self.embed_batches += 1
+            except Exception as e:
+                for item, _, _ in batch:
+                    if item["remaining"] > 0:
+                        item["remaining"] = 0
+                        self._fail("embed", item, e)
+                pending = [p for p in pending if p[0]["remaining"] > 0]
+                pending_chunks = sum(hi - lo for _, lo, hi in pending)
+                continue
+
+            offset = 0
+            for item, lo, hi in batch:
+                item["vectors"][lo:hi] = list(vectors[offset:offset + hi - lo])
+                offset += hi - lo
+                item["remaining"] -= hi - lo
+                if item["remaining"] == 0:
+                    self.write_queue.put(self._document(item, np.stack(item["vectors"])))
+                    self.stats["embed"].processed += 1
+            self.stats["embed"].busy_seconds += time.monotonic() - start
+
+    def _write_stage(self):
+        """The only place DB and FAISS are mutated."""
+        start_compactor(FAISS_DIR, dimension=EMBED_DIM)
+        while True:
+            item = self.write_queue.get()
+            url = item["url"]
+            start = time.monotonic()
+            job_id = item.get("job_id")
+            try:
+                if "error" in item:
+                    insert_urls(url)
+                    update_url_status(url, status="failed", error_message=item["error"])
+                    if job_id:
+                        job_queue.fail(job_id, item["error"])
+                else:
+                    result = commit_document(FAISS_DIR, EMBED_DIM, url, item["document"])
+                    if job_id:
+                        job_queue.complete(job_id, **job_result_fields(result))
+                    self.stats["write"].processed += 1
+                    print(f"✅ Completed URL: {url}")
+            except Exception as e:
+                self.stats["write"].failed += 1
+                print(f"❌ [write] Failed URL: {url}, Error: {e}")
+                update_url_status(url, status="failed", error_message=str(e))
+                if job_id:
+                    job_queue.fail(job_id, e)
+            self.stats["write"].busy_seconds += time.monotonic() - start
+
+    # ------------------ Control ------------------
+
+    def start(self):
+        """Start every stage thread."""
+        create_tables()
+        stages = (
+            [("fetch", self._fetch_stage)] * self.fetch_workers
+            + [("extract", self._extract_stage)] * self.extract_workers
+            + [("embed", self._embed_stage), ("write", self._write_stage)]
+        )
+        for i, (name, target) in enumerate(stages):
+            thread = threading.Thread(target=target, name=f"ingest-{name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, url, job_id=None):
+        """Queue a URL for ingestion (blocks while the fetch queue is full)."""
+        self.fetch_queue.put({"url": url, "job_id": job_id})
+
+    def report(self):
+        """
+        Per-stage throughput and queue depth.
+
+        Returns:
+            Dict: One entry per stage plus the number of encoder batches run.
+        """
+        return {
+            "updated_at": datetime.utcnow().isoformat(),
+            "stages": [stats.snapshot() for stats in self.stats.values()],
+            "embed_batches": self.embed_batches,
+        }
+
+    def run_from_redis(self, stats_interval=5.0):
+        """Pull jobs from the Redis queue forever, publishing stage stats periodically."""
+        print("🚀 Ingestion pipeline started, waiting for jobs...")
+        self.start()
+        # Jobs wait in the stage queues; keep their leases alive until the writer acks them
+        job_queue.start_heartbeat()
+        next_report = time.monotonic() + stats_interval
+
+        while True:
+            job = job_queue.claim(timeout=1)
+            if job is not None:
+                self.submit(job["url"], job["job_id"])
+
+            if time.monotonic() >= next_report:
+                job_queue.requeue_expired()
+                report = self.report()
+                r.set(STATS_KEY, json.dumps(report))
+                for stage in report["stages"]:
+                    print(f"📊 {stage['stage']:<8} depth={stage['queue_depth']:<4} "
+                          f"rate={stage['items_per_sec']:.2f}/s util={stage['utilization']:.0%}")
+                next_report = time.monotonic() + stats_interval
+
+
+if __name__ == "__main__":
+    IngestPipeline(
+        fetch_workers=int(os.environ.get("INGEST_FETCH_WORKERS", 8)),
+        extract_workers=int(os.environ.get("INGEST_EXTRACT_WORKERS", 2)),
+        embed_batch_size=int(os.environ.get("INGEST_EMBED_BATCH_SIZE", 64)),
+        embed_max_wait=float(os.environ.get("INGEST_EMBED_MAX_WAIT", 0.5)),
+    ).run_from_redis()
@@ -0,0 +1,354 @@
+"""
+Reliable, deduplicated URL job queue on Redis.
+
+Keys (prefix url_jobs):
+    url_jobs             LIST of job ids waiting to be claimed (LPUSH in, claimed from the right)
+    url_jobs:processing  LIST of claimed job ids (BLMOVE from url_jobs)
+    url_jobs:leases      ZSET job id -> lease expiry (unix time)
+    url_jobs:active      HASH url -> job id, for every pending or processing URL
+    url_jobs:recent      ZSET url -> completion time, for DEDUPE_WINDOW_S
+    url_jobs:last        HASH url -> id of its last completed job
+    url_jobs:job:<id>    HASH job status: url, status, submitted_at, started_at,
+                         finished_at, attempts, worker, error, chunk_count,
+                         added / removed / unchanged chunk counts of a re-ingest
+
+A URL that is already pending/processing, or completed within the dedupe
+window, is not enqueued again; the caller gets the existing job id. Workers
+claim with BLMOVE into the processing list and hold a lease; a job whose lease
+expires (worker crashed or hung) is pushed back to the front of the queue by
+requeue_expired(), up to JOB_MAX_ATTEMPTS claims.
+
+Jobs can sit in local prefetch and writer queues for longer than a lease, so
+the process that claimed a job keeps its lease alive with a heartbeat thread
+(start_heartbeat) until it completes or fails it. Leases are only renewed for
+JOB_MAX_HOLD_S after the claim, so a job lost inside the process (e.g. its
+pool worker died mid-way) still comes back one lease after that.
+"""
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import redis
+
+JOB_LEASE_S = float(os.environ.get("JOB_LEASE_S", 300))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 3))
+# Completed URLs submitted again within this window are dropped (0 disables)
+DEDUPE_WINDOW_S = float(os.environ.get("DEDUPE_WINDOW_S", 3600))
+# Finished job hashes are kept this long for /jobs lookups
+JOB_TTL_S = int(os.environ.get("JOB_TTL_S", 7 * 24 * 3600))
+# The heartbeat stops renewing a job this long after it was claimed
+JOB_MAX_HOLD_S = float(os.environ.get("JOB_MAX_HOLD_S", 3600))
+
+QUEUE_KEY = "url_jobs"
+
+
+def _now_iso():
+    return datetime.utcnow().isoformat()
+
+
+class RedisJobQueue:
+    """
+    URL ingestion queue with batched enqueue, dedupe, leases and per-job status.
+
+    Every multi-key update is one MULTI/EXEC pipeline, so a job is never half
+    moved between the pending list, the processing list and its lease.
+    """
+
+    def __init__(self, client, name=QUEUE_KEY, lease_seconds=JOB_LEASE_S, max_attempts=JOB_MAX_ATTEMPTS,
+                 dedupe_window=DEDUPE_WINDOW_S, job_ttl=JOB_TTL_S, max_hold=JOB_MAX_HOLD_S):
+        self.r = client
+        self.pending_key = name
+        self.processing_key = f"{name}:processing"
+        self.leases_key = f"{name}:leases"
+        self.active_key = f"{name}:active"
+        self.recent_key = f"{name}:recent"
+        self.last_key = f"{name}:last"
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.dedupe_window = dedupe_window
+        self.job_ttl = job_ttl
+        self.max_hold = max_hold
+        self.worker_name = f"{socket.gethostname()}:{os.getpid()}"
+        self._held = {}  # job id -> claim time (monotonic), for jobs this process has not finished
+        self._held_lock = threading.Lock()
+        self._heartbeat = None
+
+    def job_key(self, job_id):
+        return f"{self.pending_key}:job:{job_id}"
+
+    # ------------------ Producer ------------------
+
+    def enqueue(self, urls):
+        """
+        Enqueue URLs in two round trips: one pipelined dedupe lookup, one transactional write.
+
+        Args:
+            urls (List[str]): URLs to ingest; repeats within the batch count once.
+
+        Returns:
+            List[Dict]: One entry per input URL with url, job_id and duplicate
+                (True if an existing pending, processing or recent job was reused).
+        """
+        unique = list(dict.fromkeys(urls))
+        if not unique:
+            return []
+
+        now = time.time()
+        lookup = self.r.pipeline(transaction=False)
+        lookup.zremrangebyscore(self.recent_key, "-inf", now - self.dedupe_window)
+        lookup.hmget(self.active_key, unique)
+        lookup.hmget(self.last_key, unique)
+        for url in unique:
+            lookup.zscore(self.recent_key, url)
+        _, active_ids, last_ids, *recent_scores = lookup.execute()
+
+        existing = {}
+        for url, active_id, last_id, completed_at in zip(unique, active_ids, last_ids, recent_scores):
+            if active_id is not None:
+                existing[url] = active_id
+            elif completed_at is not None and self.dedupe_window > 0:
+                existing[url] = last_id
+
+        new_jobs = {url: uuid.uuid4().hex for url in unique if url not in existing}
+        if new_jobs:
+            submitted_at = _now_iso()
+            write = self.r.pipeline(transaction=True)
+            for url, job_id in new_jobs.items():
+                write.hset(self.job_key(job_id), mapping={
+                    "job_id": job_id, "url": url, "status": "queued", "submitted_at": submitted_at, "attempts": 0,
+                })
+            write.hset(self.active_key, mapping={url: job_id for url, job_id in new_jobs.items()})
+            write.lpush(self.pending_key, *new_jobs.values())
+            write.execute()
+
+        results = []
+        seen = set()
+        for url in urls:
+            duplicate = url not in new_jobs or url in seen
+            seen.add(url)
+            results.append({"url": url, "job_id": new_jobs.get(url) or existing[url], "duplicate": duplicate})
+        print(f"✅ Enqueued {len(new_jobs)} jobs ({len(urls) - len(new_jobs)} duplicates dropped)")
+        return results
+
+    # ------------------ Consumer ------------------
+
+    def claim(self, timeout=1):
+        """
+        Block up to timeout seconds for a job and lease it to this worker.
+
+        Returns:
+            Dict or None: The job hash (job_id, url, attempts, ...), or None if
+                nothing was claimable.
+        """
+        job_id = self.r.blmove(self.pending_key, self.processing_key, timeout, "RIGHT", "LEFT")
+        if job_id is None:
+            return None
+        if job_id.startswith("{"):
+            job_id = self._adopt_legacy(job_id)
+
+        job = self.r.hgetall(self.job_key(job_id))
+        if not job or job.get("finished_at"):
+            # Hash expired, or finished before a lease requeue caught up
+            self._drop(job_id)
+            return None
+        active_id = self.r.hget(self.active_key, job["url"])
+        if active_id and active_id != job_id:
+            # A concurrent enqueue of the same URL won; that job does the work
+            self._drop(job_id)
+            self.r.hset(self.job_key(job_id), mapping={"status": "duplicate", "finished_at": _now_iso()})
+            self.r.expire(self.job_key(job_id), self.job_ttl)
+            return None
+
+        lease = self.r.pipeline(transaction=True)
+        lease.zadd(self.leases_key, {job_id: time.time() + self.lease_seconds})
+        lease.hset(self.job_key(job_id), mapping={
+            "status": "processing", "started_at": _now_iso(), "worker": self.worker_name,
+        })
+        lease.hincrby(self.job_key(job_id), "attempts", 1)
+        lease.hgetall(self.job_key(job_id))
+        job = lease.execute()[-1]
+        with self._held_lock:
+            self._held[job_id] = time.monotonic()
+        return job
+
+    def renew(self, job_id):
+        """Extend the lease of a long-running job."""
+        self.r.zadd(self.leases_key, {job_id: time.time() + self.lease_seconds}, xx=True)
+
+    def complete(self, job_id, **fields):
+        """Mark a job completed, release its lease and start the URL's dedupe window."""
+        self._finish(job_id, "completed", fields, remember=True)
+
+    def fail(self, job_id, error):
+        """Mark a job failed; the URL can be submitted again right away."""
+        self._finish(job_id, "failed", {"error": str(error)}, remember=False)
+
+    def _finish(self, job_id, status, fields, remember):
+        with self._held_lock:
+            self._held.pop(job_id, None)
+        # Redis hash values must be str / int / float
+        fields = {key: int(value) if isinstance(value, bool) else value for key, value in fields.items() if value is not None}
+        url = self.r.hget(self.job_key(job_id), "url")
+        done = self.r.pipeline(transaction=True)
+        done.lrem(self.processing_key, 1, job_id)
+        done.zrem(self.leases_key, job_id)
+        done.hset(self.job_key(job_id), mapping={"status": status, "finished_at": _now_iso(), **fields})
+        done.expire(self.job_key(job_id), self.job_ttl)
+        if url:
+            done.hdel(self.active_key, url)
+            if remember and self.dedupe_window > 0:
+                done.zadd(self.recent_key, {url: time.time()})
+                done.hset(self.last_key, url, job_id)
+        done.execute()
+
+    def _drop(self, job_id):
+        drop = self.r.pipeline(transaction=True)
+        drop.lrem(self.processing_key, 1, job_id)
+        drop.zrem(self.leases_key, job_id)
+        drop.execute()
+
+    def _adopt_legacy(self, payload):
+        """Swap a pre-job-id JSON payload in the processing list for a proper job id."""
+        url = json.loads(payload)["url"]
+        job_id = uuid.uuid4().hex
+        adopt = self.r.pipeline(transaction=True)
+        adopt.hset(self.job_key(job_id), mapping={
+            "job_id": job_id, "url": url, "status": "queued", "submitted_at": _now_iso(), "attempts": 0,
+        })
+        adopt.hset(self.active_key, url, job_id)
+        adopt.lrem(self.processing_key, 1, payload)
+        adopt.lpush(self.processing_key, job_id)
+        adopt.execute()
+        return job_id
+
+    # ------------------ Lease renewal ------------------
+
+    def renew_held(self):
+        """
+        Renew the leases of every job this process claimed and has not finished yet.
+
+        Jobs held longer than max_hold are no longer renewed (and forgotten), so
+        requeue_expired() can recover them.
+
+        Returns:
+            int: Leases renewed.
+        """
+        now = time.monotonic()
+        with self._held_lock:
+            for job_id in [job_id for job_id, claimed in self._held.items() if now - claimed >= self.max_hold]:
+                print(f"⚠️ Job {job_id} held for over {self.max_hold:.0f}s, letting its lease expire")
+                del self._held[job_id]
+            held = list(self._held)
+        if not held:
+            return 0
+
+        expires_at = time.time() + self.lease_seconds
+        renew = self.r.pipeline(transaction=False)
+        for job_id in held:
+            renew.zadd(self.leases_key, {job_id: expires_at}, xx=True)
+        renew.execute()
+        return len(held)
+
+    def start_heartbeat(self, interval=None):
+        """
+        Start a daemon thread that calls renew_held() every interval seconds (default a third of a lease).
+
+        Returns:
+            threading.Thread: The heartbeat thread (only one is started per queue).
+        """
+        if self._heartbeat is not None and self._heartbeat.is_alive():
+            return self._heartbeat
+        interval = interval or self.lease_seconds / 3
+
+        def _beat():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.renew_held()
+                except redis.RedisError as e:
+                    print(f"[ERROR] Failed to renew job leases: {e}")
+
+        self._heartbeat = threading.Thread(target=_beat, name="job-lease-heartbeat", daemon=True)
+        self._heartbeat.start()
+        return self._heartbeat
+
+    # ------------------ Lease recovery ------------------
+
+    def requeue_expired(self):
+        """
+        Push jobs with expired leases back to the front of the queue.
+
+        A claimed job without any lease (the claimer died between BLMOVE and
+        taking the lease) gets one now, so it is recovered a lease later.
+        Jobs that have used up max_attempts are failed instead.
+
+        Returns:
+            int: Jobs requeued.
+        """
+        now = time.time()
+        processing = self.r.lrange(self.processing_key, 0, -1)
+        if processing:
+            orphans = self.r.pipeline(transaction=False)
+            for job_id in processing:
+                orphans.zadd(self.leases_key, {job_id: now + self.lease_seconds}, nx=True)
+            orphans.execute()
+
+        expired = self.r.zrangebyscore(self.leases_key, "-inf", now)
+        requeued = 0
+        for job_id in expired:
+            if self._requeue(job_id, now):
+                requeued += 1
+        return requeued
+
+    def _requeue(self, job_id, now):
+        """Requeue one expired job unless its worker finished it or renewed the lease meanwhile."""
+        key = self.job_key(job_id)
+        with self.r.pipeline(transaction=True) as move:
+            try:
+                move.watch(key, self.leases_key)
+                lease_expiry = move.zscore(self.leases_key, job_id)
+                if lease_expiry is None or lease_expiry > now or move.hget(key, "finished_at"):
+                    move.unwatch()
+                    return False
+                attempts = int(move.hget(key, "attempts") or 0)
+                if attempts >= self.max_attempts:
+                    move.unwatch()
+                    print(f"❌ Job {job_id} lease expired after {attempts} attempts, giving up")
+                    self.fail(job_id, f"Lease expired {attempts} times")
+                    return False
+
+                move.multi()
+                move.zrem(self.leases_key, job_id)
+                move.lrem(self.processing_key, 1, job_id)
+                move.rpush(self.pending_key, job_id)
+                move.hset(key, mapping={"status": "queued", "worker": ""})
+                move.execute()
+            except redis.WatchError:
+                return False  # the job changed under us; look again next pass
+        print(f"♻️ Requeued job {job_id} (lease expired)")
+        return True
+
+    # ------------------ Status ------------------
+
+    def get(self, job_id):
+        """Return the job's status hash, or None if unknown or expired."""
+        job = self.r.hgetall(self.job_key(job_id))
+        return job or None
+
+    def stats(self):
+        """Pending, processing and active-URL counts."""
+        counts = self.r.pipeline(transaction=False)
+        counts.llen(self.pending_key)
+        counts.llen(self.processing_key)
+        counts.hlen(self.active_key)
+        counts.zcard(self.recent_key)
+        pending, processing, active, recent = counts.execute()
+        return {"pending": pending, "processing": processing, "active_urls": active, "recent_urls": recent}
+
+
+# Process-wide queue on the local Redis used by the API and the workers
+job_queue = RedisJobQueue(redis.StrictRedis(host='localhost', port=6379, db=0, decode_responses=True))
@@ -0,0 +1,309 @@
+"""
+Pluggable LLM backends behind prompts.generate_llm_response.
+
+Chosen with LLM_BACKEND:
+    cuda  Phi-3 with bitsandbytes 4-bit weights on the GPU (the original setup)
+    cpu   Phi-3 on CPU: dynamic int8 Linear layers or bf16 where the CPU supports it,
+          with a fixed thread count and optional core pinning
+    stub  Deterministic canned answers with simulated latency, for tests and load runs
+    auto  cuda if a GPU is available, otherwise cpu (default)
+
+Every backend exposes generate(messages), stream(messages), a tokenizer for
+prompt packing, and metrics() with time-to-first-token and tokens/second.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "auto")
+# auto picks bf16 when the CPU has native bf16 support, int8 otherwise
+LLM_CPU_PRECISION = os.environ.get("LLM_CPU_PRECISION", "auto")
+LLM_CPU_THREADS = int(os.environ.get("LLM_CPU_THREADS", 0))
+# Cores to pin the process to, e.g. "0-7" or "0,2,4,6" (empty: no pinning)
+LLM_CPU_AFFINITY = os.environ.get("LLM_CPU_AFFINITY", "")
+LLM_STUB_TTFT_MS = float(os.environ.get("LLM_STUB_TTFT_MS", 0))
+LLM_STUB_TOKENS_PER_SEC = float(os.environ.get("LLM_STUB_TOKENS_PER_SEC", 0))
+
+BACKENDS = ("auto", "cuda", "cpu", "stub")
+
+
+class GenerationMetrics:
+    """Rolling time-to-first-token and decode-rate statistics over recent requests."""
+
+    def __init__(self, window=1000):
+        self._lock = threading.Lock()
+        self._ttft = deque(maxlen=window)
+        self._rates = deque(maxlen=window)
+        self.requests = 0
+        self.tokens = 0
+
+    def record(self, ttft, num_tokens, total_seconds):
+        """
+        Record one finished request.
+
+        Args:
+            ttft (float or None): Seconds from submission to the first token.
+            num_tokens (int): Tokens generated.
+            total_seconds (float): Seconds from submission to completion.
+        """
+        with self._lock:
+            self.requests += 1
+            self.tokens += num_tokens
+            if ttft is not None:
+                self._ttft.append(ttft)
+                decode_seconds = total_seconds - ttft
+                if num_tokens > 1 and decode_seconds > 0:
+                    self._rates.append((num_tokens - 1) / decode_seconds)
+
+    def snapshot(self):
+        """
+        Returns:
+            Dict: requests, tokens, ttft_ms and tokens_per_sec (mean / p50 / p95 over the window).
+        """
+        import numpy as np
+
+        def summary(values, scale=1.0):
+            if not values:
+                return None
+            values = np.asarray(values) * scale
+            return {
+                "mean": round(float(values.mean()), 2),
+                "p50": round(float(np.percentile(values, 50)), 2),
+                "p95": round(float(np.percentile(values, 95)), 2),
+            }
+
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "tokens": self.tokens,
+                "ttft_ms": summary(list(self._ttft), 1000.0),
+                "tokens_per_sec": summary(list(self._rates)),
+            }
+
+
+class Phi3Backend:
+    """Phi-3 served by a Phi3Engine (continuous batching) on GPU or CPU."""
+
+    def __init__(self, name, engine, settings):
+        self.name = name
+        self.engine = engine
+        self.tokenizer = engine.tokenizer
+        self.settings = settings
+
+    def generate(self, messages, max_new_tokens=None):
+        return self.engine.generate(messages, max_new_tokens=max_new_tokens)
+
+    def stream(self, messages, max_new_tokens=None):
+        return self.engine.stream(messages, max_new_tokens=max_new_tokens)
+
+    def metrics(self):
+        return {"backend": self.name, "settings": self.settings, **self.engine.metrics.snapshot()}
+
+
+class StubTokenizer:
+    """
+    Whitespace tokenizer with the slice of the Hugging Face interface the prompt packer uses.
+
+    Words are hashed into a fixed id range, so memory does not grow with the
+    text seen. decode() only needs the words of recent calls (the packer
+    decodes a prefix of what it just encoded), so only the last
+    RECENT_WORDS ids are kept for it.
+    """
+
+    VOCAB_SIZE = 1 << 31
+    RECENT_WORDS = 65536
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._recent = OrderedDict()  # id -> word, least recently seen first
+
+    def _ids(self, text):
+        ids = []
+        with self._lock:
+            for word in text.split():
+                token_id = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=4).digest(), "little") % self.VOCAB_SIZE
+                self._recent[token_id] = word
+                self._recent.move_to_end(token_id)
+                ids.append(token_id)
+            while len(self._recent) > self.RECENT_WORDS:
+                self._recent.popitem(last=False)
+        return ids
+
+    def __call__(self, texts, add_special_tokens=False):
+        if isinstance(texts, str):
+            return {"input_ids": self._ids(texts)}
+        return {"input_ids": [self._ids(text) for text in texts]}
+
+    def decode(self, ids, skip_special_tokens=True):
+        with self._lock:
+            return " ".join(self._recent.get(i, "<unk>") for i in ids)
+
+
+class StubStream:
+    """Token stream of a stub answer; same iterator / cancel() contract as TokenStream."""
+
+    def __init__(self, backend, words):
+        self._backend = backend
+        self._words = words
+        self._submitted = time.monotonic()
+        self._first_token = None
+        self._position = 0
+        self._cancelled = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._cancelled or self._position >= len(self._words):
+            self._close()
+            raise StopIteration
+
+        delay = self._backend.token_delay(self._position)
+        if delay:
+            time.sleep(delay)
+        if self._first_token is None:
+            self._first_token = time.monotonic()
+
+        piece = self._words[self._position] if self._position == 0 else f" {self._words[self._position]}"
+        self._position += 1
+        return piece
+
+    def _close(self):
+        if self._submitted is None:
+            return
+        now = time.monotonic()
+        ttft = None if self._first_token is None else self._first_token - self._submitted
+        self._backend.metrics_recorder.record(ttft, self._position, now - self._submitted)
+        self._submitted = None
+
+    def cancel(self):
+        """Stop streaming; safe to call more than once."""
+        self._cancelled = True
+        self._close()
+
+
+class StubBackend:
+    """
+    Deterministic stand-in for the LLM.
+
+    The answer is derived from a hash of the conversation, so the same prompt
+    always yields the same text. LLM_STUB_TTFT_MS and LLM_STUB_TOKENS_PER_SEC
+    simulate model latency for load tests.
+    """
+
+    WORDS = ("the", "context", "states", "that", "answer", "is", "based", "on", "retrieved", "chunks")
+
+    def __init__(self, max_new_tokens=32, ttft_ms=LLM_STUB_TTFT_MS, tokens_per_sec=LLM_STUB_TOKENS_PER_SEC):
+        self.name = "stub"
+        self.tokenizer = StubTokenizer()
+        self.max_new_tokens = max_new_tokens
+        self.ttft = ttft_ms / 1000.0
+        self.token_interval = 1.0 / tokens_per_sec if tokens_per_sec > 0 else 0.0
+        self.settings = {"ttft_ms": ttft_ms, "tokens_per_sec": tokens_per_sec}
+        self.metrics_recorder = GenerationMetrics()
+
+    def token_delay(self, position):
+        return self.ttft if position == 0 else self.token_interval
+
+    def _answer(self, messages, max_new_tokens):
+        digest = hashlib.sha256(repr([(m["role"], m["content"]) for m in messages]).encode("utf-8")).digest()
+        n = min(max_new_tokens or self.max_new_tokens, self.max_new_tokens)
+        return ["[stub]"] + [self.WORDS[digest[i % len(digest)] % len(self.WORDS)] for i in range(n - 1)]
+
+    def generate(self, messages, max_new_tokens=None):
+        return "".join(self.stream(messages, max_new_tokens=max_new_tokens))
+
+    def stream(self, messages, max_new_tokens=None):
+        return StubStream(self, self._answer(messages, max_new_tokens))
+
+    def metrics(self):
+        return {"backend": self.name, "settings": self.settings, **self.metrics_recorder.snapshot()}
+
+
+def _parse_cpu_list(spec):
+    """'0-3,8' -> {0, 1, 2, 3, 8}"""
+    cpus = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            lo, hi = part.split("-")
+            cpus.update(range(int(lo), int(hi) + 1))
+        else:
+            cpus.add(int(part))
+    return cpus
+
+
+def configure_cpu_threads(num_threads=LLM_CPU_THREADS, affinity=LLM_CPU_AFFINITY):
+    """
+    Pin the process to the given cores and size torch's thread pool to match.
+
+    Args:
+        num_threads (int): Intra-op threads; 0 means one per allowed core.
+        affinity (str): Core list such as "0-7"; empty leaves affinity unchanged.
+
+    Returns:
+        Dict: Effective threads and pinned cores.
+    """
+    import torch
+
+    cpus = None
+    if affinity and hasattr(os, "sched_setaffinity"):
+        cpus = _parse_cpu_list(affinity)
+        os.sched_setaffinity(0, cpus)
+    allowed = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+
+    threads = num_threads or allowed
+    torch.set_num_threads(threads)
+    try:
+        # Decoding is one op after another; extra inter-op threads only contend
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # already set once the first parallel op has run
+    return {"threads": threads, "cpus": sorted(cpus) if cpus else None}
+
+
+def load_backend(name=LLM_BACKEND, max_new_tokens=500):
+    """
+    Build the configured backend.
+
+    Args:
+        name (str): One of BACKENDS.
+        max_new_tokens (int): Default generation limit.
+
+    Returns:
+        Phi3Backend or StubBackend
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown LLM backend: {name}")
+
+    if name == "stub":
+        return StubBackend(max_new_tokens=max_new_tokens)
+
+    import torch
+    from phi3 import Phi3Engine, load_phi3, load_phi3_cpu
+
+    if name == "auto":
+        name = "cuda" if torch.cuda.is_available() else "cpu"
+
+    if name == "cuda":
+        model, tokenizer = load_phi3()
+        settings = {"device": "cuda", "precision": "nf4"}
+    else:
+        settings = configure_cpu_threads()
+        model, tokenizer, precision = load_phi3_cpu(LLM_CPU_PRECISION)
+        settings = {"device": "cpu", "precision": precision, **settings}
+
+    engine = Phi3Engine(
+        model,
+        tokenizer,
+        max_batch_size=int(os.environ.get("PHI3_MAX_BATCH_SIZE", 8)),
+        max_wait_ms=float(os.environ.get("PHI3_MAX_WAIT_MS", 10)),
+        max_new_tokens=max_new_tokens,
+        prefix_cache=os.environ.get("PHI3_PREFIX_CACHE", "1") != "0",
+    )
+    print(f"🤖 LLM backend: {name} {settings}")
+    return Phi3Backend(name, engine, settings)
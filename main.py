@@ -1,17 +1,35 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List, Optional
 import redis
 import json
-from datetime import datetime
+import os
+import threading
+import time
+from datetime import datetime, timezone
 
 # ------------------ Import your modules ------------------
-from run_redis import enqueue_url
-from get_response import get_response
+from run_redis import enqueue_urls
+from job_queue import job_queue
+from get_response import get_response_stream, prepare_response, generate_answer, store_response
+from get_closest_chunks import query_rag_pipeline_batch
+from answer_cache import answer_cache
+from faiss_utils import start_index_watcher, configure_search_params, get_resident_index_info, set_resident_load_mode
+from faiss_segments import LEGACY_INDEX_FILE, read_manifest
+from text_utils import get_embedding_model, embedding_model_loaded
+from prompts import get_llm_backend, llm_loaded
+from request_executor import (
+    Deadline, DeadlineExceeded, Overloaded, admission, generation_executor, retrieval_executor, run_stage,
+)
 
 # ------------------ Redis Setup ------------------
 r = redis.StrictRedis(host='localhost', port=6379, db=0, decode_responses=True)
-FAISS_FILE = "faiss_index.idx"
+FAISS_DIR = "faiss_segments"
+
+# Warm-up loads these in the background; /ready reports 503 until all are loaded
+WARMUP_LLM = os.environ.get("WARMUP_LLM", "1") != "0"
+_warmup = {"started_at": None, "finished_at": None, "errors": {}}
 
 # ------------------ FastAPI Init ------------------
 app = FastAPI(
@@ -20,37 +38,299 @@ app = FastAPI(
     version="1.0.0"
 )
 
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    """429 when the admission queue is full, 503 when a query's deadline passed while queued."""
+    return JSONResponse(
+        {"detail": exc.detail}, status_code=exc.status_code, headers={"Retry-After": str(exc.retry_after)}
+    )
+
+@app.exception_handler(DeadlineExceeded)
+async def deadline_handler(request: Request, exc: DeadlineExceeded):
+    return JSONResponse({"detail": str(exc), "stage": exc.stage}, status_code=504)
+
+def _warm_up():
+    """Load the resident index, the encoder and (optionally) the LLM, recording failures."""
+    steps = [
+        ("index", lambda: start_index_watcher(FAISS_DIR, dimension=384)),
+        ("embedder", get_embedding_model),
+    ]
+    if WARMUP_LLM:
+        steps.append(("llm", get_llm_backend))
+
+    for name, load in steps:
+        start = time.monotonic()
+        try:
+            load()
+            print(f"🔥 Warmed up {name} in {time.monotonic() - start:.1f}s")
+        except Exception as e:
+            print(f"[ERROR] Warm-up of {name} failed: {e}")
+            _warmup["errors"][name] = str(e)
+    _warmup["finished_at"] = datetime.utcnow().isoformat()
+
+def _index_ready():
+    """True once the resident index is loaded and holds what is on disk (empty only if nothing is)."""
+    ntotal = get_resident_index_info()["ntotal"]
+    if ntotal is None:
+        return False
+    if ntotal > 0:
+        return True
+    return not read_manifest(FAISS_DIR)["segments"] and not os.path.exists(LEGACY_INDEX_FILE)
+
+@app.on_event("startup")
+def load_resources():
+    """
+    Start loading the FAISS index and models in the background.
+
+    The server answers immediately; anything not loaded yet is loaded on first
+    use by whichever request needs it. Poll /ready to know when warm-up is done.
+    """
+    # Set before any request can trigger a lazy index load
+    set_resident_load_mode(os.environ.get("FAISS_LOAD_MODE", "mmap"))
+    _warmup["started_at"] = datetime.utcnow().isoformat()
+    threading.Thread(target=_warm_up, name="warm-up", daemon=True).start()
+
 # ------------------ Request Models ------------------
 class URLRequest(BaseModel):
     urls: List[str]
 
+class QueryFilters(BaseModel):
+    url_ids: Optional[List[int]] = None
+    domains: Optional[List[str]] = None
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+
 class QueryRequest(BaseModel):
     query: str
+    filters: Optional[QueryFilters] = None
+
+class SearchParamsRequest(BaseModel):
+    nprobe: Optional[int] = None
+    ef_search: Optional[int] = None
+
+# Largest top_k a batch query may ask for; admission control counts requests, not hits
+MAX_TOP_K = 50
+
+class BatchQueryRequest(BaseModel):
+    queries: List[str]
+    top_k: int = Field(5, ge=1, le=MAX_TOP_K)
+    filters: Optional[QueryFilters] = None
+
+def _filters_dict(filters):
+    """Plain dict of the filters that were set, or None. Timestamps become naive UTC like chunks.created_at."""
+    if filters is None:
+        return None
+    result = {}
+    for key, value in filters.dict().items():
+        if not value:
+            continue
+        if isinstance(value, datetime):
+            if value.tzinfo is not None:
+                value = value.astimezone(timezone.utc).replace(tzinfo=None)
+            value = value.isoformat()
+        result[key] = value
+    return result
 
 # ------------------ API Endpoints ------------------
 
 @app.post("/ingest_url")
 def ingest_url(request: URLRequest):
     """
-    Enqueue one or more URLs into the Redis queue.
+    Enqueue one or more URLs into the Redis queue in one batch.
+
+    URLs that are already queued, being processed or were completed recently
+    are not enqueued again; their existing job id is returned instead.
     """
     try:
-        for url in request.urls:
-            enqueue_url(url)
-        return {"message": f"✅ {len(request.urls)} URLs enqueued successfully!"}
+        jobs = enqueue_urls(request.urls)
+        enqueued = sum(not job["duplicate"] for job in jobs)
+        return {"message": f"✅ {enqueued} URLs enqueued successfully!", "jobs": jobs}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    """
+    Look up an ingestion job's status (queued, processing, completed, failed).
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return job
+
 @app.post("/query")
-def query_endpoint(request: QueryRequest):
+async def query_endpoint(request: QueryRequest):
     """
     Generate a response to the user query using the RAG pipeline.
+
+    Optional filters (url_ids, domains, created_after, created_before) restrict
+    retrieval to matching chunks. Runs under admission control (429/503 with
+    Retry-After when overloaded) and fails with 504 once QUERY_DEADLINE_S passes.
     """
     print(f"🔍 Received query: {request.query}")
-    response = get_response(request.query)
-    return {"query": request.query, "response": response}
+    deadline = Deadline()
+    async with admission.slot(deadline):
+        context = await run_stage(
+            retrieval_executor, deadline, "retrieval", prepare_response, request.query, _filters_dict(request.filters)
+        )
+        if context["cached_answer"] is not None:
+            return {"query": request.query, "response": context["cached_answer"], "prompt": {"answer_cache_hit": True}}
+
+        streams = []
+        response = await run_stage(
+            generation_executor, deadline, "generation",
+            generate_answer, context["user_prompt"], deadline, streams.append,
+            on_timeout=lambda: [stream.cancel() for stream in streams],
+        )
+        store_response(context, response)
+    return {"query": request.query, "response": response, "prompt": context["stats"]}
+
+def _sse(event, data):
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/query_stream")
+async def query_stream_endpoint(request: QueryRequest, http_request: Request):
+    """
+    Stream the response as Server-Sent Events.
+
+    A 'retrieval' event with the chunk ids and snippets is sent first, then one
+    'token' event per decoded piece of text, then 'done'. If the client
+    disconnects or the deadline passes, generation for this request is
+    cancelled (the latter ends the stream with an 'error' event).
+    """
+    print(f"🔍 Received streaming query: {request.query}")
+    deadline = Deadline()
+    # The slot is held until the stream ends, not just until this handler returns
+    await admission.acquire(deadline)
+    started = time.monotonic()
+    try:
+        rag_results, stream, prompt_stats = await run_stage(
+            retrieval_executor, deadline, "retrieval", get_response_stream, request.query, _filters_dict(request.filters)
+        )
+    except BaseException:
+        admission.release(time.monotonic() - started)
+        raise
+
+    async def event_stream():
+        try:
+            yield _sse("retrieval", {
+                "query": request.query,
+                "chunks": [
+                    {"faiss_id": c["faiss_id"], "chunk_index": c["chunk_index"], "snippet": c["snippet"]}
+                    for c in rag_results
+                ],
+                "prompt": prompt_stats,
+            })
+            while True:
+                if await http_request.is_disconnected():
+                    print("🔌 Client disconnected, cancelling generation")
+                    return
+                piece = await run_stage(
+                    generation_executor, deadline, "stream_token", next, stream, None, on_timeout=stream.cancel
+                )
+                if piece is None:
+                    break
+                yield _sse("token", {"text": piece})
+            yield _sse("done", {})
+        except Exception as e:
+            yield _sse("error", {"detail": str(e)})
+        finally:
+            stream.cancel()
+            admission.release(time.monotonic() - started)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+@app.post("/query_batch")
+async def query_batch_endpoint(request: BatchQueryRequest):
+    """
+    Retrieve the closest chunks for several queries in one batched pass.
+    """
+    print(f"🔍 Received batch of {len(request.queries)} queries")
+    deadline = Deadline()
+    async with admission.slot(deadline):
+        batch_results = await run_stage(
+            retrieval_executor, deadline, "retrieval",
+            lambda: query_rag_pipeline_batch(
+                request.queries, FAISS_DIR, top_k=request.top_k, filters=_filters_dict(request.filters)
+            ),
+        )
+    return {
+        "results": [
+            {"query": query, "chunks": chunks}
+            for query, chunks in zip(request.queries, batch_results)
+        ]
+    }
+
+@app.post("/search_params")
+def search_params_endpoint(request: SearchParamsRequest):
+    """
+    Tune nprobe (IVF) / efSearch (HNSW) on the live index.
+    """
+    return configure_search_params(nprobe=request.nprobe, ef_search=request.ef_search)
+
+@app.get("/index_info")
+def index_info():
+    """
+    Report the resident index and which load mode (memory / mmap) is active.
+    """
+    return get_resident_index_info()
+
+@app.get("/ingest_stats")
+def ingest_stats():
+    """
+    Report ingestion queue depths and throughput (published by worker_pool.py / ingest_pipeline.py).
+    """
+    pool_stats = r.get("ingest:stats")
+    pipeline_stats = r.get("ingest:pipeline_stats")
+    if pool_stats is None and pipeline_stats is None:
+        raise HTTPException(status_code=404, detail="No ingestion stats published yet")
+    return {
+        "worker_pool": json.loads(pool_stats) if pool_stats else None,
+        "pipeline": json.loads(pipeline_stats) if pipeline_stats else None,
+        "queue": job_queue.stats(),
+    }
+
+@app.get("/cache_stats")
+def cache_stats():
+    """
+    Report answer-cache hit, miss and eviction counters.
+    """
+    return answer_cache.stats()
+
+@app.get("/serving_stats")
+def serving_stats():
+    """
+    Report in-flight and queued queries, admission outcomes, queue wait and per-stage latency.
+    """
+    return admission.stats()
+
+@app.get("/llm_stats")
+def llm_stats():
+    """
+    Report the LLM backend, its settings, time to first token and tokens/second.
+    """
+    if not llm_loaded():
+        return {"backend": None, "loaded": False}
+    return get_llm_backend().metrics()
 
 # ------------------ Health Check ------------------
+@app.get("/ready")
+def ready():
+    """
+    Readiness probe: 200 once the index and models are loaded, 503 before that.
+    """
+    components = {
+        "index": _index_ready(),
+        "embedder": embedding_model_loaded(),
+    }
+    if WARMUP_LLM:
+        components["llm"] = llm_loaded()
+
+    is_ready = all(components.values())
+    body = {"ready": is_ready, "components": components, **_warmup}
+    return JSONResponse(body, status_code=200 if is_ready else 503)
+
 @app.get("/")
 def root():
     return {"message": "RAG + Redis API is running 🚀"}
@@ -0,0 +1,189 @@
+"""
+ONNX Runtime backend for the sentence embedding model, with dynamic int8 quantization.
+
+Selected with EMBEDDING_BACKEND=onnx (see text_utils.get_embedding_model). The
+model is exported once from the SentenceTransformer (transformer + mean pooling
++ normalization) and quantized with dynamic int8 weights:
+
+    python onnx_embedder.py export [--no-quantize] [--output-dir DIR]
+
+If the exported model is missing, the first get_embedding_model() call exports it.
+"""
+import json
+import os
+import sys
+import threading
+
+import numpy as np
+
+ONNX_MODEL_DIR = os.environ.get("ONNX_MODEL_DIR", "onnx_models/all-MiniLM-L12-v2")
+# 0 lets ONNX Runtime pick (one thread per physical core)
+ONNX_INTRA_OP_THREADS = int(os.environ.get("ONNX_INTRA_OP_THREADS", 0))
+
+MODEL_FILE = "model.onnx"
+QUANTIZED_MODEL_FILE = "model.int8.onnx"
+CONFIG_FILE = "embedder_config.json"
+
+
+def export_onnx_model(model_name, output_dir=ONNX_MODEL_DIR, quantize=True):
+    """
+    Export a SentenceTransformer's transformer to ONNX and quantize it to int8.
+
+    Pooling and normalization stay in numpy (see OnnxEmbedder), so the graph is
+    the plain encoder with dynamic batch and sequence axes.
+
+    Args:
+        model_name (str): SentenceTransformer model name.
+        output_dir (str): Directory for the ONNX files, tokenizer and config.
+        quantize (bool): Also write a dynamically quantized int8 model.
+
+    Returns:
+        str: Path of the model file OnnxEmbedder will load.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from sentence_transformers.models import Normalize
+
+    os.makedirs(output_dir, exist_ok=True)
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer = st_model[0].auto_model.eval()
+    tokenizer = st_model.tokenizer
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    model_path = os.path.join(output_dir, MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(sample[name] for name in input_names),
+            model_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+        )
+    tokenizer.save_pretrained(output_dir)
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(model_path, os.path.join(output_dir, QUANTIZED_MODEL_FILE), weight_type=QuantType.QInt8)
+
+    config = {
+        "model_name": model_name,
+        "max_seq_length": st_model.max_seq_length,
+        "normalize": any(isinstance(module, Normalize) for module in st_model),
+        "quantized": quantize,
+    }
+    with open(os.path.join(output_dir, CONFIG_FILE), "w") as f:
+        json.dump(config, f, indent=2)
+
+    print(f"✅ Exported {model_name} to {output_dir} ({'int8' if quantize else 'fp32'})")
+    return os.path.join(output_dir, QUANTIZED_MODEL_FILE if quantize else MODEL_FILE)
+
+
+class OnnxEmbedder:
+    """
+    Drop-in replacement for SentenceTransformer.encode backed by ONNX Runtime.
+
+    Texts are tokenized once, sorted by length and batched so each batch is
+    padded only to its own longest text, then mean-pooled (and normalized, like
+    the source model) and returned in the original order.
+    """
+
+    def __init__(self, model_dir=ONNX_MODEL_DIR, intra_op_threads=ONNX_INTRA_OP_THREADS, quantized=True):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        with open(os.path.join(model_dir, CONFIG_FILE)) as f:
+            self.config = json.load(f)
+        quantized = quantized and self.config.get("quantized", False)
+        model_path = os.path.join(model_dir, QUANTIZED_MODEL_FILE if quantized else MODEL_FILE)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = 1
+
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.max_seq_length = self.config["max_seq_length"]
+        self.normalize = self.config["normalize"]
+        self.quantized = quantized
+        # InferenceSession.run is thread-safe, the tokenizer is not guaranteed to be
+        self._tokenizer_lock = threading.Lock()
+
+    def encode(self, sentences, batch_size=32, convert_to_numpy=True, show_progress_bar=False, **kwargs):
+        """
+        Embed sentences; same call shape as SentenceTransformer.encode.
+
+        Args:
+            sentences (List[str]): Texts to embed.
+            batch_size (int): Texts per ONNX Runtime call.
+
+        Returns:
+            np.ndarray: float32 array of shape (len(sentences), embedding_dim).
+        """
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        if not sentences:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        with self._tokenizer_lock:
+            encoded = self.tokenizer(
+                list(sentences), truncation=True, max_length=self.max_seq_length, padding=False
+            )["input_ids"]
+
+        # Shortest first, so each batch pads to a similar length
+        order = np.argsort([len(ids) for ids in encoded], kind="stable")
+        pad_id = self.tokenizer.pad_token_id or 0
+        outputs = [None] * len(sentences)
+
+        for start in range(0, len(order), batch_size):
+            rows = order[start:start + batch_size]
+            width = max(len(encoded[i]) for i in rows)
+            input_ids = np.full((len(rows), width), pad_id, dtype=np.int64)
+            attention_mask = np.zeros((len(rows), width), dtype=np.int64)
+            for r, i in enumerate(rows):
+                input_ids[r, :len(encoded[i])] = encoded[i]
+                attention_mask[r, :len(encoded[i])] = 1
+
+            feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+            if "token_type_ids" in self.input_names:
+                feeds["token_type_ids"] = np.zeros_like(input_ids)
+            hidden = self.session.run(["last_hidden_state"], feeds)[0]
+
+            # Mean pooling over real tokens
+            mask = attention_mask[:, :, None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if self.normalize:
+                pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+            for r, i in enumerate(rows):
+                outputs[i] = pooled[r]
+
+        return np.stack(outputs).astype(np.float32)
+
+
+def load_onnx_embedder(model_name, model_dir=ONNX_MODEL_DIR):
+    """Load the ONNX embedder, exporting and quantizing the model first if needed."""
+    if not os.path.exists(os.path.join(model_dir, CONFIG_FILE)):
+        print(f"📦 No ONNX export in {model_dir}, exporting {model_name}...")
+        export_onnx_model(model_name, model_dir)
+    return OnnxEmbedder(model_dir)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "export":
+        from text_utils import EMBEDDING_MODEL_NAME
+
+        args = sys.argv[2:]
+        output_dir = args[args.index("--output-dir") + 1] if "--output-dir" in args else ONNX_MODEL_DIR
+        export_onnx_model(EMBEDDING_MODEL_NAME, output_dir, quantize="--no-quantize" not in args)
+    else:
+        print("Usage: python onnx_embedder.py export [--no-quantize] [--output-dir DIR]")
@@ -1,5 +1,24 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
 import torch
+import torch.nn.functional as F
 from transformers import AutoModelForCausalLM, AutoTokenizer, pipeline, BitsAndBytesConfig
+from transformers import StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+
+from llm_backends import GenerationMetrics
+
+try:
+    from transformers import DynamicCache
+except ImportError:  # older transformers only know tuple caches
+    DynamicCache = None
+
+PHI3_MODEL_NAME = "microsoft/Phi-3-mini-4k-instruct"
+
+# Text-generation pipelines, built once per model
+_pipelines = {}
 
 def load_phi3() : 
     # Use 4-bit quantization config (can also try 8-bit if 4-bit doesn't work well on CPU)
@@ -12,24 +31,69 @@ def load_phi3() :
 
     # Load quantized model
     model = AutoModelForCausalLM.from_pretrained(
-        "microsoft/Phi-3-mini-4k-instruct",
+        PHI3_MODEL_NAME,
         device_map="cuda",  # Let HF decide device (CPU fallback)
         quantization_config=bnb_config,
         trust_remote_code=False
     )
 
     # Tokenizer
-    tokenizer = AutoTokenizer.from_pretrained("microsoft/Phi-3-mini-4k-instruct")
+    tokenizer = load_phi3_tokenizer()
 
     return model, tokenizer
 
-def get_phi3_inference(messages, model, tokenizer) : 
-    # Inference pipeline
-    pipe = pipeline(
-        "text-generation",
-        model=model,
-        tokenizer=tokenizer,
+def load_phi3_tokenizer() : 
+    """Load only the Phi-3 tokenizer (no model weights)."""
+    return AutoTokenizer.from_pretrained(PHI3_MODEL_NAME)
+
+def cpu_supports_bf16():
+    """True if the CPU has native bf16 matmul support (AVX512-BF16 / AMX)."""
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+def load_phi3_cpu(precision="auto") : 
+    """
+    Load Phi-3 for CPU inference, without CUDA or bitsandbytes.
+
+    Args:
+        precision (str): "int8" (fp32 weights, Linear layers dynamically
+            quantized to int8), "bf16", "fp32", or "auto" (bf16 when the CPU
+            supports it natively, int8 otherwise).
+
+    Returns:
+        Tuple[model, tokenizer, str]: Model, tokenizer and the precision used.
+    """
+    if precision == "auto":
+        precision = "bf16" if cpu_supports_bf16() else "int8"
+    if precision not in ("int8", "bf16", "fp32"):
+        raise ValueError(f"Unknown CPU precision: {precision}")
+
+    model = AutoModelForCausalLM.from_pretrained(
+        PHI3_MODEL_NAME,
+        torch_dtype=torch.bfloat16 if precision == "bf16" else torch.float32,
+        low_cpu_mem_usage=True,
+        trust_remote_code=False
     )
+    model.eval()
+
+    if precision == "int8":
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    tokenizer = load_phi3_tokenizer()
+    return model, tokenizer, precision
+
+def get_phi3_inference(messages, model, tokenizer) : 
+    # Inference pipeline (reused across calls for the same model)
+    pipe = _pipelines.get(id(model))
+    if pipe is None:
+        pipe = pipeline(
+            "text-generation",
+            model=model,
+            tokenizer=tokenizer,
+        )
+        _pipelines[id(model)] = pipe
 
     # Generation arguments
     generation_args = {
@@ -44,6 +108,496 @@ def get_phi3_inference(messages, model, tokenizer) :
     response = (output[0]['generated_text'])
     return response
 
+class _CancelCriteria(StoppingCriteria):
+    """Stop generation as soon as the given event is set."""
+
+    def __init__(self, cancel_event):
+        self.cancel_event = cancel_event
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return self.cancel_event.is_set()
+
+def get_phi3_inference_stream(messages, model, tokenizer) : 
+    """
+    Incremental form of get_phi3_inference: yields text pieces as they are decoded.
+
+    Generation runs in a background thread; closing the generator (e.g. on
+    client disconnect) stops it at the next decoding step.
+    """
+    input_ids = tokenizer.apply_chat_template(
+        messages, add_generation_prompt=True, return_tensors="pt"
+    ).to(model.device)
+
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+    cancel_event = threading.Event()
+
+    generation_args = {
+        "max_new_tokens": 500,
+        "do_sample": False,
+        "streamer": streamer,
+        "stopping_criteria": StoppingCriteriaList([_CancelCriteria(cancel_event)]),
+    }
+
+    thread = threading.Thread(
+        target=model.generate, args=(input_ids,), kwargs=generation_args, daemon=True
+    )
+    thread.start()
+
+    try:
+        for text in streamer:
+            if text:
+                yield text
+    finally:
+        cancel_event.set()
+
+def _cache_to_tuple(past_key_values):
+    """Return the KV cache as a tuple of per-layer (key, value) tensors."""
+    if hasattr(past_key_values, "to_legacy_cache"):
+        return past_key_values.to_legacy_cache()
+    return past_key_values
+
+
+def _tuple_to_cache(past_key_values):
+    """Wrap a tuple KV cache in the cache object the model expects."""
+    if DynamicCache is not None:
+        return DynamicCache.from_legacy_cache(past_key_values)
+    return past_key_values
+
+
+def _left_pad_past(past_key_values, pad):
+    """Left-pad every cached tensor of shape (batch, heads, seq, dim) along seq."""
+    if pad == 0:
+        return past_key_values
+    return tuple(tuple(F.pad(t, (0, 0, pad, 0)) for t in layer) for layer in past_key_values)
+
+
+def _eos_token_ids(model, tokenizer):
+    """Collect every token id that should end a sequence."""
+    eos = model.generation_config.eos_token_id
+    eos = set(eos if isinstance(eos, (list, tuple)) else [eos])
+    eos.add(tokenizer.eos_token_id)
+    eos.discard(None)
+    return eos
+
+
+class GenerationRequest:
+    """A single prompt waiting for, or taking part in, batched decoding."""
+
+    def __init__(self, input_ids, max_new_tokens, stream=False, system_prompt=None):
+        self.input_ids = input_ids
+        self.max_new_tokens = max_new_tokens
+        # Text of the leading system message, used to look up the cached prefix
+        self.system_prompt = system_prompt
+        self.submitted_at = time.monotonic()
+        self.first_token_at = None
+        self.generated = []
+        self.finished = False
+        self.cancelled = False
+        self.future = Future()
+        # Token ids are pushed here as they are decoded; None marks the end
+        self.stream = queue.Queue() if stream else None
+
+
+class TokenStream:
+    """
+    Iterator over the text of a streaming request, piece by piece.
+
+    Token ids arrive from the engine thread and are detokenized here, in the
+    consumer's thread, so streaming adds no work to the batching loop.
+    """
+
+    def __init__(self, tokenizer, request):
+        self.tokenizer = tokenizer
+        self.request = request
+        self._tokens = []
+        self._emitted = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while True:
+            token = self.request.stream.get()
+            if token is None:
+                # Surface generation errors to the consumer
+                self.request.future.result()
+                raise StopIteration
+
+            self._tokens.append(token)
+            text = self.tokenizer.decode(self._tokens, skip_special_tokens=True)
+            # Hold back incomplete multi-byte characters until the next token
+            if text.endswith("\ufffd"):
+                continue
+            piece = text[self._emitted:]
+            self._emitted = len(text)
+            if piece:
+                return piece
+
+    def cancel(self):
+        """Stop generating for this request; safe to call from any thread."""
+        self.request.cancelled = True
+
+
+class Phi3Engine:
+    """
+    Long-lived generation engine that decodes concurrent requests as one batch.
+
+    Requests that arrive within max_wait_ms of each other are prefilled together
+    as a left-padded batch and then decoded greedily step by step with a shared
+    KV cache. Sequences leave the batch as soon as they emit EOS or reach their
+    token limit, and waiting requests join at the next step while there is room.
+
+    With prefix_cache, the KV cache of the system-prompt prefix is computed
+    once and shared by every request that starts with it, so only the user
+    prompt is prefilled per request. It is rebuilt when the system prompt changes.
+    """
+
+    def __init__(self, model, tokenizer, max_batch_size=8, max_wait_ms=10, max_new_tokens=500, prefix_cache=True):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_new_tokens = max_new_tokens
+        self.pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+        self.eos_token_ids = _eos_token_ids(model, tokenizer)
+        self.prefix_cache = prefix_cache
+        self.metrics = GenerationMetrics()
+        # {"system_prompt": str, "ids": List[int], "past": tuple KV cache of batch size 1}
+        self._prefix = None
+
+        self._pending = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._reset_batch()
+
+    def _reset_batch(self):
+        self._active = []
+        self._past = None
+        self._attention_mask = None
+        self._next_tokens = None
+
+    def start(self):
+        """Start the background decoding thread (idempotent)."""
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="phi3-engine", daemon=True)
+                self._thread.start()
+
+    def submit(self, messages, max_new_tokens=None):
+        """
+        Queue a chat conversation for generation.
+
+        Args:
+            messages (List[Dict]): Chat messages with 'role' and 'content'.
+            max_new_tokens (int, optional): Token limit for this request.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the generated text.
+        """
+        return self._enqueue(messages, max_new_tokens).future
+
+    def generate(self, messages, max_new_tokens=None):
+        """Blocking helper around submit()."""
+        return self.submit(messages, max_new_tokens=max_new_tokens).result()
+
+    def stream(self, messages, max_new_tokens=None):
+        """
+        Queue a chat conversation and stream its text as it is decoded.
+
+        Args:
+            messages (List[Dict]): Chat messages with 'role' and 'content'.
+            max_new_tokens (int, optional): Token limit for this request.
+
+        Returns:
+            TokenStream: Iterator of text pieces; call cancel() to abandon the request.
+        """
+        request = self._enqueue(messages, max_new_tokens, stream=True)
+        return TokenStream(self.tokenizer, request)
+
+    def _enqueue(self, messages, max_new_tokens, stream=False):
+        input_ids = self.tokenizer.apply_chat_template(messages, add_generation_prompt=True, tokenize=True)
+        system_prompt = messages[0]["content"] if messages and messages[0].get("role") == "system" else None
+        request = GenerationRequest(
+            list(input_ids), max_new_tokens or self.max_new_tokens, stream=stream, system_prompt=system_prompt
+        )
+        self.start()
+        self._pending.put(request)
+        return request
+
+    # ------------------ Batching loop ------------------
+
+    def _collect_new(self):
+        """Take waiting requests that fit in the batch, waiting briefly when idle."""
+        free = self.max_batch_size - len(self._active)
+        new = []
+
+        if not self._active:
+            new.append(self._pending.get())  # block until there is work
+            deadline = time.monotonic() + self.max_wait
+            while len(new) < free:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    new.append(self._pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+        while len(new) < free:
+            try:
+                new.append(self._pending.get_nowait())
+            except queue.Empty:
+                break
+
+        # Requests abandoned while queued never reach the model
+        for request in new:
+            if request.cancelled:
+                self._finish(request)
+        return [request for request in new if not request.cancelled]
+
+    def _record(self, requests, next_tokens):
+        now = time.monotonic()
+        for request, token in zip(requests, next_tokens.tolist()):
+            if request.first_token_at is None:
+                request.first_token_at = now
+            if request.cancelled or token in self.eos_token_ids:
+                request.finished = True
+                continue
+            request.generated.append(token)
+            if request.stream is not None:
+                request.stream.put(token)
+            if len(request.generated) >= request.max_new_tokens:
+                request.finished = True
+
+    def _finish(self, request, error=None):
+        """Resolve a request's future and close its stream."""
+        if request.future.done():
+            return
+        if error is not None:
+            request.future.set_exception(error)
+        else:
+            text = self.tokenizer.decode(request.generated, skip_special_tokens=True)
+            request.future.set_result(text)
+            first = None if request.first_token_at is None else request.first_token_at - request.submitted_at
+            self.metrics.record(first, len(request.generated), time.monotonic() - request.submitted_at)
+        if request.stream is not None:
+            request.stream.put(None)
+
+    # ------------------ System prompt prefix cache ------------------
+
+    def _system_prefix_ids(self, system_prompt):
+        """
+        Token ids every conversation with this system prompt starts with.
+
+        Rendered with two different user messages and cut at the first
+        differing token, so tokenizer merges across the boundary are excluded.
+        """
+        renders = [
+            self.tokenizer.apply_chat_template(
+                [{"role": "system", "content": system_prompt}, {"role": "user", "content": probe}],
+                add_generation_prompt=True, tokenize=True,
+            )
+            for probe in ("A", "zz 9")
+        ]
+        n = 0
+        for a, b in zip(*renders):
+            if a != b:
+                break
+            n += 1
+        return list(renders[0][:n])
+
+    def _prefix_for(self, request):
+        """Return the cached prefix matching this request, building it for a new system prompt."""
+        if not self.prefix_cache or request.system_prompt is None:
+            return None
+
+        if self._prefix is None or self._prefix["system_prompt"] != request.system_prompt:
+            # New (or changed) system prompt: the previous prefix is dropped
+            ids = self._system_prefix_ids(request.system_prompt)
+            past = None
+            if ids:
+                input_ids = torch.tensor([ids], dtype=torch.long, device=self.model.device)
+                output = self.model(input_ids=input_ids, use_cache=True)
+                past = _cache_to_tuple(output.past_key_values)
+                print(f"🧠 Cached system prompt prefix ({len(ids)} tokens)")
+            self._prefix = {"system_prompt": request.system_prompt, "ids": ids, "past": past}
+
+        prefix = self._prefix
+        n = len(prefix["ids"])
+        # The prompt must continue past the prefix so there is something to prefill
+        if prefix["past"] is None or len(request.input_ids) <= n or request.input_ids[:n] != prefix["ids"]:
+            return None
+        return prefix
+
+    # ------------------ Prefill ------------------
+
+    def _prefill_full(self, requests):
+        """Prefill whole prompts as a left-padded batch."""
+        device = self.model.device
+        max_len = max(len(r.input_ids) for r in requests)
+
+        input_ids = torch.full((len(requests), max_len), self.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(requests), max_len), dtype=torch.long)
+        for row, request in enumerate(requests):
+            n = len(request.input_ids)
+            input_ids[row, max_len - n:] = torch.tensor(request.input_ids, dtype=torch.long)
+            attention_mask[row, max_len - n:] = 1
+
+        input_ids = input_ids.to(device)
+        attention_mask = attention_mask.to(device)
+        position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)
+
+        output = self.model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            use_cache=True,
+        )
+        return output, attention_mask
+
+    def _prefill_with_prefix(self, requests, prefix):
+        """
+        Prefill only what follows the cached prefix.
+
+        Rows are laid out as [prefix | left padding | rest of prompt]; padding is
+        masked out and positions continue from the end of the prefix, so every
+        token sees the same keys and positions as in a full prefill.
+        """
+        device = self.model.device
+        prefix_len = len(prefix["ids"])
+        suffixes = [r.input_ids[prefix_len:] for r in requests]
+        max_len = max(len(suffix) for suffix in suffixes)
+
+        input_ids = torch.full((len(requests), max_len), self.pad_token_id, dtype=torch.long)
+        suffix_mask = torch.zeros((len(requests), max_len), dtype=torch.long)
+        for row, suffix in enumerate(suffixes):
+            input_ids[row, max_len - len(suffix):] = torch.tensor(suffix, dtype=torch.long)
+            suffix_mask[row, max_len - len(suffix):] = 1
+
+        input_ids = input_ids.to(device)
+        suffix_mask = suffix_mask.to(device)
+        attention_mask = torch.cat([suffix_mask.new_ones((len(requests), prefix_len)), suffix_mask], dim=-1)
+        position_ids = prefix_len + (suffix_mask.cumsum(-1) - 1).clamp(min=0)
+
+        # expand() shares the prefix tensors; the model concatenates into new ones
+        past = tuple(
+            tuple(t.expand(len(requests), -1, -1, -1) for t in layer) for layer in prefix["past"]
+        )
+        output = self.model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            past_key_values=_tuple_to_cache(past),
+            use_cache=True,
+        )
+        return output, attention_mask
+
+    def _prefill(self, requests):
+        """Run the prompts of newly admitted requests and merge them into the batch."""
+        groups = {}
+        for request in requests:
+            prefix = self._prefix_for(request)
+            groups.setdefault(id(prefix), (prefix, []))[1].append(request)
+
+        for prefix, group in groups.values():
+            if prefix is None:
+                output, attention_mask = self._prefill_full(group)
+            else:
+                output, attention_mask = self._prefill_with_prefix(group, prefix)
+            next_tokens = output.logits[:, -1, :].argmax(dim=-1)
+            self._record(group, next_tokens)
+            self._merge(group, _cache_to_tuple(output.past_key_values), attention_mask, next_tokens)
+
+    def _merge(self, requests, past, attention_mask, next_tokens):
+        """Add freshly prefilled requests to the running batch."""
+        if not self._active:
+            self._active = list(requests)
+            self._past = past
+            self._attention_mask = attention_mask
+            self._next_tokens = next_tokens
+            return
+
+        # Left-pad the shorter of (running batch, new batch) so the caches line up
+        old_len = self._attention_mask.shape[1]
+        new_len = attention_mask.shape[1]
+        target = max(old_len, new_len)
+        old_past = _left_pad_past(self._past, target - old_len)
+        new_past = _left_pad_past(past, target - new_len)
+
+        self._past = tuple(
+            tuple(torch.cat([old, new], dim=0) for old, new in zip(old_layer, new_layer))
+            for old_layer, new_layer in zip(old_past, new_past)
+        )
+        self._attention_mask = torch.cat([
+            F.pad(self._attention_mask, (target - old_len, 0)),
+            F.pad(attention_mask, (target - new_len, 0)),
+        ], dim=0)
+        self._next_tokens = torch.cat([self._next_tokens, next_tokens], dim=0)
+        self._active.extend(requests)
+
+    def _decode_step(self):
+        """Feed the last token of every active sequence and pick the next one."""
+        batch_size = len(self._active)
+        self._attention_mask = torch.cat(
+            [self._attention_mask, self._attention_mask.new_ones((batch_size, 1))], dim=-1
+        )
+        position_ids = self._attention_mask.sum(-1, keepdim=True) - 1
+
+        output = self.model(
+            input_ids=self._next_tokens[:, None],
+            attention_mask=self._attention_mask,
+            position_ids=position_ids,
+            past_key_values=_tuple_to_cache(self._past),
+            use_cache=True,
+        )
+        self._past = _cache_to_tuple(output.past_key_values)
+        self._next_tokens = output.logits[:, -1, :].argmax(dim=-1)
+        self._record(self._active, self._next_tokens)
+
+    def _retire_finished(self):
+        """Resolve finished requests and drop them from the running batch."""
+        keep = [i for i, request in enumerate(self._active) if not request.finished]
+        if len(keep) == len(self._active):
+            return
+
+        for request in self._active:
+            if request.finished:
+                self._finish(request)
+
+        if not keep:
+            self._reset_batch()
+            return
+
+        rows = torch.tensor(keep, device=self._attention_mask.device)
+        self._active = [self._active[i] for i in keep]
+        self._attention_mask = self._attention_mask.index_select(0, rows)
+        self._next_tokens = self._next_tokens.index_select(0, rows)
+        self._past = tuple(tuple(t.index_select(0, rows) for t in layer) for layer in self._past)
+
+        # Drop leading columns that are now padding for every remaining sequence
+        first = int(self._attention_mask.any(dim=0).int().argmax())
+        if first > 0:
+            self._attention_mask = self._attention_mask[:, first:]
+            self._past = tuple(tuple(t[:, :, first:, :] for t in layer) for layer in self._past)
+
+    def _run(self):
+        while True:
+            new = self._collect_new()
+            try:
+                with torch.inference_mode():
+                    if new:
+                        self._prefill(new)
+                    self._retire_finished()
+                    if self._active:
+                        self._decode_step()
+                        self._retire_finished()
+            except Exception as e:
+                print(f"[ERROR] Generation batch failed: {e}")
+                for request in self._active + new:
+                    self._finish(request, error=e)
+                self._reset_batch()
+
+
 if __name__ == '__main__' : 
 
     messages = [
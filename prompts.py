@@ -1,6 +1,60 @@
-from phi3 import load_phi3, get_phi3_inference
+import threading
 
-model, tokenizer = load_phi3()
+from context_packer import context_token_budget, count_tokens, pack_context
+
+MAX_NEW_TOKENS = 500
+
+# The LLM backend is loaded on first use (or by get_llm_backend() at warm-up),
+# so importing this module does not pull in torch / transformers
+_llm = {"backend": None, "tokenizer": None}
+_llm_lock = threading.Lock()
+
+def get_llm_backend():
+    """
+    Return the configured LLM backend (see llm_backends.LLM_BACKEND), loading it on first call.
+
+    Thread-safe: concurrent first callers wait for a single load.
+
+    Returns:
+        Phi3Backend or StubBackend: Object with generate(), stream() and metrics().
+    """
+    if _llm["backend"] is None:
+        with _llm_lock:
+            if _llm["backend"] is None:
+                from llm_backends import load_backend
+
+                backend = load_backend(max_new_tokens=MAX_NEW_TOKENS)
+                _llm["tokenizer"] = backend.tokenizer
+                _llm["backend"] = backend
+    return _llm["backend"]
+
+def get_engine():
+    """Return the Phi3Engine of a Phi-3 backend (not available with the stub backend)."""
+    return get_llm_backend().engine
+
+def get_tokenizer():
+    """
+    Return the backend's tokenizer, loading only the tokenizer if the model is not loaded yet.
+
+    Returns:
+        PreTrainedTokenizer (or StubTokenizer for the stub backend)
+    """
+    if _llm["tokenizer"] is None:
+        with _llm_lock:
+            if _llm["tokenizer"] is None:
+                from llm_backends import LLM_BACKEND, StubTokenizer
+
+                if LLM_BACKEND == "stub":
+                    _llm["tokenizer"] = StubTokenizer()
+                else:
+                    from phi3 import load_phi3_tokenizer
+
+                    _llm["tokenizer"] = load_phi3_tokenizer()
+    return _llm["tokenizer"]
+
+def llm_loaded():
+    """True once the LLM backend has been loaded in this process."""
+    return _llm["backend"] is not None
 
 system_prompt = '''
 You are an intelligent assistant designed to answer user questions using relevant context provided from a retrieval-augmented generation (RAG) system. 
@@ -13,30 +67,54 @@ Always cite the relevant chunks if needed and structure the answer in a readable
 
 '''
 
-def generate_user_prompt(rag_results, user_query):
+def _format_user_prompt(texts, user_query):
+    """Lay out the query and context texts in the prompt format the system prompt expects."""
+    prompt_lines = [f"User Query:\n{user_query}\n", "Reference Material (Chunks):"]
+
+    for i, text in enumerate(texts, start=1):
+        prompt_lines.append(f"Chunk {i}: {text}")
+
+    prompt_lines.append("\nBased on the above chunks, provide a complete answer to the user query.")
+
+    return "\n".join(prompt_lines)
+
+def generate_user_prompt(rag_results, user_query, return_stats=False):
     """
     Generates a structured user prompt for an LLM using retrieved RAG chunks.
 
+    Neighbouring chunks from the same URL are merged with their overlap
+    removed, and content is packed in relevance order up to the token budget
+    left after the system prompt, query and MAX_NEW_TOKENS.
+
     Args:
         rag_results (List[Dict]): List of dicts containing retrieved chunks.
-            Each dict must have a 'text' key with the chunk text.
+            Each dict must have a 'text' key with the chunk text; 'url_id',
+            'chunk_index' and 'distance' enable merging and relevance ordering.
         user_query (str): The original user query.
+        return_stats (bool): Also return prompt token accounting.
 
     Returns:
         str: A structured prompt ready to send to the LLM.
+        Dict (only with return_stats): prompt_tokens, prompt_tokens_saved
+            (versus concatenating every chunk) and packing details.
     """
-
-    prompt_lines = [f"User Query:\n{user_query}\n", "Reference Material (Chunks):"]
-    
-    for i, chunk in enumerate(rag_results, start=1):
-        text = chunk.get("text", "").strip()
-        # Optional: truncate extremely long chunks if needed
-        prompt_lines.append(f"Chunk {i}: {text}")
-    
-    prompt_lines.append("\nBased on the above chunks, provide a complete answer to the user query.")
-    
-    user_prompt = "\n".join(prompt_lines)
-    return user_prompt
+    tokenizer = get_tokenizer()
+    budget = context_token_budget(tokenizer, system_prompt, user_query, MAX_NEW_TOKENS)
+    spans, stats = pack_context(rag_results, tokenizer, budget)
+    user_prompt = _format_user_prompt([span["text"] for span in spans], user_query)
+
+    if not return_stats:
+        return user_prompt
+
+    unpacked_prompt = _format_user_prompt([c.get("text", "").strip() for c in rag_results], user_query)
+    prompt_tokens, unpacked_tokens = count_tokens(tokenizer, [user_prompt, unpacked_prompt])
+    stats = {
+        "prompt_tokens": prompt_tokens,
+        "prompt_tokens_saved": unpacked_tokens - prompt_tokens,
+        "context_token_budget": budget,
+        **stats,
+    }
+    return user_prompt, stats
 
 def generate_llm_response(system_prompt: str, user_prompt: str):
     """
@@ -55,11 +133,8 @@ def generate_llm_response(system_prompt: str, user_prompt: str):
         {"role": "user", "content": user_prompt}
     ]
 
-    # Load model and tokenizer
-    
-
-    # Get inference
-    response = get_phi3_inference(messages, model, tokenizer)
+    # Get inference (batched with any concurrent requests)
+    response = get_llm_backend().generate(messages)
 
     # Optionally print for debug
     print("\n=== MODEL RESPONSE ===\n")
@@ -68,6 +143,25 @@ def generate_llm_response(system_prompt: str, user_prompt: str):
 
     return response
 
+def generate_llm_response_stream(system_prompt: str, user_prompt: str):
+    """
+    Incremental form of generate_llm_response.
+
+    Args:
+        system_prompt (str): The instruction prompt describing the model's role and behavior.
+        user_prompt (str): The actual input or question to answer.
+
+    Returns:
+        TokenStream: Iterator yielding text pieces as they are decoded.
+            Call .cancel() to stop generation early.
+    """
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+
+    return get_llm_backend().stream(messages)
+
 if __name__ == '__main__' : 
 
     user_prompt = generate_user_prompt(rag_results, user_query)
@@ -1,44 +1,54 @@
-import redis
-import json
-from datetime import datetime
-from worker import worker  # import your existing worker(url) function
-from data.data_utils import load_db_as_pandas
+import os
+from worker import worker, job_result_fields  # import your existing worker(url) function
+from faiss_segments import start_compactor
+from job_queue import job_queue
+from data.data_utils import create_tables
 
-# Connect to Redis
-r = redis.StrictRedis(host='localhost', port=6379, db=0, decode_responses=True)
+FAISS_DIR = "faiss_segments"
+EMBED_DIM = 384  # for sentence-transformers/all-MiniLM-L12-v2
 
 def process_jobs():
     print("🚀 Worker started, waiting for jobs...")
+    create_tables()
+
+    # Merge small per-URL segments in the background
+    start_compactor(FAISS_DIR, dimension=EMBED_DIM)
+    # Keep the lease of the job being ingested alive, however long it takes
+    job_queue.start_heartbeat()
 
     while True:
-        # Blocking pop from the right of the list
-        job = r.brpop("url_jobs", timeout=0)
+        # Recover jobs whose worker died mid-way, then lease the next one
+        job_queue.requeue_expired()
+        job = job_queue.claim(timeout=5)
         if job is None:
             continue
 
-        _, job_json = job
-        job_data = json.loads(job_json)
-        url = job_data["url"]
-
-        print(f"🛠️ Processing URL: {url}")
+        job_id, url = job["job_id"], job["url"]
+        print(f"🛠️ Processing URL: {url} (job {job_id}, attempt {job['attempts']})")
 
         try:
             # Here you call your existing worker pipeline
-            FAISS_FILE = "faiss_index.idx"
-            EMBED_DIM = 384  # for sentence-transformers/all-MiniLM-L12-v2
-
-            worker_output = worker(FAISS_FILE, EMBED_DIM, url)
-            urls, chunks = load_db_as_pandas()
-            breakpoint()
-            # Update status
-            job_data["status"] = "completed"
-            job_data["completed_at"] = datetime.utcnow().isoformat()
+            worker_output = worker(FAISS_DIR, EMBED_DIM, url)
+            if worker_output is None:
+                # worker() already logged the error and recorded it on the urls row
+                raise RuntimeError("Ingestion failed, see the urls table for the error")
+            job_queue.complete(job_id, **job_result_fields(worker_output))
             print(f"✅ Completed URL: {url}")
 
         except Exception as e:
-            job_data["status"] = "failed"
-            job_data["error_message"] = str(e)
+            job_queue.fail(job_id, e)
             print(f"❌ Failed URL: {url}, Error: {e}")
 
 if __name__ == "__main__":
-    process_jobs()
+    # INGEST_MODE: "single" (this loop), "pool" (worker_pool.py) or "pipeline" (ingest_pipeline.py)
+    num_workers = int(os.environ.get("INGEST_WORKERS", 1))
+    mode = os.environ.get("INGEST_MODE") or ("pool" if num_workers > 1 else "single")
+
+    if mode == "pipeline":
+        from ingest_pipeline import IngestPipeline
+        IngestPipeline().run_from_redis()
+    elif mode == "pool":
+        from worker_pool import WorkerPool
+        WorkerPool(num_workers=num_workers).run()
+    else:
+        process_jobs()
@@ -0,0 +1,248 @@
+"""
+Bounded execution of API queries: admission control, sized executors and deadlines.
+
+Each query first takes one of MAX_CONCURRENT_QUERIES slots. When all are busy
+it waits in a FIFO queue of at most MAX_QUEUED_QUERIES; beyond that it is
+rejected at once with 429, and if its deadline passes while queued it gets 503.
+Both carry a Retry-After estimated from recent service times.
+
+Admitted work runs off the event loop on two dedicated thread pools, one for
+retrieval (embedding, FAISS, chunk store, prompt packing) and one for
+generation, each sized explicitly instead of sharing FastAPI's default pool.
+Every query has an end-to-end deadline (QUERY_DEADLINE_S). Once it expires,
+stages that have not started are cancelled, a running generation is
+cancelled in the LLM engine, and the request fails with 504.
+"""
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+MAX_CONCURRENT_QUERIES = int(os.environ.get("MAX_CONCURRENT_QUERIES", 8))
+MAX_QUEUED_QUERIES = int(os.environ.get("MAX_QUEUED_QUERIES", 32))
+QUERY_DEADLINE_S = float(os.environ.get("QUERY_DEADLINE_S", 30))
+RETRIEVAL_WORKERS = int(os.environ.get("RETRIEVAL_WORKERS", 0)) or min(4, os.cpu_count() or 1)
+# One thread per in-flight generation (they mostly wait on the batching engine)
+GENERATION_WORKERS = int(os.environ.get("GENERATION_WORKERS", 0)) or MAX_CONCURRENT_QUERIES
+
+retrieval_executor = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS, thread_name_prefix="retrieval")
+generation_executor = ThreadPoolExecutor(max_workers=GENERATION_WORKERS, thread_name_prefix="generation")
+
+
+class Overloaded(Exception):
+    """The query was not admitted: 429 (queue full) or 503 (deadline passed while queued)."""
+
+    def __init__(self, status_code, retry_after, detail):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.detail = detail
+
+
+class DeadlineExceeded(Exception):
+    """The query's deadline expired during the named stage."""
+
+    def __init__(self, stage):
+        super().__init__(f"Deadline exceeded during {stage}")
+        self.stage = stage
+
+
+class Deadline:
+    """Absolute monotonic deadline shared by every stage of one request."""
+
+    def __init__(self, seconds=QUERY_DEADLINE_S):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def expired(self):
+        return time.monotonic() >= self.expires_at
+
+    def check(self, stage):
+        """Raise DeadlineExceeded if there is no time left to start stage."""
+        if self.expired():
+            raise DeadlineExceeded(stage)
+
+
+class AdmissionController:
+    """
+    Fixed number of concurrent queries plus a bounded FIFO wait queue.
+
+    Used from the event loop only; slots are handed directly from a finishing
+    query to the oldest waiter so a newcomer can never overtake the queue.
+    """
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT_QUERIES, max_queued=MAX_QUEUED_QUERIES, window=1000):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self._running = 0
+        self._waiters = deque()
+        self._lock = threading.Lock()  # guards the counters read by stats()
+
+        self._queue_waits = deque(maxlen=window)
+        self._service_times = deque(maxlen=window)
+        self._stage_times = {}
+        self._window = window
+        self.admitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.queue_timeouts = 0
+        self.deadline_exceeded = {}
+
+    def retry_after(self):
+        """Seconds until a slot is likely free for a new arrival (at least 1)."""
+        with self._lock:
+            service = sum(self._service_times) / len(self._service_times) if self._service_times else 1.0
+            ahead = len(self._waiters) + 1
+        return max(1, math.ceil(service * ahead / self.max_concurrent))
+
+    async def acquire(self, deadline):
+        """
+        Wait for a slot until the deadline.
+
+        Returns:
+            float: Seconds spent queued.
+
+        Raises:
+            Overloaded: Queue full (429) or deadline reached while queued (503).
+        """
+        start = time.monotonic()
+        if self._running < self.max_concurrent and not self._waiters:
+            self._running += 1
+            self._admit(0.0)
+            return 0.0
+
+        if len(self._waiters) >= self.max_queued:
+            self.rejected += 1
+            raise Overloaded(429, self.retry_after(), "Too many queued queries")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, deadline.remaining())
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we gave up: pass it on
+                self._hand_on()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self.queue_timeouts += 1
+                raise Overloaded(503, self.retry_after(), "Deadline expired while queued") from None
+            raise
+
+        waited = time.monotonic() - start
+        self._admit(waited)
+        return waited
+
+    def _admit(self, waited):
+        with self._lock:
+            self.admitted += 1
+            self._queue_waits.append(waited)
+
+    def release(self, service_seconds):
+        """Give the slot to the oldest live waiter, or free it."""
+        with self._lock:
+            self.completed += 1
+            self._service_times.append(service_seconds)
+        self._hand_on()
+
+    def _hand_on(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._running -= 1
+
+    def record_stage(self, stage, seconds):
+        with self._lock:
+            self._stage_times.setdefault(stage, deque(maxlen=self._window)).append(seconds)
+
+    def record_deadline(self, stage):
+        with self._lock:
+            self.deadline_exceeded[stage] = self.deadline_exceeded.get(stage, 0) + 1
+
+    @asynccontextmanager
+    async def slot(self, deadline):
+        """Hold a slot for the body of an async with block."""
+        await self.acquire(deadline)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start)
+
+    def stats(self):
+        """
+        Returns:
+            Dict: In-flight and queued counts, limits, outcome counters, and
+                queue wait / service / per-stage time summaries in ms.
+        """
+        import numpy as np
+
+        def summary(values):
+            if not values:
+                return None
+            values = np.asarray(values) * 1000.0
+            return {
+                "mean": round(float(values.mean()), 2),
+                "p50": round(float(np.percentile(values, 50)), 2),
+                "p95": round(float(np.percentile(values, 95)), 2),
+                "max": round(float(values.max()), 2),
+            }
+
+        with self._lock:
+            return {
+                "in_flight": self._running,
+                "queued": len(self._waiters),
+                "max_concurrent": self.max_concurrent,
+                "max_queued": self.max_queued,
+                "deadline_s": QUERY_DEADLINE_S,
+                "retrieval_workers": RETRIEVAL_WORKERS,
+                "generation_workers": GENERATION_WORKERS,
+                "admitted": self.admitted,
+                "completed": self.completed,
+                "rejected_429": self.rejected,
+                "queue_timeouts_503": self.queue_timeouts,
+                "deadline_exceeded_504": dict(self.deadline_exceeded),
+                "queue_wait_ms": summary(list(self._queue_waits)),
+                "service_ms": summary(list(self._service_times)),
+                "stage_ms": {stage: summary(list(times)) for stage, times in self._stage_times.items()},
+            }
+
+
+admission = AdmissionController()
+
+
+async def run_stage(executor, deadline, stage, fn, *args, on_timeout=None):
+    """
+    Run fn(*args) on executor within the request's remaining time.
+
+    If the deadline passes first, the stage is cancelled if it has not started,
+    on_timeout() is called to stop work that has (e.g. cancel a generation),
+    and DeadlineExceeded is raised.
+    """
+    try:
+        deadline.check(stage)
+    except DeadlineExceeded:
+        admission.record_deadline(stage)
+        raise
+
+    start = time.monotonic()
+    future = asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+    try:
+        return await asyncio.wait_for(future, deadline.remaining())
+    except asyncio.TimeoutError:
+        if on_timeout is not None:
+            on_timeout()
+        admission.record_deadline(stage)
+        raise DeadlineExceeded(stage) from None
+    finally:
+        admission.record_stage(stage, time.monotonic() - start)
@@ -1,24 +1,23 @@
-import redis
-import json
-from datetime import datetime
+from job_queue import job_queue
 
-# Connect to Redis
-r = redis.StrictRedis(host='localhost', port=6379, db=0, decode_responses=True)
+def enqueue_urls(urls):
+    """
+    Push URL jobs to Redis in one pipelined batch, skipping URLs already
+    pending, processing or recently completed.
 
-def enqueue_url(url: str):
+    Returns:
+        List[Dict]: url, job_id and duplicate for each input URL.
     """
-    Push a new URL job to Redis with status 'pending'.
+    return job_queue.enqueue(list(urls))
+
+def enqueue_url(url: str):
     """
-    job = {
-        "url": url,
-        "status": "pending",
-        "submitted_at": datetime.utcnow().isoformat()
-    }
-    job_json = json.dumps(job)
+    Push a new URL job to Redis with status 'queued'.
 
-    # Add job to the head of the list
-    r.lpush("url_jobs", job_json)
-    print(f"✅ Enqueued job: {url}")
+    Returns:
+        Dict: url, job_id and duplicate.
+    """
+    return enqueue_urls([url])[0]
 
 if __name__ == "__main__":
     # Example URLs
@@ -30,5 +29,5 @@ if __name__ == "__main__":
         "https://medium.com/@explorer_shwetabh/trying-to-learn-what-they-see-part-1-2a3ff94b58de"
     ]
 
-    for url in urls:
-        enqueue_url(url)
+    for job in enqueue_urls(urls):
+        print(job)
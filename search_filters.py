@@ -0,0 +1,145 @@
+import threading
+from urllib.parse import urlsplit
+
+import faiss
+import numpy as np
+
+from data.data_utils import read_connection
+
+
+class ChunkFilterIndex:
+    """
+    In-memory metadata for turning query filters into FAISS id selectors.
+
+    Keeps, per url_id, the sorted array of its chunk ids, the domain of every
+    URL, and the chunk creation times aligned with (monotonic) chunk ids.
+    Built once from SQLite and then extended incrementally with rows newer than
+    the last id seen, so keeping it current after each ingest is cheap.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids_by_url = {}       # url_id -> np.ndarray of chunk ids
+        self._urls_by_domain = {}   # domain -> set of url_ids
+        self._ids = np.zeros(0, dtype=np.int64)                    # all chunk ids, ascending
+        self._created_at = np.zeros(0, dtype="datetime64[us]")     # aligned with _ids
+        self._max_id = 0
+
+    def refresh(self):
+        """
+        Load chunks and URLs added since the last refresh.
+
+        Returns:
+            int: Number of new chunks picked up.
+        """
+        with self._lock:
+            with read_connection() as connection:
+                rows = connection.execute("""
+                    SELECT c.id, c.url_id, c.created_at, u.url
+                    FROM chunks c JOIN urls u ON u.id = c.url_id
+                    WHERE c.id > ?
+                    ORDER BY c.id
+                """, (self._max_id,)).fetchall()
+
+            if not rows:
+                return 0
+
+            ids = np.array([row[0] for row in rows], dtype=np.int64)
+            url_ids = np.array([row[1] for row in rows], dtype=np.int64)
+            created_at = np.array([row[2] for row in rows], dtype="datetime64[us]")
+
+            for url_id in np.unique(url_ids):
+                new_ids = ids[url_ids == url_id]
+                existing = self._ids_by_url.get(int(url_id))
+                self._ids_by_url[int(url_id)] = new_ids if existing is None else np.concatenate([existing, new_ids])
+
+            for _, url_id, _, url in rows:
+                self._urls_by_domain.setdefault(urlsplit(url).netloc.lower(), set()).add(url_id)
+
+            self._ids = np.concatenate([self._ids, ids])
+            self._created_at = np.concatenate([self._created_at, created_at])
+            self._max_id = int(ids[-1])
+            return len(rows)
+
+    def _id_range(self, created_after, created_before):
+        """Chunk ids are assigned in creation order, so a time range is an id range."""
+        lo, hi = 0, self._max_id + 1
+        if created_after:
+            pos = np.searchsorted(self._created_at, np.datetime64(created_after, "us"), side="left")
+            lo = int(self._ids[pos]) if pos < len(self._ids) else self._max_id + 1
+        if created_before:
+            pos = np.searchsorted(self._created_at, np.datetime64(created_before, "us"), side="right")
+            hi = int(self._ids[pos]) if pos < len(self._ids) else self._max_id + 1
+        return lo, hi
+
+    def build_selector(self, url_ids=None, domains=None, created_after=None, created_before=None):
+        """
+        Turn filters into a FAISS IDSelector over chunk ids.
+
+        Args:
+            url_ids (List[int], optional): Only chunks of these URLs.
+            domains (List[str], optional): Only chunks of URLs on these domains.
+            created_after (str, optional): ISO timestamp, inclusive.
+            created_before (str, optional): ISO timestamp, inclusive.
+
+        Returns:
+            faiss.IDSelector or None: None if no filter was given; an empty
+                selection returns an IDSelectorBatch over no ids.
+        """
+        if not (url_ids or domains or created_after or created_before):
+            return None
+
+        with self._lock:
+            lo, hi = self._id_range(created_after, created_before)
+
+            if not (url_ids or domains):
+                return faiss.IDSelectorRange(lo, hi)
+
+            selected_urls = set(url_ids or [])
+            for domain in domains or []:
+                selected_urls |= self._urls_by_domain.get(domain.lower(), set())
+
+            parts = [self._ids_by_url[u] for u in selected_urls if u in self._ids_by_url]
+            ids = np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+            ids = ids[(ids >= lo) & (ids < hi)]
+
+            # Few ids: hash set; many: a bitmap over the id space (1 bit per chunk)
+            if len(ids) * 64 < self._max_id:
+                return faiss.IDSelectorBatch(len(ids), faiss.swig_ptr(np.ascontiguousarray(ids)))
+
+            mask = np.zeros(self._max_id + 1, dtype=bool)
+            mask[ids] = True
+            bitmap = np.packbits(mask, bitorder="little")
+            # n is the bitmap size in bytes; ids past the end (ingested since) are rejected
+            selector = faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap))
+            selector.bitmap_array = bitmap  # IDSelectorBitmap does not copy the bits
+            return selector
+
+
+# Process-wide filter metadata used by the query path
+chunk_filter_index = ChunkFilterIndex()
+_refreshed_stamp = {"stamp": object()}
+
+
+def build_search_selector(filters, generation=None):
+    """
+    Build an IDSelector for a query's filters, refreshing metadata when the index generation changed.
+
+    Args:
+        filters (Dict or None): url_ids, domains, created_after, created_before.
+        generation: Stamp of the resident index.
+
+    Returns:
+        faiss.IDSelector or None
+    """
+    if not filters:
+        return None
+    if generation != _refreshed_stamp["stamp"]:
+        chunk_filter_index.refresh()
+        _refreshed_stamp["stamp"] = generation
+    return chunk_filter_index.build_selector(
+        url_ids=filters.get("url_ids"),
+        domains=filters.get("domains"),
+        created_after=filters.get("created_after"),
+        created_before=filters.get("created_before"),
+    )
@@ -1,15 +1,64 @@
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from get_data import fetch_html, extract_text_from_html
-from sentence_transformers import SentenceTransformer
+import functools
+import hashlib
+import os
+import sqlite3
+import threading
 
-# Initialize the model once
-embedding_model = SentenceTransformer('sentence-transformers/all-MiniLM-L12-v2')
+import numpy as np
 
+EMBEDDING_MODEL_NAME = 'sentence-transformers/all-MiniLM-L12-v2'
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", "embedding_cache.db")
+# "torch" (SentenceTransformer) or "onnx" (int8 ONNX Runtime, see onnx_embedder.py)
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "torch")
+# Cached vectors are only reused by the backend that produced them
+EMBEDDING_CACHE_NAMESPACE = EMBEDDING_MODEL_NAME if EMBEDDING_BACKEND == "torch" else f"{EMBEDDING_MODEL_NAME}:{EMBEDDING_BACKEND}"
+
+# Encoder, loaded on first use (or by get_embedding_model() at warm-up)
+_embedding_model = None
+_model_lock = threading.Lock()
+
+# Persistent, content-addressed embedding store (opened on first use)
+_cache_conn = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_model():
+    """
+    Return the process-wide encoder for EMBEDDING_BACKEND, loading it on first call.
+
+    Thread-safe: concurrent first callers wait for a single load. Importing
+    this module does not pull in torch / sentence-transformers.
+
+    Returns:
+        SentenceTransformer or OnnxEmbedder: Object with a SentenceTransformer-style encode().
+    """
+    global _embedding_model
+    if _embedding_model is None:
+        with _model_lock:
+            if _embedding_model is None:
+                if EMBEDDING_BACKEND == "onnx":
+                    from onnx_embedder import load_onnx_embedder
+
+                    _embedding_model = load_onnx_embedder(EMBEDDING_MODEL_NAME)
+                elif EMBEDDING_BACKEND == "torch":
+                    from sentence_transformers import SentenceTransformer
+
+                    _embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+                else:
+                    raise ValueError(f"Unknown embedding backend: {EMBEDDING_BACKEND}")
+    return _embedding_model
+
+def embedding_model_loaded():
+    """True once the encoder has been loaded in this process."""
+    return _embedding_model is not None
 
 def chunk_text(text, chunk_size=500, chunk_overlap=50):
     """
     Split text into chunks using LangChain's RecursiveCharacterTextSplitter.
 
+    Ingestion uses token_chunker.chunk_text_by_tokens instead; this character
+    splitter is kept for comparison (bench_chunking.py).
+
     Args:
         text (str): The input text to split.
         chunk_size (int): Maximum size of each chunk (in characters/tokens).
@@ -21,33 +70,121 @@ def chunk_text(text, chunk_size=500, chunk_overlap=50):
     if not text:
         return []
 
-    splitter = RecursiveCharacterTextSplitter(
+    chunks = _character_splitter(chunk_size, chunk_overlap).split_text(text)
+    return chunks
+
+@functools.lru_cache(maxsize=8)
+def _character_splitter(chunk_size, chunk_overlap):
+    """One RecursiveCharacterTextSplitter per configuration, built on first use."""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    return RecursiveCharacterTextSplitter(
         chunk_size=chunk_size,
         chunk_overlap=chunk_overlap,
         separators=["\n\n", "\n", ".", "!", "?", ",", " ", ""]
     )
 
-    chunks = splitter.split_text(text)
-    return chunks
+def _get_cache_conn():
+    """Open the embedding cache database, creating its table if needed."""
+    global _cache_conn
+    if _cache_conn is None:
+        conn = sqlite3.connect(EMBEDDING_CACHE_PATH, check_same_thread=False, timeout=30)
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS embeddings (
+            key BLOB PRIMARY KEY,
+            vector BLOB NOT NULL
+        ) WITHOUT ROWID;
+        """)
+        conn.commit()
+        _cache_conn = conn
+    return _cache_conn
+
+def embedding_key(text, model_name=EMBEDDING_CACHE_NAMESPACE):
+    """
+    Content address of a chunk: SHA-256 of the model name and whitespace-normalized text.
+
+    Args:
+        text (str): Chunk text.
+        model_name (str): Name of the embedding model (tagged with the backend unless torch).
 
-def get_embeddings(chunks):
+    Returns:
+        bytes: 32-byte digest.
+    """
+    normalized = " ".join(text.split())
+    return hashlib.sha256(f"{model_name}\0{normalized}".encode("utf-8")).digest()
+
+def _load_cached_embeddings(keys):
+    """Return {key: float32 vector} for every key present in the cache."""
+    found = {}
+    keys = list(keys)
+    with _cache_lock:
+        conn = _get_cache_conn()
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ",".join("?" for _ in batch)
+            rows = conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+            ).fetchall()
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float16).astype(np.float32)
+    return found
+
+def _store_cached_embeddings(keys, vectors):
+    """Persist vectors as float16 blobs under their content keys."""
+    rows = [(key, np.asarray(vec, dtype=np.float16).tobytes()) for key, vec in zip(keys, vectors)]
+    with _cache_lock:
+        conn = _get_cache_conn()
+        conn.executemany("INSERT OR IGNORE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+        conn.commit()
+
+def get_embeddings(chunks, use_cache=True):
     """
     Convert a list of text chunks into embeddings using MiniLM.
 
+    With use_cache, vectors are looked up in the persistent embedding store by
+    content hash first; only unseen texts (each encoded once, even if repeated
+    in the batch) go through the encoder, and the results are merged back in
+    the original order. The store keeps float16, so cached and freshly encoded
+    vectors alike are returned float16-rounded (as float32).
+
     Args:
         chunks (List[str]): List of text chunks.
+        use_cache (bool): Read and populate the embedding store.
 
     Returns:
-        List[List[float]]: List of embeddings corresponding to each chunk.
+        np.ndarray: Array of shape (len(chunks), embedding_dim).
     """
     if not chunks:
         return []
 
-    embeddings = embedding_model.encode(chunks, convert_to_numpy=True, show_progress_bar=True)
-    return embeddings
+    if not use_cache:
+        return get_embedding_model().encode(chunks, convert_to_numpy=True, show_progress_bar=True)
+
+    keys = [embedding_key(chunk) for chunk in chunks]
+    cached = _load_cached_embeddings(set(keys))
+
+    # Encode each missing text once
+    missing = {}
+    for key, chunk in zip(keys, chunks):
+        if key not in cached and key not in missing:
+            missing[key] = chunk
+
+    if missing:
+        missing_keys = list(missing)
+        encoded = get_embedding_model().encode(
+            [missing[key] for key in missing_keys], convert_to_numpy=True, show_progress_bar=True
+        )
+        _store_cached_embeddings(missing_keys, encoded)
+        # Return exactly what a later cache hit will read back, so vectors never depend on hit/miss
+        cached.update(zip(missing_keys, encoded.astype(np.float16).astype(np.float32)))
+
+    print(f"🧠 Embeddings: {len(chunks) - len(missing)} cached, {len(missing)} encoded")
+    return np.stack([cached[key] for key in keys]).astype(np.float32)
 
 # Example usage
 if __name__ == "__main__":
+    from get_data import fetch_html, extract_text_from_html
 
     url = "https://medium.com/@explorer_shwetabh/deepfake-detection-part-2-understanding-lora-based-moe-adapter-architecture-813acbf9b345"
     html = fetch_html(url)
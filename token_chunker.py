@@ -0,0 +1,137 @@
+"""
+Token-aware chunking aligned with the embedding model's sequence limit.
+
+all-MiniLM-L12-v2 reads at most EMBEDDING_MAX_SEQ_LENGTH tokens (special
+tokens included) and silently drops the rest, so chunks are measured with the
+embedding tokenizer itself rather than in characters. A document is tokenized
+once with offsets and cut in one forward pass into windows of at most
+CHUNK_TOKENS tokens, overlapping by CHUNK_OVERLAP_TOKENS. Cuts are moved back
+to the end of a sentence, or at least a word, when one is close enough.
+
+Chunks are returned as character spans into the original text, so the text of
+a chunk is text[span.start:span.end].
+"""
+import os
+import re
+import threading
+from collections import namedtuple
+
+from text_utils import EMBEDDING_MODEL_NAME
+
+# Longest input the encoder reads, special tokens included (SentenceTransformer max_seq_length)
+EMBEDDING_MAX_SEQ_LENGTH = int(os.environ.get("EMBEDDING_MAX_SEQ_LENGTH", 128))
+# Content tokens per chunk; 0 means everything the encoder reads besides its special tokens
+CHUNK_TOKENS = int(os.environ.get("CHUNK_TOKENS", 0))
+CHUNK_OVERLAP_TOKENS = int(os.environ.get("CHUNK_OVERLAP_TOKENS", 16))
+
+# A cut may move back at most this fraction of a window to land on a boundary
+MAX_BACKOFF = 0.25
+
+_SENTENCE_END = re.compile(r"[.!?;:]['\")\]]*$")
+
+ChunkSpan = namedtuple("ChunkSpan", ["start", "end", "num_tokens"])
+
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+# Fast tokenizers mutate their truncation state per call, so calls are serialized
+_encode_lock = threading.Lock()
+
+
+def get_chunk_tokenizer():
+    """Return the embedding model's (fast) tokenizer, loading it on first call."""
+    global _tokenizer
+    if _tokenizer is None:
+        with _tokenizer_lock:
+            if _tokenizer is None:
+                from transformers import AutoTokenizer
+
+                _tokenizer = AutoTokenizer.from_pretrained(EMBEDDING_MODEL_NAME, use_fast=True)
+    return _tokenizer
+
+
+def chunk_token_limit(tokenizer):
+    """Content tokens that fit in one encoder input next to the special tokens."""
+    return EMBEDDING_MAX_SEQ_LENGTH - tokenizer.num_special_tokens_to_add(pair=False)
+
+
+def _token_offsets(tokenizer, text):
+    """(start, end) character offsets of every token in text, without special tokens."""
+    if not getattr(tokenizer, "is_fast", False):
+        raise ValueError("Token chunking needs a fast tokenizer (offset mapping)")
+    with _encode_lock:
+        encoded = tokenizer(
+            text, add_special_tokens=False, return_offsets_mapping=True, truncation=False, verbose=False
+        )
+    return encoded["offset_mapping"]
+
+
+def _best_cut(text, offsets, start, end):
+    """
+    Pick where a window [start, end) of tokens should end.
+
+    Prefers the latest sentence end, then the latest word boundary, in the
+    last MAX_BACKOFF of the window; falls back to a hard cut at end.
+    """
+    earliest = max(start + 1, end - int((end - start) * MAX_BACKOFF))
+    word_cut = None
+    for cut in range(end, earliest - 1, -1):
+        # A gap between tokens cut-1 and cut means they belong to different words
+        if offsets[cut][0] > offsets[cut - 1][1]:
+            if _SENTENCE_END.search(text[offsets[cut - 1][0]:offsets[cut - 1][1]]):
+                return cut
+            if word_cut is None:
+                word_cut = cut
+    return word_cut or end
+
+
+def _next_start(offsets, cut, overlap, floor):
+    """First token of the next window: overlap tokens back from cut, moved forward to a word start."""
+    start = max(cut - overlap, floor)
+    for candidate in range(start, cut):
+        if candidate == 0 or offsets[candidate][0] > offsets[candidate - 1][1]:
+            return candidate
+    return start
+
+
+def token_chunk_spans(text, max_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS, tokenizer=None):
+    """
+    Split text into windows of at most max_tokens embedding tokens.
+
+    Args:
+        text (str): Document text.
+        max_tokens (int): Content tokens per chunk (0: the encoder's limit).
+        overlap_tokens (int): Tokens repeated at the start of the next chunk.
+        tokenizer: Fast Hugging Face tokenizer (default: the embedding model's).
+
+    Returns:
+        List[ChunkSpan]: Character start/end and token count of each chunk, in order.
+    """
+    if not text or not text.strip():
+        return []
+    tokenizer = tokenizer or get_chunk_tokenizer()
+    max_tokens = max_tokens or chunk_token_limit(tokenizer)
+    overlap_tokens = min(max(overlap_tokens, 0), max_tokens // 2)
+
+    offsets = _token_offsets(tokenizer, text)
+    num_tokens = len(offsets)
+    spans = []
+    start = 0
+    while start < num_tokens:
+        end = min(start + max_tokens, num_tokens)
+        if end < num_tokens:
+            end = _best_cut(text, offsets, start, end)
+        spans.append(ChunkSpan(offsets[start][0], offsets[end - 1][1], end - start))
+        if end == num_tokens:
+            break
+        start = _next_start(offsets, end, overlap_tokens, start + 1)
+    return spans
+
+
+def chunk_text_by_tokens(text, max_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS, tokenizer=None):
+    """
+    Token-aware replacement for text_utils.chunk_text.
+
+    Returns:
+        List[str]: Chunk texts (see token_chunk_spans for the arguments).
+    """
+    return [text[span.start:span.end] for span in token_chunk_spans(text, max_tokens, overlap_tokens, tokenizer)]
@@ -1,100 +1,222 @@
 import numpy as np
 from datetime import datetime
-from get_data import fetch_html, extract_text_from_html
-from text_utils import chunk_text
+from get_data import fetch_html_conditional, extract_text_from_html
+from token_chunker import token_chunk_spans
 from text_utils import get_embeddings
-from faiss_utils import create_faiss_index, add_embeddings_to_index, save_faiss_index, load_faiss_index
-from data.data_utils import insert_urls, insert_chunks, update_url_status, load_db_as_pandas   # assume you have these helpers
-import faiss
+from faiss_segments import LEGACY_INDEX_FILE, append_segment, init_segment_store, remove_ids_from_segments
+from chunk_store import append_chunks, remove_chunks, update_chunk_indices
+from data.data_utils import (  # assume you have these helpers
+    create_tables, insert_urls, sync_chunks, finish_chunk_sync, update_url_status, load_db_as_pandas,
+    get_url_validators, update_url_validators, chunk_hash, get_chunk_hashes,
+)
 import os
 
-def worker(FAISS_FILE, EMBED_DIM, url):
+LEGACY_FAISS_FILE = LEGACY_INDEX_FILE
+
+def fetch_document(url):
+    """
+    Fetch a URL with a conditional GET against the last successful crawl.
+
+    Returns:
+        FetchResult or None: None if the page has not changed (HTTP 304).
+    """
+    etag, last_modified = get_url_validators(url)
+    fetched = fetch_html_conditional(url, etag=etag, last_modified=last_modified)
+    if fetched.status == 304:
+        print(f"♻️ {url} not modified since last crawl, skipping")
+        return None
+
+    if not fetched.html:
+        raise ValueError("Failed to fetch HTML content.")
+    return fetched
+
+def split_document(html):
+    """
+    Extract text from HTML and split it into chunks that fit the embedding model.
+
+    Returns:
+        List[str]: Chunk texts.
+    """
+    content = extract_text_from_html(html)
+    if not content or len(content.strip()) == 0:
+        raise ValueError("Extracted content is empty.")
+
+    spans = token_chunk_spans(content)
+    if len(spans) == 0:
+        raise ValueError("No valid text chunks generated.")
+
+    chunks = [content[span.start:span.end] for span in spans]
+    num_tokens = sum(span.num_tokens for span in spans)
+    print(f"✅ Generated {len(chunks)} chunks ({num_tokens / len(spans):.0f} tokens avg, max {max(span.num_tokens for span in spans)})")
+    return chunks
+
+def chunks_to_embed(url, chunks):
+    """
+    Positions of the chunks whose text is not stored for the URL yet.
+
+    On a re-crawl the other chunks keep their rows and vectors, so only these
+    need the encoder.
+
+    Returns:
+        List[int]: Indices into chunks.
+    """
+    stored = get_chunk_hashes(url)
+    return [idx for idx, text in enumerate(chunks) if chunk_hash(text) not in stored]
+
+def prepare_document(url):
+    """
+    CPU/network half of ingestion, with no DB or FAISS writes:
+    1. Fetch and extract text from URL (conditional GET against the last crawl)
+    2. Split into chunks
+    3. Generate embeddings for the chunks not already stored
+
+    Safe to run in parallel across processes.
+
+    Returns:
+        Dict or None: chunks, embedded (positions of the embedded chunks),
+            embeddings (float32, one row per embedded chunk), etag and
+            last_modified; None if the page has not changed since the last
+            crawl (HTTP 304).
+    """
+    # ----------------------------------------------------------
+    # 1. Fetch and Extract Text
+    # ----------------------------------------------------------
+    fetched = fetch_document(url)
+    if fetched is None:
+        return None
+
+    # ----------------------------------------------------------
+    # 2. Chunk the content
+    # ----------------------------------------------------------
+    chunks = split_document(fetched.html)
+
+    # ----------------------------------------------------------
+    # 3. Generate embeddings
+    # ----------------------------------------------------------
+    embedded = chunks_to_embed(url, chunks)
+    if embedded:
+        embeddings = get_embeddings([chunks[idx] for idx in embedded])
+        embeddings = np.array(embeddings).astype('float32')
+    else:
+        embeddings = np.zeros((0, 0), dtype='float32')
+
+    print(f"✅ Created embeddings with shape: {embeddings.shape} ({len(chunks) - len(embedded)} chunks already stored)")
+    return {
+        "chunks": chunks,
+        "embedded": embedded,
+        "embeddings": embeddings,
+        "etag": fetched.etag,
+        "last_modified": fetched.last_modified,
+    }
+
+def commit_document(FAISS_DIR, EMBED_DIM, url, document):
+    """
+    Write half of ingestion: SQLite metadata and the FAISS segments.
+
+    A URL ingested before is diffed against its stored chunks by content hash:
+    unchanged chunks keep their ids and vectors, new ones are inserted and
+    appended as a segment, and chunks that disappeared are deleted from SQLite,
+    the chunk store and FAISS. The diff only counts as stored (hashes recorded,
+    removed rows deleted) after FAISS has been updated, so a failure in between
+    is redone by the next crawl.
+
+    Must only be called from a single writer at a time.
+
+    Args:
+        document (Dict or None): Output of prepare_document; None marks an unchanged page.
+
+    Returns:
+        Dict: url, url_id, chunk_count, faiss_ids (of the added chunks) and
+            the added, removed and unchanged chunk counts.
+    """
+    if document is None:
+        update_url_status(url, status="completed")
+        return {"url": url, "not_modified": True}
+
+    chunks = document["chunks"]
+    embedded = document.get("embedded", range(len(chunks)))
+    vectors = dict(zip(embedded, document["embeddings"]))
+
+    # ----------------------------------------------------------
+    # 4. Insert URL record into DB
+    # ----------------------------------------------------------
+    url_id = insert_urls(url)
+    update_url_status(url, status="processing")
+
+    # ----------------------------------------------------------
+    # 5. Diff against the stored chunks and assign FAISS IDs to new ones
+    # ----------------------------------------------------------
+    diff = sync_chunks(url, chunks)
+    added, removed, moved = diff["added"], diff["removed"], diff["moved"]
+    faiss_ids = [faiss_id for _, faiss_id in added]
+
+    missing = [idx for idx, _ in added if idx not in vectors]
+    if missing:
+        # The stored version changed after prepare_document skipped these
+        print(f"⚠️ Embedding {len(missing)} chunks no longer stored for {url}")
+        for idx, vector in zip(missing, np.array(get_embeddings([chunks[idx] for idx in missing])).astype('float32')):
+            vectors[idx] = vector
+
+    # Mirror the changes into the memory-mapped chunk store before the vectors become searchable
+    append_chunks(faiss_ids, url_id, [idx for idx, _ in added], [chunks[idx] for idx, _ in added])
+    if moved:
+        update_chunk_indices([faiss_id for faiss_id, _ in moved], [idx for _, idx in moved])
+
+    # ----------------------------------------------------------
+    # 6. Update FAISS
+    # ----------------------------------------------------------
+    # New vectors go in a new segment; only segments holding removed ids are rewritten
+    init_segment_store(FAISS_DIR, dimension=EMBED_DIM, legacy_file=LEGACY_FAISS_FILE)
+    if added:
+        embeddings = np.stack([vectors[idx] for idx, _ in added])
+        segment = append_segment(FAISS_DIR, embeddings, faiss_ids, dimension=EMBED_DIM)
+        print(f"💾 FAISS segment {segment} published in {FAISS_DIR}")
+    if removed:
+        remove_ids_from_segments(FAISS_DIR, removed, dimension=EMBED_DIM)
+        remove_chunks(removed)
+
+    # ----------------------------------------------------------
+    # 7. Finalize
+    # ----------------------------------------------------------
+    finish_chunk_sync(diff)
+    chunk_count = diff["chunk_count"]
+    update_url_validators(url, document["etag"], document["last_modified"])
+    update_url_status(url, status="completed", chunk_count=chunk_count)
+    print(f"🎯 URL {url} stored in DB + FAISS: {len(added)} added, {len(removed)} removed, "
+          f"{len(diff['unchanged'])} unchanged.")
+
+    return {
+        "url": url,
+        "url_id": url_id,
+        "chunk_count": chunk_count,
+        "faiss_ids": faiss_ids,
+        "added": len(added),
+        "removed": len(removed),
+        "unchanged": len(diff["unchanged"]),
+    }
+
+def job_result_fields(result):
+    """Fields of a commit_document result recorded on the job's status hash."""
+    fields = {key: result.get(key) for key in ("chunk_count", "added", "removed", "unchanged")}
+    fields["not_modified"] = result.get("not_modified", False)
+    return fields
+
+def worker(FAISS_DIR, EMBED_DIM, url):
     """
     Complete RAG ingestion worker:
     1. Fetch and extract text from URL
     2. Split into chunks
     3. Generate embeddings
-    4. Store metadata in SQLite
-    5. Save vectors in FAISS
+    4. Store metadata in SQLite (diffed against the last crawl of the URL)
+    5. Save new vectors in FAISS (as a new segment in the FAISS_DIR segment store)
+       and remove the vectors of chunks that disappeared
     """
 
     print(f"🚀 Starting worker for URL: {url}")
 
     try:
-        # ----------------------------------------------------------
-        # 1. Fetch and Extract Text
-        # ----------------------------------------------------------
-        html = fetch_html(url)
-        if not html:
-            raise ValueError("Failed to fetch HTML content.")
-
-        content = extract_text_from_html(html)
-        if not content or len(content.strip()) == 0:
-            raise ValueError("Extracted content is empty.")
-
-        # ----------------------------------------------------------
-        # 2. Chunk the content
-        # ----------------------------------------------------------
-        chunks = chunk_text(content, chunk_size=1000, chunk_overlap=100)
-        if len(chunks) == 0:
-            raise ValueError("No valid text chunks generated.")
-
-        print(f"✅ Generated {len(chunks)} chunks")
-
-        # ----------------------------------------------------------
-        # 3. Generate embeddings
-        # ----------------------------------------------------------
-        embeddings = get_embeddings(chunks)
-        embeddings = np.array(embeddings).astype('float32')
-
-        print(f"✅ Created embeddings with shape: {embeddings.shape}")
-
-        # ----------------------------------------------------------
-        # 4. Insert URL record into DB
-        # ----------------------------------------------------------
-        url_id = insert_urls(url)
-        update_url_status(url, status="processing")
-
-        # ----------------------------------------------------------
-        # 5. Assign FAISS IDs and Insert Chunks
-        # ----------------------------------------------------------
-        # Create FAISS IDs in the form of "urlid_chunknumber"
-        # chunk_ids = [int(f"{url_id}{i}") for i in range(len(chunks))]
-        faiss_ids = insert_chunks(url, chunks)
-
-        # ----------------------------------------------------------
-        # 6. Insert embeddings into FAISS
-        # ----------------------------------------------------------
-        if os.path.exists(FAISS_FILE):
-            print("📂 Existing FAISS index found, loading...")
-            index = load_faiss_index(FAISS_FILE, dimension=EMBED_DIM)
-            add_embeddings_to_index(index, embeddings, faiss_ids)
-        else:
-            print("🆕 No existing FAISS index found, creating a new one...")
-            index = create_faiss_index(embeddings, faiss_ids)
-            print(f"✅ New index created and saved at {FAISS_FILE}")
-
-        print("➕ Adding embeddings to the FAISS index...")
-        
-
-        # Save updated index back to disk
-        save_faiss_index(index, FAISS_FILE)
-        print(f"💾 FAISS index updated and saved at {FAISS_FILE}")
-
-        print(f"Total vectors in index now: {index.ntotal}")
-
-        # ----------------------------------------------------------
-        # 7. Finalize
-        # ----------------------------------------------------------
-        update_url_status(url, status="completed")
-        print(f"🎯 URL {url} processed successfully and stored in DB + FAISS.")
-
-        return {
-            "url": url,
-            "url_id": url_id,
-            "chunk_count": len(chunks),
-            "faiss_ids": faiss_ids,
-        }
+        document = prepare_document(url)
+        return commit_document(FAISS_DIR, EMBED_DIM, url, document)
 
     except Exception as e:
         print(f"❌ Error processing {url}: {str(e)}")
@@ -105,9 +227,10 @@ if __name__ == '__main__' :
 
     url = "https://medium.com/@explorer_shwetabh/deepfake-detection-part-2-understanding-lora-based-moe-adapter-architecture-813acbf9b345"
     
-    FAISS_FILE = "faiss_index.idx"
+    FAISS_DIR = "faiss_segments"
     EMBED_DIM = 384  # for sentence-transformers/all-MiniLM-L12-v2
 
-    worker_output = worker(FAISS_FILE, EMBED_DIM, url)
+    create_tables()
+    worker_output = worker(FAISS_DIR, EMBED_DIM, url)
     urls, chunks = load_db_as_pandas()
     breakpoint()
\ No newline at end of file
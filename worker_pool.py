@@ -0,0 +1,223 @@
+import json
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+import redis
+
+from job_queue import job_queue
+
+# Connect to Redis
+r = redis.StrictRedis(host='localhost', port=6379, db=0, decode_responses=True)
+
+FAISS_DIR = "faiss_segments"
+EMBED_DIM = 384  # for sentence-transformers/all-MiniLM-L12-v2
+STATS_KEY = "ingest:stats"
+
+
+def _ingest_process(worker_id, jobs, write_queue, torch_threads):
+    """
+    Pool worker: fetch, extract, chunk and embed, then hand the result to the writer.
+
+    Never touches SQLite or FAISS directly.
+    """
+    import torch
+    torch.set_num_threads(torch_threads)
+    # Same per-process thread share for the ONNX Runtime embedding backend
+    os.environ.setdefault("ONNX_INTRA_OP_THREADS", str(torch_threads))
+
+    from worker import prepare_document  # imported here so each process loads its own encoder
+
+    print(f"👷 Ingest worker {worker_id} started (pid {os.getpid()}, {torch_threads} threads)")
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+
+        url, job_id = job["url"], job.get("job_id")
+        print(f"🛠️ [worker {worker_id}] Processing URL: {url}")
+        try:
+            document = prepare_document(url)
+            write_queue.put(("commit", worker_id, url, job_id, document))
+        except Exception as e:
+            print(f"❌ [worker {worker_id}] Failed URL: {url}, Error: {e}")
+            write_queue.put(("failed", worker_id, url, job_id, str(e)))
+
+
+class WorkerPool:
+    """
+    Supervised pool of ingestion processes feeding a single serialized writer.
+
+    The dispatcher pops jobs from Redis and hands each to the worker with the
+    shortest queue. Workers do the CPU-heavy stages in parallel; every SQLite
+    and FAISS mutation is applied by one writer thread, in arrival order, so
+    no read-modify-write of the index or metadata can be lost. Dead workers
+    are restarted.
+    """
+
+    def __init__(self, num_workers=None, prefetch=2, writer_queue_size=64):
+        self.num_workers = num_workers or max(1, (os.cpu_count() or 2) - 1)
+        self.prefetch = prefetch
+        self.torch_threads = max(1, (os.cpu_count() or 1) // self.num_workers)
+
+        # Spawn, so children do not inherit the parent's SQLite connection or torch state
+        self._ctx = mp.get_context("spawn")
+        self.write_queue = self._ctx.Queue(maxsize=writer_queue_size)
+        self.job_queues = [self._ctx.Queue(maxsize=prefetch) for _ in range(self.num_workers)]
+        self.processes = [None] * self.num_workers
+
+        self.dispatched = [0] * self.num_workers
+        self.completed = [0] * self.num_workers
+        self.failed = [0] * self.num_workers
+        self.restarts = [0] * self.num_workers
+        self._stop = threading.Event()
+
+    # ------------------ Workers ------------------
+
+    def _start_worker(self, worker_id):
+        process = self._ctx.Process(
+            target=_ingest_process,
+            args=(worker_id, self.job_queues[worker_id], self.write_queue, self.torch_threads),
+            name=f"ingest-worker-{worker_id}",
+            daemon=True,
+        )
+        process.start()
+        self.processes[worker_id] = process
+
+    def _supervise(self):
+        for worker_id, process in enumerate(self.processes):
+            if process is not None and not process.is_alive():
+                print(f"⚠️ Ingest worker {worker_id} exited with code {process.exitcode}, restarting")
+                self.restarts[worker_id] += 1
+                self._start_worker(worker_id)
+
+    # ------------------ Writer ------------------
+
+    def _writer(self):
+        """Apply every DB and FAISS mutation, one at a time, in order."""
+        from worker import commit_document, job_result_fields
+        from data.data_utils import insert_urls, update_url_status
+        from faiss_segments import start_compactor
+
+        start_compactor(FAISS_DIR, dimension=EMBED_DIM)
+
+        while True:
+            op = self.write_queue.get()
+            if op is None:
+                break
+
+            kind, worker_id, url, job_id, payload = op
+            try:
+                if kind == "commit":
+                    result = commit_document(FAISS_DIR, EMBED_DIM, url, payload)
+                    if job_id:
+                        job_queue.complete(job_id, **job_result_fields(result))
+                    self.completed[worker_id] += 1
+                    print(f"✅ Completed URL: {url}")
+                else:
+                    insert_urls(url)
+                    update_url_status(url, status="failed", error_message=payload)
+                    if job_id:
+                        job_queue.fail(job_id, payload)
+                    self.failed[worker_id] += 1
+            except Exception as e:
+                self.failed[worker_id] += 1
+                print(f"❌ Failed to write URL: {url}, Error: {e}")
+                update_url_status(url, status="failed", error_message=str(e))
+                if job_id:
+                    job_queue.fail(job_id, e)
+
+    # ------------------ Stats ------------------
+
+    def stats(self):
+        """
+        Per-worker and writer queue depth, for capacity planning.
+
+        Returns:
+            Dict: Worker states and counters, plus writer queue depth.
+        """
+        return {
+            "updated_at": datetime.utcnow().isoformat(),
+            "writer_queue_depth": self.write_queue.qsize(),
+            "workers": [
+                {
+                    "worker_id": worker_id,
+                    "pid": process.pid if process is not None else None,
+                    "alive": process is not None and process.is_alive(),
+                    "queue_depth": self.job_queues[worker_id].qsize(),
+                    "dispatched": self.dispatched[worker_id],
+                    "completed": self.completed[worker_id],
+                    "failed": self.failed[worker_id],
+                    "restarts": self.restarts[worker_id],
+                }
+                for worker_id, process in enumerate(self.processes)
+            ],
+        }
+
+    def _publish_stats(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                r.set(STATS_KEY, json.dumps(self.stats()))
+            except redis.RedisError as e:
+                print(f"[ERROR] Failed to publish ingest stats: {e}")
+
+    # ------------------ Dispatch ------------------
+
+    def _dispatch(self, job):
+        """Hand a job to the worker with the fewest queued jobs (blocks if all are full)."""
+        while True:
+            depths = [q.qsize() for q in self.job_queues]
+            worker_id = depths.index(min(depths))
+            try:
+                self.job_queues[worker_id].put(job, timeout=1)
+                self.dispatched[worker_id] += 1
+                return
+            except queue.Full:
+                self._supervise()
+
+    def run(self, stats_interval=5.0):
+        """Start workers and the writer, then dispatch Redis jobs until interrupted."""
+        print(f"🚀 Worker pool started with {self.num_workers} workers, waiting for jobs...")
+        from data.data_utils import create_tables
+
+        # Schema must be current before workers read stored chunk hashes
+        create_tables()
+
+        for worker_id in range(self.num_workers):
+            self._start_worker(worker_id)
+
+        writer = threading.Thread(target=self._writer, name="ingest-writer", daemon=True)
+        writer.start()
+        threading.Thread(target=self._publish_stats, args=(stats_interval,), name="ingest-stats", daemon=True).start()
+        # Dispatched jobs wait in worker and writer queues; keep their leases alive until the writer acks them
+        job_queue.start_heartbeat()
+        next_requeue = time.monotonic()
+
+        try:
+            while True:
+                self._supervise()
+                if time.monotonic() >= next_requeue:
+                    job_queue.requeue_expired()
+                    next_requeue = time.monotonic() + stats_interval
+                job = job_queue.claim(timeout=1)
+                if job is None:
+                    continue
+                self._dispatch(job)
+        except KeyboardInterrupt:
+            print("🛑 Shutting down worker pool...")
+        finally:
+            self._stop.set()
+            for worker_queue in self.job_queues:
+                worker_queue.put(None)
+            for process in self.processes:
+                if process is not None:
+                    process.join(timeout=30)
+            self.write_queue.put(None)
+            writer.join()
+
+
+if __name__ == "__main__":
+    WorkerPool(num_workers=int(os.environ.get("INGEST_WORKERS", 0)) or None).run()